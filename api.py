@@ -1,9 +1,12 @@
 # api.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import asyncpg
-from config import DB_CONFIG
+from config import (DB_CONFIG, SEARCH_SERVER_SETTINGS, SEARCH_LIMIT, PAGE_LIMIT, MAX_PAGE_LIMIT,
+                    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, MEDICINE_CACHE_SIZE, MEDICINE_CACHE_TTL)
+from api_cache import ResultCache, PriceChangeListener
+from api_pagination import InvalidCursor, decode_cursor, encode_cursor
 from parsers.base_parser import light_normalize # <-- 1. Импортируем правильную функцию
 
 app = FastAPI(
@@ -29,17 +32,89 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # --- Управление подключением к БД ---
 db_pool = None
 
+# --- Кэш ответов: сбрасывается точечно по NOTIFY от парсеров, см. api_cache.py ---
+search_cache = ResultCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+medicine_cache = ResultCache(MEDICINE_CACHE_SIZE, MEDICINE_CACHE_TTL)
+price_listener = PriceChangeListener([search_cache, medicine_cache])
+
+# Every listing has a first-page and a next-page query. The next page continues
+# strictly after the sort key of the previous page's last row (keyset pagination),
+# so no OFFSET is scanned. Separate texts instead of `$n IS NULL OR ...` keep the
+# keyset condition usable as an index bound in generic prepared-statement plans.
+def keyset_queries(template: str, after: str) -> tuple[str, str]:
+    return template.format(after=""), template.format(after=after)
+
+# `%` uses idx_medicines_name_trgm; min_price and pharmacy_count are precomputed
+# in medicine_price_summary instead of aggregating pharmacy_prices per request.
+SEARCH_SQL, SEARCH_AFTER_SQL = keyset_queries("""
+SELECT m.id, m.name, m.image_url, s.min_price, s.pharmacy_count, similarity(m.name, $1) AS score
+FROM medicines m
+JOIN medicine_price_summary s ON s.medicine_id = m.id
+WHERE m.name % $1 {after}
+ORDER BY score DESC, m.id
+LIMIT $2;
+""", "AND (similarity(m.name, $1) < $3 OR (similarity(m.name, $1) = $3 AND m.id > $4))")
+
+# Both use idx_categories_parent_name
+ROOT_CATEGORIES_SQL, ROOT_CATEGORIES_AFTER_SQL = keyset_queries("""
+SELECT id, name FROM categories
+WHERE parent_id IS NULL {after}
+ORDER BY name, id
+LIMIT $1;
+""", "AND (name, id) > ($2, $3)")
+
+CHILD_CATEGORIES_SQL, CHILD_CATEGORIES_AFTER_SQL = keyset_queries("""
+SELECT id, name FROM categories
+WHERE parent_id = $1 {after}
+ORDER BY name, id
+LIMIT $2;
+""", "AND (name, id) > ($3, $4)")
+
+# medicines.name is unique, so it is a complete sort key (idx_medicines_category_name)
+CATEGORY_MEDICINES_SQL, CATEGORY_MEDICINES_AFTER_SQL = keyset_queries("""
+SELECT m.id, m.name, m.image_url, s.min_price, s.pharmacy_count
+FROM medicines m
+JOIN medicine_price_summary s ON s.medicine_id = m.id
+WHERE m.category_id = $1 {after}
+ORDER BY m.name
+LIMIT $2;
+""", "AND m.name > $3")
+
+
+def read_cursor(cursor: str, kind: str, *types) -> tuple:
+    try:
+        return decode_cursor(cursor, kind, *types)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный cursor: {e}")
+
+
+def make_page(rows: list, limit: int, cursor_of) -> dict:
+    """
+    Builds {"items", "next_cursor"} from limit + 1 fetched rows:
+    the extra row only tells whether there is a next page.
+    """
+    page_rows = rows[:limit]
+    next_cursor = cursor_of(page_rows[-1]) if len(rows) > limit else None
+    return {"items": [dict(r) for r in page_rows], "next_cursor": next_cursor}
+
+
 @app.on_event("startup")
 async def startup():
     global db_pool
     try:
-        db_pool = await asyncpg.create_pool(**DB_CONFIG)
+        # `%` matches above pg_trgm.similarity_threshold, set for every pooled connection at connect time
+        db_pool = await asyncpg.create_pool(**DB_CONFIG, server_settings=SEARCH_SERVER_SETTINGS)
         print("✅ API подключено к базе данных.")
+        # Базы, созданные старым init.sql, не знают о витрине цен для /search
+        if await db_pool.fetchval("SELECT to_regclass('medicine_price_summary')") is None:
+            print("⚠️ Нет представления medicine_price_summary: примените migrate.sql (psql -f migrate.sql).")
     except Exception as e:
         print(f"❌ API не удалось подключиться к базе данных: {e}")
+    price_listener.start()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await price_listener.close()
     if db_pool:
         await db_pool.close()
         print("🔌 API отключено от базы данных.")
@@ -48,73 +123,119 @@ async def shutdown():
 # --- Эндпоинты API ---
 
 @app.get("/search", tags=["Medicines"])
-async def search_medicines(q: str = ""):
+async def search_medicines(q: str = "", limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+                           cursor: str | None = None):
     """
     Умный поиск лекарств по названию.
     Сравнивает нормализованный поисковый запрос с полем `name` в базе.
+    Возвращает {"items", "next_cursor"}; следующая страница — тот же запрос с cursor=next_cursor.
     """
     if not q or len(q) < 3:
         return {"message": "Поисковый запрос должен содержать не менее 3 символов."}
     
     search_term = light_normalize(q) # <-- 2. Используем light_normalize
-    async with db_pool.acquire() as conn:
-        # <-- 3. Ищем по полю `name`, а не `normalized_name`
-        # Дополнительно считаем, в скольких аптеках есть товар (pharmacy_count)
-        query = """
-        SELECT 
-            m.id, 
-            m.name, 
-            m.image_url, 
-            MIN(p.price) as min_price,
-            COUNT(p.pharmacy_id) as pharmacy_count
-        FROM medicines m
-        JOIN pharmacy_prices p ON m.id = p.medicine_id
-        WHERE similarity(m.name, $1) > 0.2
-        GROUP BY m.id
-        ORDER BY similarity(m.name, $1) DESC
-        LIMIT 20;
-        """
-        results = await conn.fetch(query, search_term)
-        return [dict(r) for r in results]
+    after = None
+    if cursor:
+        cursor_term, *after = read_cursor(cursor, "search", str, float, int)
+        if cursor_term != search_term:
+            raise HTTPException(status_code=400, detail="Некорректный cursor: он выдан для другого запроса")
+
+    async def load():
+        async with db_pool.acquire() as conn:
+            # <-- 3. Ищем по полю `name`, а не `normalized_name`
+            # pharmacy_count (в скольких аптеках есть товар) берется из medicine_price_summary
+            if after:
+                results = await conn.fetch(SEARCH_AFTER_SQL, search_term, limit + 1, *after)
+            else:
+                results = await conn.fetch(SEARCH_SQL, search_term, limit + 1)
+        page = make_page(results, limit, lambda r: encode_cursor("search", search_term, r['score'], r['id']))
+        for item in page["items"]:
+            del item["score"]
+        return page, {item['id'] for item in page["items"]}
+
+    # Одинаковые запросы («нурофен», «Нурофен ») попадают в один ключ кэша
+    return await search_cache.get((search_term, limit, cursor), load)
 
 @app.get("/medicine/{medicine_id}", tags=["Medicines"])
 async def get_medicine_details(medicine_id: int):
     """
     Получает детальную информацию о лекарстве и список цен в разных аптеках.
     """
-    async with db_pool.acquire() as conn:
-        medicine = await conn.fetchrow("SELECT * FROM medicines WHERE id = $1", medicine_id)
-        if not medicine:
-            raise HTTPException(status_code=404, detail="Лекарство не найдено")
-        
-        prices = await conn.fetch("""
-            SELECT p.price, p.last_updated, ph.name AS pharmacy_name
-            FROM pharmacy_prices p
-            JOIN pharmacies ph ON p.pharmacy_id = ph.id
-            WHERE p.medicine_id = $1 ORDER BY p.price;
-        """, medicine_id)
-        
-        return {"details": dict(medicine), "prices": [dict(p) for p in prices]}
+    async def load():
+        async with db_pool.acquire() as conn:
+            medicine = await conn.fetchrow("SELECT * FROM medicines WHERE id = $1", medicine_id)
+            if not medicine:
+                raise HTTPException(status_code=404, detail="Лекарство не найдено")
+
+            prices = await conn.fetch("""
+                SELECT p.price, p.last_updated, ph.name AS pharmacy_name
+                FROM pharmacy_prices p
+                JOIN pharmacies ph ON p.pharmacy_id = ph.id
+                WHERE p.medicine_id = $1 AND p.stale_since IS NULL ORDER BY p.price;
+            """, medicine_id)
+
+            return {"details": dict(medicine), "prices": [dict(p) for p in prices]}, {medicine_id}
+
+    return await medicine_cache.get(medicine_id, load)
+
+@app.get("/metrics", tags=["Service"])
+async def get_metrics():
+    """
+    Статистика кэша: доля попаданий (hit_ratio), число объединенных
+    одинаковых запросов (coalesced) и точечных сбросов по NOTIFY (invalidations).
+    """
+    return {
+        "search_cache": search_cache.stats(),
+        "medicine_cache": medicine_cache.stats(),
+        "price_notifications": price_listener.notifications,
+    }
 
 # --- ОБНОВЛЕННЫЕ ЭНДПОИНТЫ ДЛЯ ИЕРАРХИИ КАТЕГОРИЙ ---
 
 @app.get("/categories", tags=["Categories"])
-async def get_root_categories():
+async def get_root_categories(limit: int = Query(PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT), cursor: str | None = None):
     """
-    Возвращает только категории верхнего уровня (у которых нет родителя).
+    Возвращает только категории верхнего уровня (у которых нет родителя),
+    постранично: {"items", "next_cursor"}.
     """
     async with db_pool.acquire() as conn:
         # <-- 4. Запрашиваем из новой таблицы `categories`
-        query = "SELECT id, name FROM categories WHERE parent_id IS NULL ORDER BY name;"
-        results = await conn.fetch(query)
-        return [dict(r) for r in results]
+        if cursor:
+            results = await conn.fetch(ROOT_CATEGORIES_AFTER_SQL, limit + 1, *read_cursor(cursor, "categories", str, int))
+        else:
+            results = await conn.fetch(ROOT_CATEGORIES_SQL, limit + 1)
+        return make_page(results, limit, lambda r: encode_cursor("categories", r['name'], r['id']))
 
 @app.get("/categories/{category_id}", tags=["Categories"])
-async def get_category_children(category_id: int):
+async def get_category_children(category_id: int, limit: int = Query(PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+                                cursor: str | None = None):
+    """
+    Возвращает дочерние категории для указанного ID родительской категории,
+    постранично: {"items", "next_cursor"}.
+    """
+    async with db_pool.acquire() as conn:
+        if cursor:
+            parent_id, name, child_id = read_cursor(cursor, "children", int, str, int)
+            if parent_id != category_id:
+                raise HTTPException(status_code=400, detail="Некорректный cursor: он выдан для другой категории")
+            results = await conn.fetch(CHILD_CATEGORIES_AFTER_SQL, category_id, limit + 1, name, child_id)
+        else:
+            results = await conn.fetch(CHILD_CATEGORIES_SQL, category_id, limit + 1)
+        return make_page(results, limit, lambda r: encode_cursor("children", category_id, r['name'], r['id']))
+
+@app.get("/categories/{category_id}/medicines", tags=["Categories"])
+async def get_category_medicines(category_id: int, limit: int = Query(PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+                                 cursor: str | None = None):
     """
-    Возвращает дочерние категории для указанного ID родительской категории.
+    Возвращает лекарства, лежащие непосредственно в категории (с минимальной ценой
+    и числом аптек), по алфавиту и постранично: {"items", "next_cursor"}.
     """
     async with db_pool.acquire() as conn:
-        query = "SELECT id, name FROM categories WHERE parent_id = $1 ORDER BY name;"
-        results = await conn.fetch(query, category_id)
-        return [dict(r) for r in results]
\ No newline at end of file
+        if cursor:
+            cursor_category_id, name = read_cursor(cursor, "medicines", int, str)
+            if cursor_category_id != category_id:
+                raise HTTPException(status_code=400, detail="Некорректный cursor: он выдан для другой категории")
+            results = await conn.fetch(CATEGORY_MEDICINES_AFTER_SQL, category_id, limit + 1, name)
+        else:
+            results = await conn.fetch(CATEGORY_MEDICINES_SQL, category_id, limit + 1)
+        return make_page(results, limit, lambda r: encode_cursor("medicines", category_id, r['name']))
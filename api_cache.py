@@ -0,0 +1,176 @@
+# api_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+import asyncpg
+from config import DB_CONFIG, PRICE_CHANGES_CHANNEL, LISTENER_RECONNECT_DELAY
+
+
+class ResultCache:
+    """
+    In-process LRU + TTL cache for API responses.
+
+    Concurrent misses on the same key are coalesced into one load (single-flight):
+    the first request runs the loader as its own task and the others await it,
+    so a client disconnecting does not cancel the load for everyone else.
+    Every entry remembers the medicine ids it was built from, so a price change
+    drops exactly the entries that show that medicine.
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires_at, value, medicine_ids)
+        self._by_medicine = {}          # medicine_id -> keys of the entries that show it
+        self._inflight = {}             # key -> load task
+        # Bumped on every invalidation: a load that overlaps one may hold old data and is not stored
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get(self, key, loader):
+        """
+        Returns the cached value for key, or the result of `await loader()`.
+        The loader returns (value, medicine_ids). Exceptions are passed to every
+        waiting caller and never cached.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._drop(key)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader, self._epoch))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, epoch: int):
+        try:
+            value, medicine_ids = await loader()
+        finally:
+            del self._inflight[key]
+        if epoch == self._epoch:
+            self._store(key, value, medicine_ids)
+        return value
+
+    def _store(self, key, value, medicine_ids):
+        self._entries[key] = (time.monotonic() + self.ttl, value, frozenset(medicine_ids))
+        for medicine_id in medicine_ids:
+            self._by_medicine.setdefault(medicine_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, _, medicine_ids = self._entries.pop(key)
+        for medicine_id in medicine_ids:
+            keys = self._by_medicine.get(medicine_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_medicine[medicine_id]
+
+    def invalidate(self, medicine_ids) -> int:
+        """Drops every entry built from one of the medicines. Returns how many were dropped."""
+        self._epoch += 1
+        keys = set()
+        for medicine_id in medicine_ids:
+            keys |= self._by_medicine.get(medicine_id, set())
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._by_medicine.clear()
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "requests": requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            # Share of requests answered without a DB call of their own
+            "saved_ratio": round((self.hits + self.coalesced) / requests, 4) if requests else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class PriceChangeListener:
+    """
+    Keeps a dedicated connection LISTENing on PRICE_CHANGES_CHANNEL and invalidates
+    the caches with the medicine ids published by the ingestion jobs
+    (see parsers.bulk_db.publish_price_changes). Notifications sent while the
+    connection is down are lost, so the caches are cleared on every (re)connect.
+    """
+    def __init__(self, caches: list[ResultCache], channel: str = PRICE_CHANGES_CHANNEL,
+                 reconnect_delay: float = LISTENER_RECONNECT_DELAY):
+        self.caches = caches
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.notifications = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await asyncpg.connect(**DB_CONFIG)
+            except Exception as e:
+                print(f"⚠️ Cache listener could not connect: {e}. Retrying in {self.reconnect_delay}s.")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _: lost.set())
+            try:
+                await conn.add_listener(self.channel, self._on_notify)
+                for cache in self.caches:
+                    cache.clear()
+                print(f"👂 Listening for price changes on '{self.channel}'.")
+                await lost.wait()
+                print("⚠️ Cache listener lost its connection, reconnecting.")
+            except Exception as e:
+                print(f"⚠️ Cache listener failed: {e}. Reconnecting.")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.notifications += 1
+        try:
+            medicine_ids = {int(part) for part in payload.split(',') if part}
+        except ValueError:
+            # Unknown payload: drop everything rather than serve stale prices
+            for cache in self.caches:
+                cache.clear()
+            return
+        for cache in self.caches:
+            cache.invalidate(medicine_ids)
@@ -0,0 +1,38 @@
+# api_pagination.py
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not issued by this API for this listing."""
+
+
+def encode_cursor(kind: str, *key) -> str:
+    """
+    Packs the sort key of the last row of a page into an opaque token.
+    The next page starts strictly after that key (keyset pagination), so it
+    costs the same however deep it is, and rows inserted or deleted meanwhile
+    never shift the remaining rows between pages.
+    """
+    raw = json.dumps([kind, *key], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str, kind: str, *types) -> tuple:
+    """
+    Unpacks a cursor of the given kind and checks that its key has the expected types.
+    Raises InvalidCursor for anything else (tampered, truncated, another listing's cursor).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not isinstance(values, list) or len(values) != len(types) + 1 or values[0] != kind:
+        raise InvalidCursor("Cursor does not belong to this listing")
+    key = values[1:]
+    for value, expected in zip(key, types):
+        # JSON has a single number type: ints are valid floats, bools are not numbers here
+        if isinstance(value, bool) or not isinstance(value, (int, float) if expected is float else expected):
+            raise InvalidCursor("Malformed cursor")
+    return tuple(float(value) if expected is float else value for value, expected in zip(key, types))
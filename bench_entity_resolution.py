@@ -0,0 +1,187 @@
+# bench_entity_resolution.py
+"""
+Benchmark of product-title matching on the gosapteka and Planeta catalogs.
+
+Each catalog is indexed by its names as 'medicines' stores them (Planeta
+titles light_normalize'd, gosapteka names as read from the DB), then queried
+with rewritten raw titles (abbreviated forms, Latin units, "N" instead of "№",
+decimal commas) that must resolve to the original row, and with "hard negatives" - the same
+title with another pack size or strength - that must NOT resolve to it. Titles that drop
+the pack size of a product sold in several packs are ambiguous and must resolve to none of them.
+Reports precision, recall, false merges and lookups per second for the
+structured EntityResolver and for the old light_normalize + trigram matching.
+
+Usage: python bench_entity_resolution.py [--limit N] [--planeta-json PATH]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import time
+import asyncpg
+from config import DB_CONFIG
+from parsers.base_parser import light_normalize
+from parsers.json_stream import iter_records
+from parsers.entity_resolution import EntityResolver, extract_key
+from parsers.trigram_index import TrigramIndex
+from parsers.gosapteka.details_processor import GOSAPTEKA_URL
+
+PLANETA_JSON = "parsers/planeta_zdorovya/all_products_async.json"
+REWRITES = [
+    (r'таблетки', 'таб.'), (r'капсулы', 'капс.'), (r'раствор', 'р-р'), (r'мг\b', 'mg'),
+    (r'мл\b', 'ml'), (r'№\s?', 'N'), (r'(\d)\.(\d)', r'\1,\2'), (r'\s+', '  '),
+]
+
+
+class LightTrigramMatcher:
+    """The previous approach: light_normalize, exact name, then the nearest trigram neighbour."""
+    def __init__(self, rows):
+        self.index = TrigramIndex.from_rows((medicine_id, light_normalize(name)) for medicine_id, name in rows)
+
+    def resolve(self, title: str) -> int | None:
+        medicine_id, _, score = self.index.match(light_normalize(title))
+        return medicine_id if score >= self.index.threshold else None
+
+
+def make_positive(title: str, rng: random.Random) -> str:
+    variant = title
+    for pattern, replacement in rng.sample(REWRITES, k=3):
+        variant = re.sub(pattern, replacement, variant, flags=re.IGNORECASE)
+    return variant.upper() if rng.random() < 0.3 else variant
+
+
+def make_negative(title: str) -> str | None:
+    """Another pack size or strength of the same product, or None if the title has neither."""
+    variant = re.sub(r'(№|\bN)\s?(\d+)', lambda m: f"{m.group(1)}{int(m.group(2)) * 2 + 10}", title)
+    if variant == title:
+        variant = re.sub(r'(\d+)(\s?(?:мг|mg))', lambda m: f"{int(m.group(1)) * 2}{m.group(2)}", title, count=1)
+    return variant if variant != title else None
+
+
+def make_ambiguous(rows: list[tuple[int, str]]) -> list[tuple[str, set[int]]]:
+    """
+    The title without its pack size, for products listed in several packs
+    ("Нурофен таблетки 200мг" for №10 and №20), with the ids it must not resolve to.
+    """
+    packs = {}
+    for medicine_id, title in rows:
+        key = extract_key(title)
+        if key.pack is not None:
+            packs.setdefault(key._replace(pack=None), {}).setdefault(key.pack, (medicine_id, title))
+    ambiguous = []
+    for key, by_pack in packs.items():
+        if len(by_pack) < 2:
+            continue
+        _, title = next(iter(by_pack.values()))
+        variant = ' '.join(re.sub(r'(№|\bN)\s?\d+', ' ', title).split())
+        if extract_key(variant) == key:
+            ambiguous.append((variant, {medicine_id for medicine_id, _ in by_pack.values()}))
+    return ambiguous
+
+
+def run_queries(resolve, queries) -> tuple[list, float]:
+    started = time.perf_counter()
+    results = [resolve(query) for query in queries]
+    return results, time.perf_counter() - started
+
+
+def bench_catalog(name: str, rows: list[tuple[int, str]], store=lambda title: title, seed: int = 42):
+    """
+    rows are (id, raw title). The matchers index `store(title)`, the name as it
+    sits in 'medicines', and are queried with rewrites of the raw titles.
+    """
+    rng = random.Random(seed)
+    print(f"\n=== {name}: {len(rows)} products ===")
+    stored = [(medicine_id, store(title)) for medicine_id, title in rows]
+
+    started = time.perf_counter()
+    resolver = EntityResolver.from_rows(stored)
+    build_resolver = time.perf_counter() - started
+    started = time.perf_counter()
+    baseline = LightTrigramMatcher(stored)
+    build_baseline = time.perf_counter() - started
+
+    # Titles sharing a key are one entity for the resolver; the first id is the expected one
+    expected = {}
+    for medicine_id, title in rows:
+        expected.setdefault(extract_key(title), medicine_id)
+    positives = [(make_positive(title, rng), expected[extract_key(title)]) for _, title in rows]
+    negatives = []
+    for medicine_id, title in rows:
+        variant = make_negative(title)
+        if variant and extract_key(variant) not in expected:
+            negatives.append((variant, {medicine_id}))
+    negatives += [(variant, ids) for variant, ids in make_ambiguous(rows) if extract_key(variant) not in expected]
+
+    methods = {
+        'entity resolver': (lambda title: resolver.resolve(title).medicine_id, build_resolver),
+        'light_normalize + trigram': (baseline.resolve, build_baseline),
+    }
+    for label, (resolve, build_time) in methods.items():
+        pos_results, pos_time = run_queries(resolve, [query for query, _ in positives])
+        neg_results, neg_time = run_queries(resolve, [query for query, _ in negatives])
+        correct = sum(got == want for got, (_, want) in zip(pos_results, positives))
+        wrong = sum(got is not None and got != want for got, (_, want) in zip(pos_results, positives))
+        false_merges = sum(got in originals for got, (_, originals) in zip(neg_results, negatives))
+        resolved = correct + wrong + false_merges
+        lookups = len(positives) + len(negatives)
+        print(f"{label:>27}: precision {correct / resolved if resolved else 0:.3f} | "
+              f"recall {correct / len(positives) if positives else 0:.3f} | "
+              f"false merges {false_merges}/{len(negatives)} | "
+              f"{lookups / (pos_time + neg_time):,.0f} lookups/s | build {build_time:.2f}s")
+    return resolver
+
+
+def load_planeta_rows(path: str) -> list[tuple[int, str]]:
+    if not os.path.exists(path):
+        return []
+    return [(i, product['title']) for i, product in enumerate(iter_records(path)) if product.get('title')]
+
+
+async def load_gosapteka_rows() -> list[tuple[int, str]]:
+    try:
+        conn = await asyncpg.connect(**DB_CONFIG)
+    except Exception as e:
+        print(f"⚠️ Could not connect to the database, skipping the gosapteka catalog: {e}")
+        return []
+    try:
+        rows = await conn.fetch("""
+            SELECT m.id, m.name FROM medicines m
+            JOIN pharmacy_prices p ON p.medicine_id = m.id
+            JOIN pharmacies ph ON ph.id = p.pharmacy_id
+            WHERE ph.address = $1
+        """, GOSAPTEKA_URL)
+    finally:
+        await conn.close()
+    return [(row['id'], row['name']) for row in rows]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limit', type=int, default=None, help="use at most N products per catalog")
+    parser.add_argument('--planeta-json', default=PLANETA_JSON)
+    args = parser.parse_args()
+
+    gosapteka = (await load_gosapteka_rows())[:args.limit]
+    planeta = load_planeta_rows(args.planeta_json)[:args.limit]
+    resolver = bench_catalog('gosapteka', gosapteka) if gosapteka else None
+    if planeta:
+        # Planeta's loader stores light_normalize(title) as medicines.name
+        bench_catalog('planeta', planeta, store=light_normalize)
+    else:
+        print(f"⚠️ '{args.planeta_json}' not found, skipping the Planeta catalog.")
+
+    # Cross-pharmacy: how Planeta titles land on the gosapteka catalog (no labels, so no precision)
+    if resolver and planeta:
+        counts = {'key': 0, 'fuzzy': 0, None: 0}
+        started = time.perf_counter()
+        for _, title in planeta:
+            counts[resolver.resolve(title).method] += 1
+        elapsed = time.perf_counter() - started
+        print(f"\n=== planeta -> gosapteka ===\nkey hits {counts['key']} | fuzzy hits {counts['fuzzy']} | "
+              f"misses {counts[None]} | {len(planeta) / elapsed:,.0f} lookups/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
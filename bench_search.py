@@ -0,0 +1,173 @@
+# bench_search.py
+"""
+Latency benchmark of /search before and after the index-friendly rewrite.
+
+Builds a synthetic catalog (100k medicines, 3 pharmacies, ~2 prices each) in a
+scratch schema, then runs the same query mix through the old query
+(similarity() > 0.2 filter + GROUP BY over pharmacy_prices) and the new one
+(`%` on the trigram index + medicine_price_summary) and prints p50/p99.
+The scratch schema is dropped afterwards unless --keep is given.
+
+Usage: python bench_search.py [--medicines 100000] [--queries 300] [--keep]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import asyncpg
+from config import DB_CONFIG, SEARCH_SIMILARITY_THRESHOLD, SEARCH_SERVER_SETTINGS, SEARCH_LIMIT
+from parsers.base_parser import light_normalize
+
+SCHEMA = 'bench_search'
+BASES = ['нурофен', 'парацетамол', 'ибупрофен', 'аспирин', 'цитрамон', 'но шпа', 'називин', 'лоратадин',
+         'омепразол', 'амоксиклав', 'арбидол', 'ингавирин', 'мезим', 'фестал', 'смекта', 'энтерол',
+         'терафлю', 'колдрекс', 'аквадетрим', 'компливит', 'витрум', 'супрастин', 'зиртек', 'кагоцел']
+SYLLABLES = ['ва', 'ро', 'ли', 'кса', 'тин', 'мед', 'про', 'фен', 'зол', 'ам', 'ин', 'ол', 'ар', 'ти', 'ка', 'нит']
+FORMS = ['таблетки', 'капсулы', 'сироп', 'раствор', 'капли', 'мазь', 'гель', 'спрей', 'порошок']
+
+OLD_SQL = f"""
+SELECT m.id, m.name, m.image_url, MIN(p.price) AS min_price, COUNT(p.pharmacy_id) AS pharmacy_count
+FROM medicines m
+JOIN pharmacy_prices p ON m.id = p.medicine_id AND p.stale_since IS NULL
+WHERE similarity(m.name, $1) > {SEARCH_SIMILARITY_THRESHOLD}
+GROUP BY m.id
+ORDER BY similarity(m.name, $1) DESC
+LIMIT {SEARCH_LIMIT};
+"""
+
+# api.SEARCH_SQL without the pagination column (first page)
+NEW_SQL = f"""
+SELECT m.id, m.name, m.image_url, s.min_price, s.pharmacy_count
+FROM medicines m
+JOIN medicine_price_summary s ON s.medicine_id = m.id
+WHERE m.name % $1
+ORDER BY similarity(m.name, $1) DESC, m.id
+LIMIT {SEARCH_LIMIT};
+"""
+
+SCHEMA_SQL = f"""
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+SET search_path = {SCHEMA}, public;
+CREATE TABLE medicines (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    description TEXT,
+    image_url VARCHAR(255),
+    category_id INTEGER
+);
+CREATE TABLE pharmacy_prices (
+    pharmacy_id INTEGER NOT NULL,
+    medicine_id INTEGER NOT NULL REFERENCES medicines(id) ON DELETE CASCADE,
+    price NUMERIC(10, 2) NOT NULL,
+    last_updated TIMESTAMPTZ DEFAULT NOW(),
+    stale_since TIMESTAMPTZ,
+    PRIMARY KEY (pharmacy_id, medicine_id)
+);
+"""
+
+INDEX_SQL = """
+CREATE INDEX idx_medicines_name_trgm ON medicines USING gin (name gin_trgm_ops);
+CREATE MATERIALIZED VIEW medicine_price_summary AS
+SELECT medicine_id, MIN(price) AS min_price, COUNT(pharmacy_id) AS pharmacy_count
+FROM pharmacy_prices
+WHERE stale_since IS NULL
+GROUP BY medicine_id;
+CREATE UNIQUE INDEX idx_medicine_price_summary_id ON medicine_price_summary (medicine_id);
+ANALYZE medicines;
+ANALYZE pharmacy_prices;
+"""
+
+
+def synthetic_names(count: int, rng: random.Random) -> list[str]:
+    names = set()
+    while len(names) < count:
+        base = rng.choice(BASES) if rng.random() < 0.3 else ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        name = f"{base} {rng.choice(FORMS)} {rng.choice([5, 10, 25, 50, 100, 200, 250, 400, 500])}мг {rng.choice([10, 12, 20, 24, 28, 30, 50])}шт"
+        names.add(light_normalize(name))
+    return list(names)
+
+
+def synthetic_queries(names: list[str], count: int, rng: random.Random) -> list[str]:
+    """A mix of popular brand names, misspellings and fragments of real names."""
+    queries = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.5:
+            queries.append(rng.choice(BASES))
+        elif roll < 0.7:
+            word = rng.choice(BASES)
+            position = rng.randrange(len(word))
+            queries.append(word[:position] + word[position + 1:])
+        else:
+            queries.append(' '.join(rng.choice(names).split()[:2]))
+    return [light_normalize(query) for query in queries]
+
+
+async def time_queries(pool: asyncpg.Pool, sql: str, queries: list[str]) -> tuple[list[float], list[set]]:
+    """
+    Runs every query through the pool, one acquire per query like the API does,
+    so settings lost when a connection goes back to the pool show up here too.
+    """
+    async with pool.acquire() as conn:
+        await conn.fetch(sql, queries[0])  # warm-up
+    timings, results = [], []
+    for query in queries:
+        async with pool.acquire() as conn:
+            started = time.perf_counter()
+            rows = await conn.fetch(sql, query)
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append({row['id'] for row in rows})
+    return timings, results
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--medicines', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--keep', action='store_true', help="keep the scratch schema")
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    conn = await asyncpg.connect(**DB_CONFIG)
+    try:
+        print(f"🧪 Building {args.medicines} synthetic medicines in schema '{SCHEMA}'...")
+        await conn.execute(SCHEMA_SQL)
+        names = synthetic_names(args.medicines, rng)
+        await conn.copy_records_to_table('medicines', records=[(name,) for name in names], columns=['name'], schema_name=SCHEMA)
+        ids = [row['id'] for row in await conn.fetch("SELECT id FROM medicines")]
+        prices = [(pharmacy_id, medicine_id, round(rng.uniform(50, 3000), 2))
+                  for medicine_id in ids for pharmacy_id in (1, 2, 3) if rng.random() < 0.7]
+        await conn.copy_records_to_table('pharmacy_prices', records=prices,
+                                         columns=['pharmacy_id', 'medicine_id', 'price'], schema_name=SCHEMA)
+        await conn.execute(INDEX_SQL)
+
+        queries = synthetic_queries(names, args.queries, rng)
+        print(f"⏱️ Running {len(queries)} queries against {len(ids)} medicines / {len(prices)} prices...")
+        # Same connection settings as the API pool, plus the scratch schema
+        server_settings = {**SEARCH_SERVER_SETTINGS, 'search_path': f'{SCHEMA}, public'}
+        async with asyncpg.create_pool(**DB_CONFIG, min_size=1, max_size=2, server_settings=server_settings) as pool:
+            results = {}
+            for label, sql in (('before (similarity > t, GROUP BY)', OLD_SQL), ('after (% + summary view)', NEW_SQL)):
+                timings, results[label] = await time_queries(pool, sql, queries)
+                print(f"{label:>36}: p50 {percentile(timings, 50):7.2f} ms | p99 {percentile(timings, 99):7.2f} ms | "
+                      f"mean {statistics.mean(timings):7.2f} ms")
+        before, after = results.values()
+        # Ties at the LIMIT boundary may be cut differently, so compare the result sizes
+        differing = sum(len(old) != len(new) for old, new in zip(before, after))
+        print(f"🔎 Queries whose result size differs between the two: {differing} of {len(queries)}")
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -17,8 +17,91 @@ CONCURRENCY_LIMIT = 5
 DELAY_BETWEEN_PAGES = (1.0, 2.5)
 DELAY_BETWEEN_CATEGORIES = (2.0, 4.0)
 
+# --- Адаптивное ограничение скорости (AIMD) ---
+# Если False, используются фиксированные задержки выше
+ADAPTIVE_RATE_LIMIT = True
+# Жесткие лимиты одновременных запросов по хостам аптек
+RATE_LIMITS = {
+    'gosapteka18.ru': {'min': 1, 'max': 16, 'initial': CONCURRENCY_LIMIT, 'target_latency': 2.0},
+    'planetazdorovo.ru': {'min': 1, 'max': 6, 'initial': 3, 'target_latency': 3.0},
+}
+DEFAULT_RATE_LIMIT = {'min': 1, 'max': 8, 'initial': CONCURRENCY_LIMIT, 'target_latency': 2.0}
+
+# --- Повторные попытки загрузки ---
+FETCH_MAX_RETRIES = 3        # Повторов на один URL для временных ошибок
+FETCH_BACKOFF_BASE = 1.0     # База экспоненциальной задержки (сек)
+FETCH_BACKOFF_MAX = 60.0     # Потолок задержки, в т.ч. для Retry-After (сек)
+RETRY_BUDGET_RATIO = 0.2     # Не более 20% повторов от числа запросов к хосту...
+RETRY_BUDGET_MIN = 10        # ...плюс небольшой запас
+
+# --- Журнал ошибок (JSON Lines) ---
+ERROR_LOG_BATCH_SIZE = 500      # Максимум записей за одну дозапись файла
+ERROR_LOG_FLUSH_INTERVAL = 1.0  # Пауза (сек) между дозаписями для накопления пакета
+
+# --- Пакетная запись товаров в БД (Stage 2) ---
+DB_BATCH_SIZE = 200        # Сколько товаров записывать одной транзакцией
+DB_FLUSH_INTERVAL = 2.0    # Максимальное время (сек) ожидания неполного пакета
+DB_QUEUE_MAXSIZE = 1000    # Размер очереди; при заполнении воркеры ждут (backpressure)
+
+# --- Разбор HTML ---
+HTML_PARSER = 'lxml'       # Бэкенд BeautifulSoup; без lxml используется 'html.parser'
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Процессы для разбора; 0 = в event loop
+
+# --- Потоковый конвейер Stage 2 ---
+PIPELINE_QUEUE_SIZE = 100       # Ёмкость очереди перед каждой стадией
+PIPELINE_REPORT_INTERVAL = 10.0 # Как часто (сек) печатать глубину очередей
+
+# --- Архив сырого HTML (для повторного разбора без сети) ---
+HTML_ARCHIVE_ENABLED = True
+HTML_ARCHIVE_DIR = 'html_archive'
+HTML_ARCHIVE_MAX_AGE_DAYS = 30
+HTML_ARCHIVE_MAX_BYTES = 5 * 1024 ** 3  # 5 ГБ
+
 # --- Директория для сохранения JSON-файлов с URL-адресами ---
 URLS_DIR = 'parsed_urls' # <--- ДОБАВЬТЕ ЭТУ СТРОКУ
+# Дифф added/removed/unchanged между прогонами Stage 1
+URL_DIFFS_DIR = os.path.join(URLS_DIR, 'diffs')
+# Компактный индекс URL товаров (каждый товар один раз + все его категории)
+URL_INDEX_DB = 'url_index.sqlite'
+
+# --- Инкрементальный Stage 2: новые URL + часть неизменившихся ---
+UNCHANGED_SAMPLE_RATE = 0.05   # Доля неизменившихся URL, перепроверяемых случайно
+UNCHANGED_MAX_AGE_DAYS = 7     # Неизменившиеся URL старше этого срока проверяются всегда
+
+# --- Поиск изменившихся товаров по sitemap.xml ---
+SITEMAP_CHANGES_FILE = 'sitemap_changes.json'   # Куда писать изменившиеся URL
+SITEMAP_STATE_FILE = 'sitemap_state.json'       # Время прошлого прохода (для lastmod)
+
+# --- Прогресс Stage 2 (для продолжения после сбоя) ---
+PROGRESS_DB = 'stage2_progress.sqlite'
+PROGRESS_BATCH_SIZE = 500  # Сколько смен состояний URL записывать за раз
+
+# --- Сопоставление товаров с каталогом по триграммам (как pg_trgm) ---
+TRIGRAM_MATCH_THRESHOLD = 0.45   # Ниже этого сходства товар уходит на ручную проверку
+
+# --- Потоковая загрузка дампов Планеты Здоровья ---
+INGEST_CHUNK_SIZE = 5000         # Записей дампа за один COPY
+PLANETA_DUMP_FILE = 'parsers/planeta_zdorovya/all_products_async.jsonl'  # Результат HTTP-скрейпера
+PLANETA_PRICES_FILE = 'planeta_zdorovya_prices.jsonl'
+PLANETA_REVIEW_FILE = 'planeta_zdorovya_review.jsonl'
+DUMP_GZIP = False                # True: выходные файлы сжимаются (.jsonl.gz)
+
+# --- API ---
+SEARCH_SIMILARITY_THRESHOLD = 0.2   # pg_trgm.similarity_threshold для оператора % в /search
+# Передается при подключении (server_settings): SET сбрасывается пулом asyncpg (RESET ALL)
+SEARCH_SERVER_SETTINGS = {'pg_trgm.similarity_threshold': str(SEARCH_SIMILARITY_THRESHOLD)}
+SEARCH_LIMIT = 20                   # limit по умолчанию для /search
+PAGE_LIMIT = 50                     # limit по умолчанию для списков категорий и товаров
+MAX_PAGE_LIMIT = 100                # Больше за одну страницу не отдаем (дальше по cursor)
+
+# --- Кэш API (LRU + TTL) и инвалидация через LISTEN/NOTIFY ---
+SEARCH_CACHE_SIZE = 10000           # Сколько разных запросов /search держать в памяти
+SEARCH_CACHE_TTL = 300              # Секунд; страхует то, что не ловит NOTIFY (новые товары в выдаче)
+MEDICINE_CACHE_SIZE = 20000         # Сколько карточек /medicine/{id} держать в памяти
+MEDICINE_CACHE_TTL = 600
+PRICE_CHANGES_CHANNEL = 'price_changes'   # Канал NOTIFY с id лекарств, у которых изменились цены
+PRICE_NOTIFY_BATCH = 500            # id в одном NOTIFY (payload ограничен 8000 байт)
+LISTENER_RECONNECT_DELAY = 5        # Пауза перед переподключением слушателя, сек
 
 # --- Настройки для сохранения изображений (если понадобится в будущем) ---
 IMAGES_DIR = 'static/images/products'
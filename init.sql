@@ -1,3 +1,5 @@
+-- Schema of a fresh database. Existing databases are upgraded with migrate.sql.
+
 -- Enable the trigram extension for similarity searches
 CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
@@ -9,6 +11,13 @@ CREATE TABLE categories (
     UNIQUE (name, parent_id) -- A category name must be unique within its parent
 );
 
+-- NULLs are distinct in UNIQUE, so root categories need their own unique index
+-- (lets concurrent parsers insert the same root with ON CONFLICT DO NOTHING)
+CREATE UNIQUE INDEX idx_categories_root_name ON categories (name) WHERE parent_id IS NULL;
+
+-- Keyset pagination of /categories and /categories/{id}: WHERE parent_id = ... AND (name, id) > ... ORDER BY name, id
+CREATE INDEX idx_categories_parent_name ON categories (parent_id, name, id);
+
 -- Main table for the master product catalog
 CREATE TABLE medicines (
     id SERIAL PRIMARY KEY,
@@ -21,6 +30,9 @@ CREATE TABLE medicines (
 -- Create a GIN index on the 'name' column for fast similarity searches
 CREATE INDEX idx_medicines_name_trgm ON medicines USING gin (name gin_trgm_ops);
 
+-- Keyset pagination of /categories/{id}/medicines
+CREATE INDEX idx_medicines_category_name ON medicines (category_id, name);
+
 -- Table for pharmacy information
 CREATE TABLE pharmacies (
     id SERIAL PRIMARY KEY,
@@ -34,5 +46,26 @@ CREATE TABLE pharmacy_prices (
     medicine_id INTEGER NOT NULL REFERENCES medicines(id) ON DELETE CASCADE,
     price NUMERIC(10, 2) NOT NULL,
     last_updated TIMESTAMPTZ DEFAULT NOW(),
+    stale_since TIMESTAMPTZ, -- Set when the product disappeared from the pharmacy's catalog
     PRIMARY KEY (pharmacy_id, medicine_id)
-);
\ No newline at end of file
+);
+
+-- Per-medicine price aggregates for /search, refreshed by the ingestion jobs
+-- (REFRESH MATERIALIZED VIEW CONCURRENTLY needs the unique index)
+CREATE MATERIALIZED VIEW medicine_price_summary AS
+SELECT medicine_id, MIN(price) AS min_price, COUNT(pharmacy_id) AS pharmacy_count
+FROM pharmacy_prices
+WHERE stale_since IS NULL
+GROUP BY medicine_id;
+
+CREATE UNIQUE INDEX idx_medicine_price_summary_id ON medicine_price_summary (medicine_id);
+
+-- Per-URL crawl metadata: validators for conditional GET and a hash of the extracted fields
+CREATE TABLE crawl_metadata (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    medicine_id INTEGER REFERENCES medicines(id) ON DELETE SET NULL,
+    last_crawled TIMESTAMPTZ DEFAULT NOW()
+);
@@ -0,0 +1,41 @@
+-- Brings a database created from an older init.sql up to the current schema.
+-- Every statement is idempotent, so the file can be applied to any version
+-- (and re-applied) with: psql -v ON_ERROR_STOP=1 -f migrate.sql
+-- Fresh databases only need init.sql.
+
+BEGIN;
+
+-- Root categories: one row per name (the category cache inserts them with ON CONFLICT DO NOTHING).
+-- Fails if duplicate roots were already created concurrently; merge those rows first.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_root_name ON categories (name) WHERE parent_id IS NULL;
+
+-- Keyset pagination of /categories, /categories/{id} and /categories/{id}/medicines
+CREATE INDEX IF NOT EXISTS idx_categories_parent_name ON categories (parent_id, name, id);
+CREATE INDEX IF NOT EXISTS idx_medicines_category_name ON medicines (category_id, name);
+
+-- Set when the product disappeared from the pharmacy's catalog
+ALTER TABLE pharmacy_prices ADD COLUMN IF NOT EXISTS stale_since TIMESTAMPTZ;
+
+-- Per-URL crawl metadata: validators for conditional GET and a hash of the extracted fields
+CREATE TABLE IF NOT EXISTS crawl_metadata (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    medicine_id INTEGER REFERENCES medicines(id) ON DELETE SET NULL,
+    last_crawled TIMESTAMPTZ DEFAULT NOW()
+);
+-- Tables created before the stale marking have no medicine link yet
+ALTER TABLE crawl_metadata ADD COLUMN IF NOT EXISTS medicine_id INTEGER REFERENCES medicines(id) ON DELETE SET NULL;
+
+-- Per-medicine price aggregates for /search, refreshed by the ingestion jobs
+-- (REFRESH MATERIALIZED VIEW CONCURRENTLY needs the unique index)
+CREATE MATERIALIZED VIEW IF NOT EXISTS medicine_price_summary AS
+SELECT medicine_id, MIN(price) AS min_price, COUNT(pharmacy_id) AS pharmacy_count
+FROM pharmacy_prices
+WHERE stale_since IS NULL
+GROUP BY medicine_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_medicine_price_summary_id ON medicine_price_summary (medicine_id);
+
+COMMIT;
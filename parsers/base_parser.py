@@ -41,12 +41,16 @@
 import asyncio
 import re
 from abc import ABC
+from contextlib import asynccontextmanager, nullcontext
 import asyncpg
 import httpx
-from datetime import datetime
 import random
-import json
-import aiofiles # For async file operations
+from .parse_stage import ParseStage
+from .error_log import ErrorLog
+from .crawl_metadata import NOT_MODIFIED
+from .rate_control import Slot, parse_retry_after
+from .fetch_errors import FetchError, RetryBudget, TRANSIENT, PERMANENT, backoff_delay, classify_status
+from config import FETCH_MAX_RETRIES
 
 # light_normalize function remains the same...
 def light_normalize(name: str) -> str:
@@ -62,40 +66,128 @@ class BaseParser(ABC):
         self.base_url = 'https://gosapteka18.ru'
         self.session = session
         self.db_pool = db_pool
-        # Lock to prevent race conditions when writing to the log file
-        self.log_lock = asyncio.Lock()
+        # Failed URLs are appended to the daily log by a background writer
+        self.error_log = ErrorLog()
+        # CPU-bound HTML parsing runs here instead of on the event loop
+        self.parse_stage = ParseStage()
+        # Optional CrawlMetadata; when set, fetch_html sends conditional requests
+        self.crawl_meta = None
+        # Optional HtmlArchive; every downloaded page is stored there.
+        # With offline=True pages are read from the archive instead of the network.
+        self.archive = None
+        self.offline = False
+        # Optional RateController (AIMD per host); without it fixed random delays are used
+        self.rate_controller = None
+        self.retry_budget = RetryBudget()
 
     async def fetch_html(self, url: str, timeout: int = 20) -> str | None:
+        """
+        Downloads a page, returning None on failure.
+        Returns NOT_MODIFIED when crawl metadata is attached
+        and the server answers a conditional request with 304.
+        """
         try:
-            # Increased delay slightly for more stability
-            await asyncio.sleep(random.uniform(0.5, 1.5))
-            response = await self.session.get(url, timeout=timeout)
-            response.raise_for_status()
-            return response.text
-        except httpx.RequestError as e:
+            return await self.fetch_page(url, timeout)
+        except FetchError as e:
             # The print statement remains for real-time feedback
-            print(f"🚫 Download error {url}: {str(e)}")
-            return None
-        except httpx.HTTPStatusError as e:
-            print(f"🚫 Status error {e.response.status_code} for {url}: {str(e)}")
+            print(f"🚫 {e.kind.capitalize()} error for {url}: {e}")
             return None
 
-    async def log_error(self, url: str, breadcrumbs: list[str], error: str):
-        """Asynchronously logs a failed URL and its context to a JSON file."""
-        log_filename = f"log_error_{datetime.now().strftime('%Y-%m-%d')}.json"
-        new_entry = {"url": url, "breadcrumbs": breadcrumbs, "error": error}
+    async def fetch_page(self, url: str, timeout: int = 20) -> str:
+        """
+        Downloads a page, retrying transient failures in-line with jittered
+        exponential backoff (honouring Retry-After) within the per-host retry budget.
+        Raises FetchError when the page could not be fetched.
+        """
+        if self.offline:
+            html = await self.archive.load_latest(url)
+            if html is None:
+                raise FetchError(PERMANENT, "Not in HTML archive")
+            return html
 
-        async with self.log_lock: # Ensure only one task writes to the file at a time
+        attempt = 0
+        while True:
             try:
-                # Try to read existing data
-                async with aiofiles.open(log_filename, mode='r', encoding='utf-8') as f:
-                    content = await f.read()
-                    data = json.loads(content)
-            except (FileNotFoundError, json.JSONDecodeError):
-                # If file doesn't exist or is empty/corrupt, start with an empty list
-                data = []
-
-            # Append new error and write back
-            data.append(new_entry)
-            async with aiofiles.open(log_filename, mode='w', encoding='utf-8') as f:
-                await f.write(json.dumps(data, ensure_ascii=False, indent=2))
\ No newline at end of file
+                return await self._fetch_once(url, timeout)
+            except FetchError as e:
+                if e.kind != TRANSIENT or attempt >= FETCH_MAX_RETRIES or not self.retry_budget.try_spend(url):
+                    raise
+                delay = backoff_delay(attempt, e.retry_after)
+                attempt += 1
+                print(f"🔁 Retry {attempt}/{FETCH_MAX_RETRIES} for {url} in {delay:.1f}s ({e})")
+                await asyncio.sleep(delay)
+
+    async def _fetch_once(self, url: str, timeout: int) -> str:
+        """One download attempt; failures are raised as classified FetchErrors."""
+        headers = self.crawl_meta.conditional_headers(url) if self.crawl_meta else None
+        self.retry_budget.record_request(url)
+        try:
+            response = await self._get(url, timeout, headers)
+        except httpx.RequestError as e:
+            raise FetchError(TRANSIENT, f"Download error: {e}") from e
+
+        status = response.status_code
+        if status == 304:
+            return NOT_MODIFIED
+        if status >= 400:
+            raise FetchError(classify_status(status), f"HTTP {status}", status,
+                             parse_retry_after(response.headers.get('retry-after')))
+        if status >= 300:
+            raise FetchError(PERMANENT, f"Unexpected redirect (HTTP {status})", status)
+
+        if self.crawl_meta:
+            self.crawl_meta.observe(url, response.headers)
+        if self.archive:
+            await self.archive.store(url, response.text)
+        return response.text
+
+    async def _get(self, url: str, timeout: int, headers: dict | None) -> httpx.Response:
+        """Sends one GET, paced by the adaptive rate controller when one is attached."""
+        if not self.rate_controller:
+            # Fallback: fixed random delay before every request
+            await asyncio.sleep(random.uniform(0.5, 1.5))
+            return await self.session.get(url, timeout=timeout, headers=headers)
+
+        async with self.rate_controller.slot(url) as slot:
+            try:
+                response = await self.session.get(url, timeout=timeout, headers=headers)
+            except httpx.TimeoutException:
+                slot.timed_out = True
+                raise
+            slot.status = response.status_code
+            slot.retry_after = parse_retry_after(response.headers.get('retry-after'))
+            return response
+
+    @asynccontextmanager
+    async def stream_response(self, url: str, timeout: int = 60):
+        """
+        Opens a streamed GET for large bodies, paced and accounted like `_get`.
+        HTTP errors and network failures (also those hit while the caller reads
+        the body) are raised as classified FetchErrors. No retries here: a
+        half-read stream can only be retried by the caller, who knows what it consumed.
+        """
+        self.retry_budget.record_request(url)
+        if self.rate_controller:
+            slot_context = self.rate_controller.slot(url)
+        else:
+            await asyncio.sleep(random.uniform(0.5, 1.5))
+            slot_context = nullcontext(Slot())
+
+        async with slot_context as slot:
+            try:
+                async with self.session.stream('GET', url, timeout=timeout) as response:
+                    status = response.status_code
+                    slot.status = status
+                    slot.retry_after = parse_retry_after(response.headers.get('retry-after'))
+                    if status >= 400:
+                        raise FetchError(classify_status(status), f"HTTP {status}", status, slot.retry_after)
+                    yield response
+            except httpx.TimeoutException as e:
+                slot.timed_out = True
+                raise FetchError(TRANSIENT, f"Download error: {e}") from e
+            except httpx.RequestError as e:
+                raise FetchError(TRANSIENT, f"Download error: {e}") from e
+
+    async def log_error(self, url: str, breadcrumbs: list[str], error: str, error_class: str | None = None):
+        """Queues a failed URL, its context and failure class for the JSON Lines error log."""
+        self.error_log.write({"url": url, "breadcrumbs": breadcrumbs, "error": error, "error_class": error_class})
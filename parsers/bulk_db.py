@@ -0,0 +1,37 @@
+# parsers/bulk_db.py
+import asyncpg
+from config import PRICE_CHANGES_CHANNEL, PRICE_NOTIFY_BATCH
+
+
+async def copy_to_staging(conn: asyncpg.Connection, table: str, columns: dict[str, str], records) -> None:
+    """
+    Creates a transaction-scoped temp table and streams the records into it with COPY.
+    Must be called inside a transaction: the table is dropped on commit.
+    """
+    columns_sql = ", ".join(f"{name} {sql_type}" for name, sql_type in columns.items())
+    await conn.execute(f"CREATE TEMP TABLE {table} ({columns_sql}) ON COMMIT DROP")
+    await conn.copy_records_to_table(table, records=records, columns=list(columns))
+
+
+async def refresh_price_summary(conn: asyncpg.Connection) -> None:
+    """
+    Recomputes medicine_price_summary (min price and pharmacy count per medicine)
+    after an ingestion run. CONCURRENTLY keeps the view readable for the API meanwhile.
+    """
+    await conn.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY medicine_price_summary")
+
+
+async def publish_price_changes(conn: asyncpg.Connection, medicine_ids) -> None:
+    """
+    Refreshes medicine_price_summary, then NOTIFYs the ids of the medicines whose
+    prices changed on PRICE_CHANGES_CHANNEL, so the API drops exactly those cache
+    entries once the view already has the new numbers. A run without changes does nothing.
+    """
+    if not medicine_ids:
+        return
+    await refresh_price_summary(conn)
+    ids = sorted(medicine_ids)
+    for start in range(0, len(ids), PRICE_NOTIFY_BATCH):
+        payload = ",".join(map(str, ids[start:start + PRICE_NOTIFY_BATCH]))
+        await conn.execute("SELECT pg_notify($1, $2)", PRICE_CHANGES_CHANNEL, payload)
+    print(f"📣 Published price changes for {len(ids)} medicines.")
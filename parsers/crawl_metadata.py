@@ -0,0 +1,64 @@
+# parsers/crawl_metadata.py
+import hashlib
+import json
+
+# Returned by BaseParser.fetch_html when a conditional request gets 304 Not Modified
+NOT_MODIFIED = object()
+
+
+def content_hash(*fields) -> str:
+    """Stable hash of the extracted fields that end up in the DB."""
+    payload = json.dumps(fields, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CrawlMetadata:
+    """
+    Per-URL crawl metadata (ETag, Last-Modified, content hash) from the previous runs.
+    Loaded once at startup; new values are written back by the DB sink together
+    with the product rows, so metadata never gets ahead of what is stored.
+    """
+    def __init__(self):
+        self.entries: dict[str, tuple] = {}
+        # Validators seen in this run, waiting to be stored
+        self._fresh: dict[str, tuple] = {}
+
+    async def load(self, conn):
+        rows = await conn.fetch("SELECT url, etag, last_modified, content_hash FROM crawl_metadata")
+        self.entries = {row['url']: (row['etag'], row['last_modified'], row['content_hash']) for row in rows}
+        print(f"🗂️ Loaded crawl metadata for {len(self.entries)} URLs.")
+
+    def conditional_headers(self, url: str) -> dict:
+        """Builds If-None-Match / If-Modified-Since headers for a known URL."""
+        etag, last_modified, _ = self.entries.get(url, (None, None, None))
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def observe(self, url: str, response_headers):
+        """Remembers the validators of a fresh 200 response."""
+        self._fresh[url] = (response_headers.get('etag'), response_headers.get('last-modified'))
+
+    def is_unchanged(self, url: str, new_hash: str) -> bool:
+        entry = self.entries.get(url)
+        return entry is not None and entry[2] == new_hash
+
+    def record(self, url: str, new_hash: str) -> tuple:
+        """Returns the (etag, last_modified, content_hash) triple to store for a URL."""
+        etag, last_modified = self._fresh.pop(url, (None, None))
+        return etag, last_modified, new_hash
+
+    def not_modified(self, url: str) -> tuple:
+        """
+        Metadata to store for a page that answered 304: the stored validators
+        and hash are kept, only last_crawled moves (and a stale price is un-staled).
+        """
+        etag, last_modified, stored_hash = self.entries.get(url, (None, None, None))
+        return etag, last_modified, stored_hash
+
+    def forget(self, url: str):
+        """Drops validators of a page that will not be stored."""
+        self._fresh.pop(url, None)
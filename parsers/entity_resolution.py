@@ -0,0 +1,234 @@
+# parsers/entity_resolution.py
+import re
+from typing import NamedTuple
+from .trigram_index import TrigramIndex
+from config import TRIGRAM_MATCH_THRESHOLD
+
+# Canonical dosage forms. Long stems match as word prefixes, short abbreviations only as whole words.
+FORM_STEMS = {
+    'tab': ('таблет', 'tablet'),
+    'caps': ('капсул', 'capsul'),
+    'syrup': ('сироп',),
+    'solution': ('раствор', 'solution'),
+    'drops': ('капли', 'капель', 'drops'),
+    'ointment': ('мазь', 'мази'),
+    'cream': ('крем',),
+    'gel': ('гель', 'геля'),
+    'spray': ('спрей', 'аэрозол', 'spray'),
+    'suspension': ('суспенз',),
+    'powder': ('порошок', 'порошк'),
+    'suppositories': ('суппозит', 'свечи', 'свеч'),
+    'ampoules': ('ампул',),
+    'lozenges': ('пастилк', 'леденц'),
+    'granules': ('гранул',),
+}
+FORM_ABBREVIATIONS = {
+    'таб': 'tab', 'табл': 'tab', 'tab': 'tab', 'tabs': 'tab',
+    'капс': 'caps', 'caps': 'caps', 'cap': 'caps',
+    'рр': 'solution', 'сусп': 'suspension', 'супп': 'suppositories',
+    'амп': 'ampoules', 'пор': 'powder', 'гран': 'granules', 'паст': 'lozenges',
+}
+# Coating and packaging words that differ between pharmacies but not between products
+NOISE_WORDS = {
+    'п', 'о', 'по', 'покрытые', 'покрыт', 'пленочной', 'пленочн', 'плен', 'оболочкой', 'обол', 'об',
+    'шип', 'шипучие', 'жев', 'жевательные', 'д', 'рассас', 'фл', 'флакон', 'уп', 'упак', 'туба', 'шт',
+    'наз', 'назальные', 'назальный',
+}
+# Forms whose "N г" is the net mass of the package, not a strength
+MASS_PACKED_FORMS = {'ointment', 'cream', 'gel', 'powder', 'granules'}
+STRENGTH_UNITS = {
+    'мкг': 'mcg', 'mcg': 'mcg', 'мг': 'mg', 'mg': 'mg', 'г': 'g', 'гр': 'g', 'g': 'g',
+    'ме': 'iu', 'iu': 'iu', 'ед': 'iu', '%': '%',
+}
+PER_UNITS = {'мл': 'ml', 'ml': 'ml', 'доза': 'dose', 'доз': 'dose', 'дозу': 'dose', 'dose': 'dose', 'г': 'g', 'g': 'g', 'таб': 'tab'}
+
+NUMBER = r'(\d+(?:\.\d+)?)'
+PACK_RE = re.compile(r'(?:№|(?<![\w.])[nхx])\s?(\d+)(?![\w.])|(?<![\w.])(\d+)\s?(?:шт|штук|pcs|доз[аы]?)(?!\w)')
+STRENGTH_RE = re.compile(
+    NUMBER + r'\s?(мкг|mcg|мг|mg|гр|г|g|ме|iu|ед|%)(?:\s?/\s?' + NUMBER + r'?\s?(мл|ml|доза|дозу|доз|dose|г|g|таб))?(?![a-zа-я])'
+)
+VOLUME_RE = re.compile(NUMBER + r'\s?(мл|ml|л|l)(?![a-zа-я])')
+TOKEN_RE = re.compile(r'[a-zа-я0-9]+')
+
+
+class DrugKey(NamedTuple):
+    """Structured identity of a product title. Unknown parts are None."""
+    base: str
+    strength: str | None = None
+    form: str | None = None
+    pack: int | None = None
+    volume: str | None = None
+
+
+class Resolution(NamedTuple):
+    medicine_id: int | None
+    method: str | None  # 'key' (exact structured key), 'fuzzy' (similar base, same variant) or None
+    score: float
+
+
+def _number(value: str) -> float:
+    return float(value)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+
+def _form_of(token: str) -> str | None:
+    if token in FORM_ABBREVIATIONS:
+        return FORM_ABBREVIATIONS[token]
+    for form, stems in FORM_STEMS.items():
+        if any(token.startswith(stem) for stem in stems):
+            return form
+    return None
+
+
+def _prepare(title: str) -> str:
+    text = title.lower().replace('ё', 'е')
+    text = re.sub(r'\bр-р\b', ' рр ', text)
+    # Decimal commas: "0,05%" -> "0.05%"
+    text = re.sub(r'(?<=\d),(?=\d)', '.', text)
+    return re.sub(r'\s+', ' ', text)
+
+
+def extract_key(title: str) -> DrugKey:
+    """
+    Extracts a DrugKey from a product title, e.g.
+    "Нурофен Форте таблетки п/о 400мг №12" -> ('нурофен форте', '400mg', 'tab', 12, None).
+    Units are canonicalised (г -> mg for strengths, л -> ml) so spelling
+    differences between pharmacies do not produce different keys.
+    """
+    text = _prepare(title)
+
+    pack = None
+    def take_pack(match):
+        nonlocal pack
+        pack = int(match.group(1) or match.group(2))
+        return ' '
+    text = PACK_RE.sub(take_pack, text)
+
+    # (canonical strength, grams if it was a bare "N г")
+    strengths = []
+    def take_strength(match):
+        value, unit = _number(match.group(1)), STRENGTH_UNITS[match.group(2)]
+        per_amount, per = match.group(3), match.group(4)
+        if per:
+            per_text = f"/{_fmt(_number(per_amount)) if per_amount else ''}{PER_UNITS[per]}"
+            strengths.append((_fmt(value) + unit + per_text, None))
+        elif unit == 'g':
+            strengths.append((_fmt(value * 1000) + 'mg', value))
+        else:
+            strengths.append((_fmt(value) + unit, None))
+        return ' '
+    text = STRENGTH_RE.sub(take_strength, text)
+
+    volume = None
+    def take_volume(match):
+        nonlocal volume
+        value = _number(match.group(1))
+        volume = _fmt(value * 1000 if match.group(2) in ('л', 'l') else value) + 'ml'
+        return ' '
+    text = VOLUME_RE.sub(take_volume, text)
+
+    form, base_tokens, after_form = None, [], False
+    for token in TOKEN_RE.findall(text):
+        token_form = _form_of(token)
+        if token_form:
+            form = form or token_form
+            after_form = True
+            continue
+        # "30mg tab 20": a bare count right after the form is the pack size
+        if after_form and token.isdigit() and pack is None:
+            pack = int(token)
+            continue
+        # Coating words between the form and the count ("таблетки п о 50") keep it a pack size
+        if token in NOISE_WORDS:
+            continue
+        after_form = False
+        base_tokens.append(token)
+
+    # "Крем 5% 30г" is a 30 g tube, not a 30 000 mg strength
+    if form in MASS_PACKED_FORMS and volume is None:
+        grams = [entry for entry in strengths if entry[1] is not None]
+        if grams:
+            strengths.remove(grams[-1])
+            volume = _fmt(grams[-1][1]) + 'g'
+
+    return DrugKey(' '.join(base_tokens), '+'.join(text for text, _ in strengths) or None, form, pack, volume)
+
+
+def _compatible(query: DrugKey, candidate: DrugKey) -> int | None:
+    """
+    Number of variant fields both keys know and agree on, or None if any known field differs.
+    A strength known on one side only is a conflict too: names stored light_normalize'd
+    ("вольтарен гель 1 50г") lose "%" and decimal commas, so their strength reads as missing.
+    """
+    if (query.strength is None) != (candidate.strength is None):
+        return None
+    agreed = 0
+    for field in ('strength', 'form', 'pack', 'volume'):
+        left, right = getattr(query, field), getattr(candidate, field)
+        if left is None or right is None:
+            continue
+        if left != right:
+            return None
+        agreed += 1
+    return agreed
+
+
+class EntityResolver:
+    """
+    Resolves product titles from any pharmacy to `medicines.id` by structured key.
+    Exact keys hit an in-memory hash index in O(1). Only misses fall back to a
+    trigram search over base names, and a fuzzy hit is accepted only if its
+    strength, form, pack and volume agree, so "30mg tab 20" never becomes "30mg tab 50".
+    """
+    def __init__(self, threshold: float = TRIGRAM_MATCH_THRESHOLD):
+        self.keys: dict[DrugKey, int] = {}
+        self.variants: dict[str, list[tuple[DrugKey, int]]] = {}
+        self.bases = TrigramIndex(threshold)
+        self.base_names: list[str] = []
+
+    @classmethod
+    def from_rows(cls, rows, threshold: float = TRIGRAM_MATCH_THRESHOLD) -> 'EntityResolver':
+        """Builds the resolver from (id, name) rows, e.g. `SELECT id, name FROM medicines`."""
+        resolver = cls(threshold)
+        for medicine_id, name in rows:
+            resolver.add(medicine_id, name)
+        return resolver
+
+    def add(self, medicine_id: int, name: str):
+        key = extract_key(name)
+        self.keys.setdefault(key, medicine_id)
+        if key.base not in self.variants:
+            self.variants[key.base] = []
+            self.bases.add(len(self.base_names), key.base)
+            self.base_names.append(key.base)
+        self.variants[key.base].append((key, medicine_id))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def resolve(self, title: str) -> Resolution:
+        key = extract_key(title)
+        medicine_id = self.keys.get(key)
+        if medicine_id is not None:
+            return Resolution(medicine_id, 'key', 1.0)
+
+        base_id, _, score = self.bases.match(key.base)
+        if base_id is None or score < self.bases.threshold:
+            return Resolution(None, None, score)
+        best, best_key, best_agreed, tied = None, None, -1, False
+        for candidate, candidate_id in self.variants[self.base_names[base_id]]:
+            agreed = _compatible(key, candidate)
+            if agreed is None or agreed < best_agreed:
+                continue
+            if agreed > best_agreed:
+                best, best_key, best_agreed, tied = candidate_id, candidate, agreed, False
+            elif candidate != best_key:
+                # Rows sharing a key are one entity (the first id wins, as in self.keys)
+                tied = True
+        # "Нурофен 200мг" fits both №10 and №20 equally well: ambiguous, not a match
+        if best is None or tied:
+            return Resolution(None, None, score)
+        return Resolution(best, 'fuzzy', score)
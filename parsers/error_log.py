@@ -0,0 +1,84 @@
+# parsers/error_log.py
+import asyncio
+import json
+from datetime import datetime
+import aiofiles # For async file operations
+from config import ERROR_LOG_BATCH_SIZE, ERROR_LOG_FLUSH_INTERVAL
+
+
+class ErrorLog:
+    """
+    Append-only JSON Lines error log (log_error_YYYY-MM-DD.jsonl).
+    Workers only enqueue entries; a background task appends them in batches,
+    so failing workers never wait on file I/O or on each other.
+    """
+    def __init__(self, batch_size: int = ERROR_LOG_BATCH_SIZE, flush_interval: float = ERROR_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue()
+        self._task = None
+
+    def write(self, entry: dict):
+        """Queues one entry; the writer task is started on first use."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self.queue.put_nowait(entry)
+
+    async def close(self):
+        """Writes out everything still queued."""
+        if self._task:
+            self.queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if None in batch:
+                closing = True
+                batch = [entry for entry in batch if entry is not None]
+            if batch:
+                await self._append(batch)
+            if not closing:
+                # Let entries accumulate so the next append is a bigger batch
+                await asyncio.sleep(self.flush_interval)
+
+    @staticmethod
+    async def _append(batch: list[dict]):
+        log_filename = f"log_error_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+        async with aiofiles.open(log_filename, mode='a', encoding='utf-8') as f:
+            await f.write(lines)
+
+
+def iter_error_log(path: str):
+    """
+    Streams entries from an error log. Reads the JSON Lines format line by line
+    and still accepts the old JSON array logs (log_error_*.json).
+    """
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash must not lose the rest of the log
+                    continue
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def iter_failed_items(path: str):
+    """Yields log entries with each URL only once (first occurrence wins)."""
+    seen = set()
+    for entry in iter_error_log(path):
+        if entry['url'] not in seen:
+            seen.add(entry['url'])
+            yield entry
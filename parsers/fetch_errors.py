@@ -0,0 +1,55 @@
+# parsers/fetch_errors.py
+import random
+from collections import defaultdict
+from urllib.parse import urlparse
+from config import FETCH_BACKOFF_BASE, FETCH_BACKOFF_MAX, RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN
+
+# Failure classes written to the error log
+TRANSIENT = 'transient'   # network errors, timeouts, 429, 5xx: worth retrying
+PERMANENT = 'permanent'   # 404/410 and other client errors: retrying will not help
+PARSE = 'parse'           # page downloaded, but required fields are missing
+
+
+class FetchError(Exception):
+    """A failed download, classified as TRANSIENT or PERMANENT."""
+    def __init__(self, kind: str, message: str, status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+
+
+def classify_status(status: int) -> str:
+    if status in (408, 425, 429) or status >= 500:
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Exponential backoff with full jitter; Retry-After from the server wins when given."""
+    if retry_after is not None:
+        return min(retry_after, FETCH_BACKOFF_MAX)
+    return random.uniform(0, min(FETCH_BACKOFF_MAX, FETCH_BACKOFF_BASE * 2 ** attempt))
+
+
+class RetryBudget:
+    """
+    Per-host retry budget: retries may not exceed RETRY_BUDGET_RATIO of the
+    requests sent to the host (plus a small reserve), so a struggling site
+    does not get hammered with retry storms.
+    """
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, reserve: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.requests = defaultdict(int)
+        self.retries = defaultdict(int)
+
+    def record_request(self, url: str):
+        self.requests[urlparse(url).hostname] += 1
+
+    def try_spend(self, url: str) -> bool:
+        host = urlparse(url).hostname
+        if self.retries[host] >= self.reserve + self.ratio * self.requests[host]:
+            return False
+        self.retries[host] += 1
+        return True
@@ -0,0 +1,67 @@
+# parsers/gosapteka/category_cache.py
+import asyncio
+
+# Builds the full breadcrumb path of every category in one round trip.
+LOAD_SQL = """
+WITH RECURSIVE paths AS (
+    SELECT id, ARRAY[name::text] AS path FROM categories WHERE parent_id IS NULL
+    UNION ALL
+    SELECT c.id, p.path || c.name::text FROM categories c JOIN paths p ON c.parent_id = p.id
+)
+SELECT id, path FROM paths;
+"""
+
+
+class CategoryCache:
+    """
+    In-memory map from a breadcrumb path (tuple of names) to its category ID.
+    Fully cached paths are resolved without touching the DB; only missing
+    levels are looked up or inserted.
+    """
+    def __init__(self):
+        self.ids: dict[tuple[str, ...], int] = {}
+        # Serializes creation of new paths inside this process
+        self._lock = asyncio.Lock()
+
+    async def load(self, conn):
+        """Preloads every existing category path from the DB."""
+        rows = await conn.fetch(LOAD_SQL)
+        self.ids = {tuple(row['path']): row['id'] for row in rows}
+        print(f"📂 Loaded {len(self.ids)} category paths into cache.")
+
+    async def get_id(self, breadcrumbs: list[str], conn) -> int | None:
+        """Returns the ID of the last category in the path, creating missing levels."""
+        path = tuple(breadcrumbs)
+        if not path:
+            return None
+        category_id = self.ids.get(path)
+        if category_id is not None:
+            return category_id
+
+        async with self._lock:
+            parent_id = None
+            for depth in range(1, len(path) + 1):
+                prefix = path[:depth]
+                category_id = self.ids.get(prefix)
+                if category_id is None:
+                    category_id = await self._get_or_insert(prefix[-1], parent_id, conn)
+                    self.ids[prefix] = category_id
+                parent_id = category_id
+            return category_id
+
+    @staticmethod
+    async def _get_or_insert(name: str, parent_id: int | None, conn) -> int:
+        """
+        Inserts one category level. ON CONFLICT DO NOTHING makes concurrent
+        inserts from other processes safe: the loser simply reads the winner's row.
+        """
+        category_id = await conn.fetchval(
+            "INSERT INTO categories (name, parent_id) VALUES ($1, $2) ON CONFLICT DO NOTHING RETURNING id",
+            name, parent_id
+        )
+        if category_id is None:
+            category_id = await conn.fetchval(
+                "SELECT id FROM categories WHERE name = $1 AND (parent_id = $2 OR ($2 IS NULL AND parent_id IS NULL))",
+                name, parent_id
+            )
+        return category_id
@@ -1,14 +1,27 @@
 # parsers/gosapteka/details_processor.py
-import asyncio
 import os
-import re
 import json
-from urllib.parse import urljoin
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 import asyncpg
 import httpx
-from bs4 import BeautifulSoup, Tag
 from ..base_parser import BaseParser
-from config import DB_CONFIG, URLS_DIR, CONCURRENCY_LIMIT
+from ..bulk_db import publish_price_changes
+from ..crawl_metadata import NOT_MODIFIED, CrawlMetadata, content_hash
+from ..fetch_errors import FetchError, PARSE
+from ..progress_store import ProgressStore, FAILED, SKIPPED
+from ..html_archive import HtmlArchive
+from ..rate_control import RateController
+from .category_cache import CategoryCache
+from .html_parsing import extract_breadcrumb_urls, parse_product_html
+from .product_sink import ProductSink
+from .url_collector import REMOVED_FILE, UNCATEGORIZED_PATH, UNCATEGORIZED_URL
+from .url_index import UrlIndex
+from ..pipeline import Pipeline
+from config import DB_CONFIG, URLS_DIR, URL_DIFFS_DIR, SITEMAP_CHANGES_FILE, UNCHANGED_SAMPLE_RATE, UNCHANGED_MAX_AGE_DAYS, CONCURRENCY_LIMIT, PARSE_WORKERS, HTML_ARCHIVE_ENABLED, ADAPTIVE_RATE_LIMIT
+
+GOSAPTEKA_URL = "https://gosapteka18.ru"
 
 class DetailsProcessor(BaseParser):
     """Parses product details and saves them to the database."""
@@ -16,91 +29,217 @@ class DetailsProcessor(BaseParser):
         super().__init__(*args, **kwargs)
         self.pharmacy_name = "Госаптека 18"
         # --- ИЗМЕНЕНИЕ 1: Жестко задаем base_url здесь ---
-        self.base_url = "https://gosapteka18.ru"
-
-    def _parse_product_data(self, soup: BeautifulSoup) -> dict:
-        """Extracts all necessary data from a product page."""
-        title_tag = soup.select_one('h1.title.headline-main__title.product-card__title, h1.product-card__title')
-        title = title_tag.get_text(strip=True) if title_tag else "Без названия"
-        
-        img_tag = soup.select_one('img.product-card__picture-view-img')
-        image_url = urljoin(self.base_url, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ""
-        
-        desc_text = "Нет данных"
-        desc_block = soup.select_one('div.product-card__description')
-        if desc_block:
-            sections = {h.get_text(strip=True): " ".join([s.get_text(" ", strip=True) for s in h.find_next_siblings() if s.name != 'h4' and isinstance(s, Tag)]) for h in desc_block.find_all('h4')}
-            desc_text = "\n\n".join([f"{k}:\n{v}" for k, v in sections.items()]) or (desc_block.get_text(" ", strip=True) or desc_text)
-        
-        price = None
-        meta_price_tag = soup.find('meta', {'itemprop': 'price'})
-        if meta_price_tag and 'content' in meta_price_tag.attrs:
-            try:
-                price = float(meta_price_tag['content'])
-            except (ValueError, TypeError):
-                pass
-        
-        if price is None:
-            price_match = re.search(r'"price"\s*:\s*"(\d+\.?\d*)"', soup.prettify())
-            if price_match:
-                price = float(price_match.group(1))
-        
-        return {'name': title, 'image_url': image_url, 'description': desc_text, 'price': price}
+        self.base_url = GOSAPTEKA_URL
+        # Write-behind DB sink, attached by the orchestrator for the duration of a run
+        self.sink = None
+        self.category_cache = CategoryCache()
+        self.stats = Counter()
+        # Optional ProgressStore; URLs are marked done only after their batch is committed
+        self.progress = None
+        # Optional UrlIndex; uncategorized products are moved to the category their breadcrumbs link to
+        self.index = None
+        self.category_paths = {}
 
     async def _get_or_create_category_id(self, breadcrumbs: list[str], conn) -> int:
         """Finds or creates the full category path and returns the final category ID."""
-        parent_id = None
-        category_id = None
-        for category_name in breadcrumbs:
-            row = await conn.fetchrow("SELECT id FROM categories WHERE name = $1 AND (parent_id = $2 OR ($2 IS NULL AND parent_id IS NULL))", category_name, parent_id)
-            if row:
-                category_id = row['id']
-            else:
-                category_id = await conn.fetchval("INSERT INTO categories (name, parent_id) VALUES ($1, $2) RETURNING id", category_name, parent_id)
-            parent_id = category_id
-        return category_id
+        return await self.category_cache.get_id(breadcrumbs, conn)
+
+    async def _get_pharmacy_id(self, conn) -> int:
+        """Finds or creates this pharmacy's row and returns its ID."""
+        return await conn.fetchval("SELECT id FROM pharmacies WHERE address = $1", self.base_url) or await conn.fetchval("INSERT INTO pharmacies (name, address) VALUES ($1, $2) RETURNING id", self.pharmacy_name, self.base_url)
+
+    async def fetch_item(self, item: dict) -> dict | None:
+        """Pipeline stage 1: downloads the product page."""
+        print(f"⏳ Processing: {item['url']}")
+        try:
+            html = await self.fetch_page(item['url'])
+        except FetchError as e:
+            if self.offline:
+                self.stats['not_archived'] += 1
+                self.mark(item['url'], SKIPPED)
+                return None
+            # Only pages that still failed after the in-line retries reach the log
+            self.stats['failed'] += 1
+            self.mark(item['url'], FAILED)
+            print(f"🚫 {e.kind.capitalize()} error for {item['url']}: {e}")
+            await self.log_error(item['url'], item['breadcrumbs'], str(e), e.kind)
+            return None
+        if html is NOT_MODIFIED:
+            # Still goes to the sink as a metadata-only row: last_crawled moves and a
+            # product that came back to the catalog gets its stale price un-staled
+            self.stats['not_modified'] += 1
+            item['data'] = None
+            item['meta'] = self.crawl_meta.not_modified(item['url'])
+            return item
+        item['html'] = html
+        return item
+
+    async def parse_item(self, item: dict) -> dict | None:
+        """
+        Pipeline stage 2: parses the page in the parse stage and validates the result.
+        Products whose extracted fields hash the same as last time are passed on
+        without data, so only their crawl metadata is refreshed.
+        304 items from the fetch stage have nothing to parse and pass straight through.
+        """
+        if 'html' not in item:
+            return item
+        html = item.pop('html')
+        data = await self.parse_stage.run(parse_product_html, html, self.base_url)
+        if data['name'] == "Без названия" or data['price'] is None:
+            self.stats['skipped'] += 1
+            self.mark(item['url'], FAILED)
+            if self.crawl_meta:
+                self.crawl_meta.forget(item['url'])
+            print(f"   - Skipped: Missing title or price for {item['url']}")
+            await self.log_error(item['url'], item['breadcrumbs'], "Missing title or price", PARSE)
+            return None
+
+        if self.index and item['breadcrumbs'] == UNCATEGORIZED_PATH:
+            await self._resolve_category(item, html)
+        new_hash = content_hash(data, item['breadcrumbs'])
+        item['meta'] = self.crawl_meta.record(item['url'], new_hash) if self.crawl_meta else (None, None, new_hash)
+        if self.crawl_meta and self.crawl_meta.is_unchanged(item['url'], new_hash):
+            self.stats['unchanged'] += 1
+            item['data'] = None
+        else:
+            self.stats['changed'] += 1
+            item['data'] = data
+        return item
+
+    async def _resolve_category(self, item: dict, html: str):
+        """
+        Files a product found by sitemap discovery under the deepest known category
+        linked from its breadcrumbs, reusing the page this stage has already fetched.
+        """
+        crumb_urls = await self.parse_stage.run(extract_breadcrumb_urls, html, self.base_url)
+        for url in reversed(crumb_urls):
+            if url != UNCATEGORIZED_URL and url in self.category_paths:
+                item['breadcrumbs'] = self.category_paths[url]
+                self.index.move_product(item['url'], UNCATEGORIZED_URL, url, item['breadcrumbs'])
+                return
+
+    async def persist_item(self, item: dict) -> dict:
+        """Pipeline stage 3: hands the product to the write-behind sink."""
+        data = item['data']
+        await self.sink.put(item['url'], item['breadcrumbs'], data, item['meta'])
+        if data:
+            print(f"📥 Queued: {data['name']} - {data['price']} руб.")
+        return item
+
+    def mark(self, url: str, state: str):
+        """Records the state of a URL in the progress store, if one is attached."""
+        if self.progress:
+            self.progress.mark(url, state)
+
+    def print_summary(self):
+        """Prints how many pages were skipped thanks to 304s and unchanged content."""
+        total = sum(self.stats.values())
+        skipped = self.stats['not_modified'] + self.stats['unchanged']
+        skip_rate = skipped / total * 100 if total else 0.0
+        print(f"📈 Run summary: {total} pages | written {self.stats['changed']} | "
+              f"304 not modified {self.stats['not_modified']} | unchanged {self.stats['unchanged']} | "
+              f"no title/price {self.stats['skipped']} | failed {self.stats['failed']} | "
+              f"not archived {self.stats['not_archived']} | skip rate {skip_rate:.1f}%")
 
     async def process_item(self, product_url: str, breadcrumbs: list[str]):
         """Full processing cycle for one product URL."""
-        print(f"⏳ Processing: {product_url}")
-        html = await self.fetch_html(product_url)
-        
-        if not html:
-            await self.log_error(product_url, breadcrumbs, "Failed to download HTML")
-            return
+        item = await self.fetch_item({'url': product_url, 'breadcrumbs': breadcrumbs})
+        if item:
+            item = await self.parse_item(item)
+        if item:
+            await self.persist_item(item)
 
-        soup = BeautifulSoup(html, 'html.parser')
-        data = self._parse_product_data(soup)
-        
-        if data['name'] == "Без названия" or data['price'] is None:
-            print(f"   - Skipped: Missing title or price for {product_url}")
-            return
 
-        async with self.db_pool.acquire() as conn, conn.transaction():
-            category_id = await self._get_or_create_category_id(breadcrumbs, conn)
-            
-            medicine_id = await conn.fetchval("""
-                INSERT INTO medicines (name, description, image_url, category_id)
-                VALUES ($1, $2, $3, $4) ON CONFLICT (name) DO UPDATE
-                SET description=EXCLUDED.description, image_url=EXCLUDED.image_url, category_id=EXCLUDED.category_id
-                RETURNING id;
-            """, data['name'], data['description'], data['image_url'], category_id)
-
-            pharmacy_id = await conn.fetchval("SELECT id FROM pharmacies WHERE address = $1", self.base_url) or await conn.fetchval("INSERT INTO pharmacies (name, address) VALUES ($1, $2) RETURNING id", self.pharmacy_name, self.base_url)
-
-            await conn.execute("""
-                INSERT INTO pharmacy_prices (pharmacy_id, medicine_id, price) VALUES ($1, $2, $3)
-                ON CONFLICT (pharmacy_id, medicine_id) DO UPDATE SET price = EXCLUDED.price, last_updated = NOW();
-            """, pharmacy_id, medicine_id, data['price'])
-        
-        print(f"💾 Saved: {data['name']} - {data['price']} руб.")
-
-async def process_details_from_files():
-    """Main orchestrator function for processing details from saved files."""
-    if not os.path.exists(URLS_DIR) or not os.listdir(URLS_DIR):
-        print(f"❌ Directory '{URLS_DIR}' is empty or not found. Run stage1 first.")
-        return
+def open_url_index(urls_dir: str = URLS_DIR) -> UrlIndex:
+    """
+    Opens the URL index. An empty index is filled from the old per-category
+    JSON files of Stage 1, if there are any, so existing crawls keep working.
+    """
+    index = UrlIndex()
+    if not index.count() and os.path.exists(urls_dir):
+        imported = index.import_json_dir(urls_dir)
+        if imported:
+            print(f"📦 Imported {imported} category files into the URL index ({index.count()} unique products).")
+    return index
+
+
+def iter_index_items(index: UrlIndex, only_urls: set | None = None):
+    """Yields {'url', 'breadcrumbs'} once per product from the URL index."""
+    for product in index.iter_products():
+        if only_urls is None or product['url'] in only_urls:
+            yield {'url': product['url'], 'breadcrumbs': product['breadcrumbs']}
+
+
+def load_url_diffs(diffs_dir: str = URL_DIFFS_DIR) -> tuple[set, list]:
+    """Returns the URLs added in the last Stage 1 run and the URLs removed from the catalog."""
+    added, removed = set(), []
+    if not os.path.exists(diffs_dir):
+        return added, removed
+    for filename in os.listdir(diffs_dir):
+        with open(os.path.join(diffs_dir, filename), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if filename == REMOVED_FILE:
+            removed = data['removed']
+        else:
+            added.update(data['added'])
+    return added, removed
+
+
+def select_incremental(items, added: set, last_crawled: dict,
+                       sample_rate: float = UNCHANGED_SAMPLE_RATE, max_age_days: float = UNCHANGED_MAX_AGE_DAYS):
+    """
+    Keeps new URLs plus a slice of the unchanged ones: those never stored,
+    those last crawled more than max_age_days ago, and a random sample_rate share.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    for item in items:
+        crawled_at = last_crawled.get(item['url'])
+        if item['url'] in added or crawled_at is None or crawled_at < cutoff or random.random() < sample_rate:
+            yield item
 
+
+async def mark_removed_stale(conn, urls: list[str]) -> set[int]:
+    """
+    Marks the gosapteka prices of products gone from the catalog as stale.
+    Returns the ids of the affected medicines.
+    """
+    rows = await conn.fetch("""
+        UPDATE pharmacy_prices p SET stale_since = NOW()
+        FROM crawl_metadata c, pharmacies ph
+        WHERE c.url = ANY($1::text[]) AND p.medicine_id = c.medicine_id
+          AND ph.address = $2 AND p.pharmacy_id = ph.id AND p.stale_since IS NULL
+        RETURNING p.medicine_id
+    """, urls, GOSAPTEKA_URL)
+    return {row['medicine_id'] for row in rows}
+
+
+def build_details_pipeline(processor: DetailsProcessor) -> Pipeline:
+    """Builds the fetch -> parse -> persist pipeline for a configured processor."""
+    # Offline reads are local, so the "fetch" stage is only bounded by the CPU
+    # The rate controller is the real limiter, so there are as many fetchers as its hard cap
+    if processor.offline:
+        fetch_workers = max(1, PARSE_WORKERS) * 2
+    elif processor.rate_controller:
+        fetch_workers = processor.rate_controller.max_concurrency(processor.base_url)
+    else:
+        fetch_workers = CONCURRENCY_LIMIT
+    print(f"🚀 Launching streaming pipeline with {fetch_workers} {'archive' if processor.offline else 'fetch'} workers...")
+    return (Pipeline()
+            .add_stage('fetch', processor.fetch_item, fetch_workers)
+            .add_stage('parse', processor.parse_item, max(1, PARSE_WORKERS))
+            .add_stage('persist', processor.persist_item, 1))
+
+
+async def run_details_pipeline(items, offline: bool = False, progress: ProgressStore | None = None,
+                               changed_ids: set[int] | None = None):
+    """
+    Runs the fetch -> parse -> persist pipeline over any iterable of
+    {'url', 'breadcrumbs'} items. Shared by Stage 2, reparse and the retry script.
+    With offline=True pages come from the HTML archive and no request is sent.
+    With a progress store every URL's final state is recorded for resuming.
+    changed_ids (e.g. medicines marked stale before the run) are published
+    to the API caches together with the prices changed by the run.
+    """
     db_pool = None
     try:
         db_pool = await asyncpg.create_pool(**DB_CONFIG)
@@ -109,29 +248,113 @@ async def process_details_from_files():
         return
 
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-    
+    archive = HtmlArchive() if HTML_ARCHIVE_ENABLED or offline else None
+
     async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
-        # --- ИЗМЕНЕНИЕ 2: Убираем аргумент base_url из вызова ---
         processor = DetailsProcessor(session, db_pool)
-        
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-        
-        async def worker(url, breadcrumbs):
-            async with semaphore:
-                await processor.process_item(url, breadcrumbs)
-
-        tasks = []
-        for filename in os.listdir(URLS_DIR):
-            if filename.endswith('.json'):
-                filepath = os.path.join(URLS_DIR, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    breadcrumbs = data.get('breadcrumbs', ['Без категории'])
-                    for url in data['product_urls']:
-                        tasks.append(worker(url, breadcrumbs))
-        
-        print(f"🚀 Launching processing for {len(tasks)} products with a concurrency limit of {CONCURRENCY_LIMIT}...")
-        await asyncio.gather(*tasks)
-
-    if db_pool:
-        await db_pool.close()
\ No newline at end of file
+        processor.sink = ProductSink(processor)
+        processor.archive = archive
+        processor.offline = offline
+        processor.progress = progress
+        if ADAPTIVE_RATE_LIMIT and not offline:
+            processor.rate_controller = RateController()
+        processor.crawl_meta = CrawlMetadata()
+        async with db_pool.acquire() as conn:
+            await processor.crawl_meta.load(conn)
+        processor.index = UrlIndex()
+        processor.category_paths = processor.index.category_paths()
+
+        pipeline = build_details_pipeline(processor)
+        try:
+            async with processor.sink:
+                await pipeline.run(items)
+        finally:
+            processor.index.close()
+            processor.parse_stage.close()
+            await processor.error_log.close()
+            if progress:
+                progress.flush()
+        processor.print_summary()
+        if processor.rate_controller:
+            print(f"🚦 Rate control: {processor.rate_controller.describe()}")
+
+    if archive:
+        if not offline:
+            archive.evict()
+        archive.close()
+    async with db_pool.acquire() as conn:
+        await publish_price_changes(conn, processor.sink.changed_medicine_ids | (changed_ids or set()))
+    await db_pool.close()
+
+
+async def process_details_from_files(resume: bool = False, incremental: bool = False, only_urls: set | None = None):
+    """
+    Main orchestrator function for processing the products in the URL index.
+    A fresh run marks every URL pending in the progress store; with resume=True
+    only the URLs still pending from the interrupted run are processed.
+    With incremental=True only URLs added by the last Stage 1 run plus a slice
+    of the unchanged ones are processed. Prices of removed products are marked stale.
+    With only_urls (e.g. the sitemap changes) just those products are processed.
+    """
+    progress = ProgressStore()
+    stale_ids = set()
+    try:
+        if resume:
+            counts = progress.counts()
+            if not counts.get('pending'):
+                print(f"🤷 Nothing to resume: {counts or 'no previous run recorded'}.")
+                return
+            print(f"⏯️ Resuming Stage 2: {counts}")
+        else:
+            index = open_url_index()
+            try:
+                if not index.count():
+                    print("❌ The URL index is empty. Run stage1 first.")
+                    return
+                items = iter_index_items(index, only_urls)
+                if only_urls is None:
+                    added, removed = load_url_diffs()
+                    conn = await asyncpg.connect(**DB_CONFIG)
+                    try:
+                        if removed:
+                            stale_ids = await mark_removed_stale(conn, removed)
+                            print(f"🕸️ Marked {len(stale_ids)} prices of removed products as stale.")
+                        if incremental:
+                            rows = await conn.fetch("SELECT url, last_crawled FROM crawl_metadata")
+                            items = select_incremental(items, added, {row['url']: row['last_crawled'] for row in rows})
+                    finally:
+                        await conn.close()
+                progress.reset(items)
+            finally:
+                index.close()
+            print(f"🗒️ Registered {sum(progress.counts().values())} URLs for this run.")
+
+        await run_details_pipeline(progress.iter_pending(), progress=progress, changed_ids=stale_ids)
+        print(f"🗒️ Progress: {progress.counts()}")
+    finally:
+        progress.close()
+
+
+async def process_sitemap_changes():
+    """Processes the products found by the last sitemap discovery run."""
+    if not os.path.exists(SITEMAP_CHANGES_FILE):
+        print(f"❌ '{SITEMAP_CHANGES_FILE}' not found. Run sitemap discovery first.")
+        return
+    with open(SITEMAP_CHANGES_FILE, 'r', encoding='utf-8') as f:
+        changed = set(json.load(f))
+    if not changed:
+        print("🤷 No changed products to process.")
+        return
+    await process_details_from_files(only_urls=changed)
+
+
+async def reparse_from_archive():
+    """Rebuilds the DB from the archived product pages without touching the network."""
+    index = open_url_index()
+    try:
+        if not index.count():
+            print("❌ The URL index is empty. Run stage1 first.")
+            return
+        await run_details_pipeline(iter_index_items(index), offline=True)
+    finally:
+        index.close()
@@ -0,0 +1,114 @@
+# parsers/gosapteka/html_parsing.py
+# Pure parse functions for gosapteka18 pages. They are module-level so that
+# ParseStage can ship them to worker processes.
+import re
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from bs4 import BeautifulSoup, Tag
+from ..parse_stage import make_soup
+
+PRICE_JSON_RE = re.compile(r'"price"\s*:\s*"(\d+\.?\d*)"')
+# Bitrix pagination links: ?PAGEN_1=7
+PAGEN_RE = re.compile(r'[?&](PAGEN_\d+)=(\d+)')
+
+
+def extract_product_data(soup: BeautifulSoup, base_url: str, html: str | None = None) -> dict:
+    """Extracts all necessary data from a product page."""
+    title_tag = soup.select_one('h1.title.headline-main__title.product-card__title, h1.product-card__title')
+    title = title_tag.get_text(strip=True) if title_tag else "Без названия"
+
+    img_tag = soup.select_one('img.product-card__picture-view-img')
+    image_url = urljoin(base_url, img_tag['src']) if img_tag and 'src' in img_tag.attrs else ""
+
+    desc_text = "Нет данных"
+    desc_block = soup.select_one('div.product-card__description')
+    if desc_block:
+        sections = {h.get_text(strip=True): " ".join([s.get_text(" ", strip=True) for s in h.find_next_siblings() if s.name != 'h4' and isinstance(s, Tag)]) for h in desc_block.find_all('h4')}
+        desc_text = "\n\n".join([f"{k}:\n{v}" for k, v in sections.items()]) or (desc_block.get_text(" ", strip=True) or desc_text)
+
+    price = None
+    meta_price_tag = soup.find('meta', {'itemprop': 'price'})
+    if meta_price_tag and 'content' in meta_price_tag.attrs:
+        try:
+            price = float(meta_price_tag['content'])
+        except (ValueError, TypeError):
+            pass
+
+    if price is None:
+        # Search the raw markup first; re-serializing the whole tree with
+        # prettify() is only needed when the raw text has no match.
+        price_match = PRICE_JSON_RE.search(html) if html else None
+        if not price_match:
+            price_match = PRICE_JSON_RE.search(soup.prettify())
+        if price_match:
+            price = float(price_match.group(1))
+
+    return {'name': title, 'image_url': image_url, 'description': desc_text, 'price': price}
+
+
+def parse_product_html(html: str, base_url: str) -> dict:
+    """Parses a raw product page into the small result dict."""
+    return extract_product_data(make_soup(html), base_url, html)
+
+
+def _product_links(soup: BeautifulSoup, base_url: str) -> list[str]:
+    links = soup.select('a.product-mini__title-link, a.product-mini__picture')
+    # dict.fromkeys dedupes while keeping page order, so results are deterministic
+    return list(dict.fromkeys(urljoin(base_url, link.get('href')) for link in links if link.get('href')))
+
+
+def _next_page(soup: BeautifulSoup, base_url: str) -> str | None:
+    next_btn = soup.find('a', class_='modern-page-next')
+    return urljoin(base_url, next_btn['href']) if next_btn and next_btn.get('href') else None
+
+
+def _last_page(soup: BeautifulSoup) -> tuple[str | None, int | None]:
+    """Reads the pagination param (e.g. PAGEN_1) and the highest page number linked."""
+    page_param, last_page = None, None
+    for link in soup.find_all('a', href=PAGEN_RE):
+        match = PAGEN_RE.search(link['href'])
+        number = int(match.group(2))
+        if last_page is None or number > last_page:
+            page_param, last_page = match.group(1), number
+    return page_param, last_page
+
+
+def parse_category_page(html: str, base_url: str) -> dict:
+    """
+    Parses a category page once and returns its product links together with
+    the pagination info: next page URL, pagination param and last page number.
+    """
+    soup = make_soup(html)
+    page_param, last_page = _last_page(soup)
+    return {
+        'links': _product_links(soup, base_url),
+        'next_url': _next_page(soup, base_url),
+        'page_param': page_param,
+        'last_page': last_page,
+    }
+
+
+def build_page_url(url: str, page_param: str, page_num: int) -> str:
+    """Returns the category URL with the pagination param set to page_num."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query[page_param] = str(page_num)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def extract_product_links(html: str, base_url: str) -> list[str]:
+    """Extracts product links from a category page."""
+    return _product_links(make_soup(html), base_url)
+
+
+def find_next_page(html: str, base_url: str) -> str | None:
+    """Finds the link to the next page in the pagination."""
+    return _next_page(make_soup(html), base_url)
+
+
+def extract_breadcrumb_urls(html: str, base_url: str) -> list[str]:
+    """Returns the breadcrumb links of a product page, from the root down."""
+    soup = make_soup(html)
+    container = soup.select_one('[class*="breadcrumb"]')
+    if not container:
+        return []
+    return [urljoin(base_url, link['href']) for link in container.find_all('a', href=True)]
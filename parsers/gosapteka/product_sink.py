@@ -0,0 +1,185 @@
+# parsers/gosapteka/product_sink.py
+import asyncio
+import time
+from ..bulk_db import copy_to_staging
+from ..fetch_errors import TRANSIENT
+from ..progress_store import DONE, FAILED
+from config import DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_QUEUE_MAXSIZE
+
+STAGING_COLUMNS = {
+    'seq': 'integer',
+    'url': 'text',
+    'name': 'text',
+    'description': 'text',
+    'image_url': 'text',
+    'category_id': 'integer',
+    'price': 'numeric(10, 2)',
+    'etag': 'text',
+    'last_modified': 'text',
+    'content_hash': 'text',
+}
+
+# One set-based merge per batch. DISTINCT ON keeps only the latest row per name,
+# because ON CONFLICT DO UPDATE cannot touch the same row twice in one statement.
+# Rows without a name are metadata-only (the page content did not change).
+# Returns the medicines whose price is new, different or no longer stale: every part
+# of one statement sees the same snapshot, so `previous` holds the prices before the merge.
+MERGE_SQL = """
+WITH latest AS (
+    SELECT DISTINCT ON (name) name, description, image_url, category_id, price
+    FROM staging_products
+    WHERE name IS NOT NULL
+    ORDER BY name, seq DESC
+), upserted AS (
+    INSERT INTO medicines (name, description, image_url, category_id)
+    SELECT name, description, image_url, category_id FROM latest
+    ON CONFLICT (name) DO UPDATE
+    SET description=EXCLUDED.description, image_url=EXCLUDED.image_url, category_id=EXCLUDED.category_id
+    RETURNING id, name
+), previous AS (
+    SELECT p.medicine_id, p.price, p.stale_since
+    FROM pharmacy_prices p JOIN upserted u ON u.id = p.medicine_id
+    WHERE p.pharmacy_id = $1
+), priced AS (
+    INSERT INTO pharmacy_prices (pharmacy_id, medicine_id, price)
+    SELECT $1, u.id, l.price FROM upserted u JOIN latest l ON l.name = u.name
+    ON CONFLICT (pharmacy_id, medicine_id) DO UPDATE SET price = EXCLUDED.price, last_updated = NOW(), stale_since = NULL
+    RETURNING medicine_id, price
+)
+SELECT pr.medicine_id FROM priced pr LEFT JOIN previous pv ON pv.medicine_id = pr.medicine_id
+WHERE pv.medicine_id IS NULL OR pv.price <> pr.price OR pv.stale_since IS NOT NULL;
+"""
+
+META_MERGE_SQL = """
+INSERT INTO crawl_metadata (url, etag, last_modified, content_hash, medicine_id, last_crawled)
+SELECT DISTINCT ON (s.url) s.url, s.etag, s.last_modified, s.content_hash, m.id, NOW()
+FROM staging_products s LEFT JOIN medicines m ON m.name = s.name
+ORDER BY s.url, s.seq DESC
+ON CONFLICT (url) DO UPDATE
+SET etag = COALESCE(EXCLUDED.etag, crawl_metadata.etag),
+    last_modified = COALESCE(EXCLUDED.last_modified, crawl_metadata.last_modified),
+    content_hash = COALESCE(EXCLUDED.content_hash, crawl_metadata.content_hash),
+    medicine_id = COALESCE(EXCLUDED.medicine_id, crawl_metadata.medicine_id),
+    last_crawled = EXCLUDED.last_crawled;
+"""
+
+# A product seen again (even with unchanged content) is no longer stale
+UNSTALE_SQL = """
+UPDATE pharmacy_prices p SET stale_since = NULL
+FROM crawl_metadata c JOIN staging_products s ON s.url = c.url
+WHERE p.pharmacy_id = $1 AND p.medicine_id = c.medicine_id AND p.stale_since IS NOT NULL
+RETURNING p.medicine_id;
+"""
+
+
+class ProductSink:
+    """
+    Write-behind sink for parsed products.
+    Products are queued by the workers and merged into the DB in batches,
+    flushed either when the batch is full or when the flush interval expires.
+    The queue is bounded, so `put` blocks (and the fetchers slow down) when the writer falls behind.
+    """
+    def __init__(self, processor, batch_size: int = DB_BATCH_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL, max_queue: int = DB_QUEUE_MAXSIZE):
+        self.processor = processor
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.pharmacy_id = None
+        self.saved_count = 0
+        # time.monotonic() of the first committed batch, for time-to-first-price reporting
+        self.first_saved_at = None
+        # Medicines whose price changed in this run, published to the API caches at the end
+        self.changed_medicine_ids = set()
+        self._task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        async with self.processor.db_pool.acquire() as conn:
+            self.pharmacy_id = await self.processor._get_pharmacy_id(conn)
+            await self.processor.category_cache.load(conn)
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, url: str, breadcrumbs: list[str], data: dict | None, meta: tuple = (None, None, None)):
+        """
+        Queues one parsed product. Waits while the queue is full.
+        `data=None` only refreshes the crawl metadata (ETag, Last-Modified, hash) of the URL.
+        """
+        await self.queue.put((url, breadcrumbs, data, meta))
+
+    async def close(self):
+        """Flushes everything still queued and stops the writer."""
+        if self._task:
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch, deadline = [], None
+        while True:
+            try:
+                timeout = deadline - loop.time() if batch else None
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._flush(batch)
+                batch = []
+                continue
+
+            if item is None:
+                break
+            if not batch:
+                deadline = loop.time() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        """Writes one batch: COPY into a staging table, then a single merge."""
+        try:
+            async with self.processor.db_pool.acquire() as conn:
+                # Categories are resolved outside the batch transaction, so a failed
+                # merge never leaves IDs of rolled-back rows in the category cache.
+                category_ids = {}
+                for _, breadcrumbs, data, _ in batch:
+                    path = tuple(breadcrumbs)
+                    if data and path not in category_ids:
+                        category_ids[path] = await self.processor._get_or_create_category_id(breadcrumbs, conn)
+
+                records = []
+                for seq, (url, breadcrumbs, data, meta) in enumerate(batch):
+                    if data:
+                        product = (data['name'], data['description'], data['image_url'], category_ids[tuple(breadcrumbs)], data['price'])
+                    else:
+                        product = (None, None, None, None, None)
+                    records.append((seq, url, *product, *meta))
+
+                async with conn.transaction():
+                    await copy_to_staging(conn, 'staging_products', STAGING_COLUMNS, records)
+                    changed = await conn.fetch(MERGE_SQL, self.pharmacy_id)
+                    await conn.execute(META_MERGE_SQL)
+                    changed += await conn.fetch(UNSTALE_SQL, self.pharmacy_id)
+        except Exception as e:
+            print(f"❌ Batch write failed ({len(batch)} products): {e}")
+            for url, breadcrumbs, _, _ in batch:
+                await self.processor.log_error(url, breadcrumbs, f"DB write failed: {e}", TRANSIENT)
+                self.processor.mark(url, FAILED)
+            return
+
+        self.changed_medicine_ids.update(row['medicine_id'] for row in changed)
+        for url, _, _, _ in batch:
+            self.processor.mark(url, DONE)
+        self.saved_count += len(batch)
+        if self.first_saved_at is None:
+            self.first_saved_at = time.monotonic()
+        print(f"💾 Saved batch of {len(batch)} products (total: {self.saved_count}).")
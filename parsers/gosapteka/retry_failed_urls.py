@@ -1,19 +1,18 @@
 import asyncio
 import os
 import glob
-import json
-import httpx
-import asyncpg
-from config import DB_CONFIG, CONCURRENCY_LIMIT
-from parsers.gosapteka.details_processor import DetailsProcessor
+import itertools
+from parsers.error_log import iter_failed_items
+from parsers.fetch_errors import PERMANENT
+from parsers.gosapteka.details_processor import run_details_pipeline
 
 async def main():
     """
     Finds the latest error log, reads the failed URLs,
     and attempts to process them again.
     """
-    # Find the most recent error log file
-    error_logs = glob.glob('log_error_*.json')
+    # Find the most recent error log file (JSON Lines, or the old JSON array format)
+    error_logs = glob.glob('log_error_*.jsonl') + glob.glob('log_error_*.json')
     if not error_logs:
         print("🤷 No error logs found. Nothing to retry.")
         return
@@ -21,45 +20,42 @@ async def main():
     latest_log = max(error_logs, key=os.path.getctime)
     print(f"🔁 Retrying failed URLs from: {latest_log}")
 
+    # Opening the log and reading its first entry up front (the old JSON array
+    # format is parsed whole here) keeps a bad log from ever reaching the pipeline
     try:
-        with open(latest_log, 'r', encoding='utf-8') as f:
-            failed_items = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        print(f"❌ Could not read or parse {latest_log}.")
+        entries = iter_failed_items(latest_log)
+        first = next(entries, None)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read or parse {latest_log}: {e}")
         return
-
-    if not failed_items:
-        print(f"✅ Log file '{latest_log}' is empty. Nothing to do.")
-        return
-
-    # --- Standard setup for the parser ---
-    db_pool = None
-    try:
-        db_pool = await asyncpg.create_pool(**DB_CONFIG)
-        print("✅ Database connection established.")
-    except Exception as e:
-        print(f"❌ Critical Error: Could not connect to the database: {e}")
+    if first is None:
+        print(f"🤷 {latest_log} is empty. Nothing to retry.")
         return
 
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-    async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
-        processor = DetailsProcessor(session, db_pool)
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-
-        async def worker(item):
-            async with semaphore:
-                # The processor's log_error method will automatically handle
-                # URLs that fail again, adding them to today's log.
-                await processor.process_item(item['url'], item['breadcrumbs'])
-
-        tasks = [worker(item) for item in failed_items]
-        print(f"🚀 Relaunching processing for {len(tasks)} failed items...")
-        await asyncio.gather(*tasks)
-
-    if db_pool:
-        await db_pool.close()
-
-    print("\n🎉 Retry process finished.")
+    counts = {'retried': 0, 'permanent': 0}
+
+    def retryable_items():
+        # Streams the log, deduplicated by URL. Permanent failures (404/410)
+        # will not succeed on a retry; entries from older logs have no
+        # error class and are retried as before.
+        try:
+            for item in itertools.chain([first], entries):
+                if item.get('error_class') == PERMANENT:
+                    counts['permanent'] += 1
+                    continue
+                counts['retried'] += 1
+                yield {'url': item['url'], 'breadcrumbs': item['breadcrumbs']}
+        except (OSError, ValueError) as e:
+            # Only reading the log is handled here; pipeline errors propagate
+            print(f"❌ Stopped reading {latest_log}: {e}")
+
+    # The processor's log_error method will automatically handle
+    # URLs that fail again, adding them to today's log.
+    print("🚀 Relaunching processing for failed items...")
+    await run_details_pipeline(retryable_items())
+
+    print(f"⏭️ Skipped {counts['permanent']} permanently failed URLs.")
+    print(f"\n🎉 Retry process finished. Retried {counts['retried']} URLs.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
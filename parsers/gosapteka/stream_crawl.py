@@ -0,0 +1,105 @@
+# parsers/gosapteka/stream_crawl.py
+import asyncio
+import time
+import asyncpg
+import httpx
+from ..bulk_db import publish_price_changes
+from ..crawl_metadata import CrawlMetadata
+from .details_processor import DetailsProcessor, build_details_pipeline, load_url_diffs, mark_removed_stale
+from .product_sink import ProductSink
+from .url_collector import _make_collector, _close_collector, crawl_catalog
+from .url_index import deepest_path
+from config import DB_CONFIG, PIPELINE_QUEUE_SIZE
+
+
+async def stream_urls_and_details():
+    """
+    Fused Stage 1 + Stage 2. The category crawler pushes product URLs onto a
+    bounded queue as soon as each listing page is parsed, and the details
+    pipeline consumes them at the same time. Both sides share one HTTP client,
+    one rate budget, one parse pool and one error log, and every product is
+    queued only once even if it shows up in several categories.
+    """
+    started = time.monotonic()
+    try:
+        db_pool = await asyncpg.create_pool(**DB_CONFIG)
+    except Exception as e:
+        print(f"❌ Critical Error: Could not connect to the database: {e}")
+        return
+
+    # Bounded: when the details side falls behind, the crawler waits instead of piling up URLs
+    handoff = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    queued = set()
+
+    async def on_links(links: list[str], breadcrumbs: list[str]):
+        for url in links:
+            if url not in queued:
+                queued.add(url)
+                # Same breadcrumbs as Stage 2 (deepest path the index knows), not whichever
+                # category got here first: they feed medicines.category_id and the content hash
+                paths = collector.index.lookup(url) + [breadcrumbs]
+                await handoff.put({'url': url, 'breadcrumbs': deepest_path(paths)})
+
+    async def source():
+        while (item := await handoff.get()) is not None:
+            yield item
+
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+    processor, crawl_ok = None, False
+    try:
+        async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
+            collector = _make_collector(session)
+            collector.on_links = on_links
+            processor = DetailsProcessor(session, db_pool)
+            processor.sink = ProductSink(processor)
+            processor.rate_controller = collector.rate_controller
+            processor.retry_budget = collector.retry_budget
+            processor.archive = collector.archive
+            processor.parse_stage = collector.parse_stage
+            processor.error_log = collector.error_log
+            processor.crawl_meta = CrawlMetadata()
+
+            async def crawl() -> bool:
+                try:
+                    return await crawl_catalog(collector)
+                finally:
+                    await handoff.put(None)
+
+            crawl_task = None
+            try:
+                async with db_pool.acquire() as conn:
+                    await processor.crawl_meta.load(conn)
+                pipeline = build_details_pipeline(processor)
+                crawl_task = asyncio.create_task(crawl())
+                async with processor.sink:
+                    await pipeline.run(source())
+                try:
+                    crawl_ok = await crawl_task
+                except Exception as e:
+                    # The prices already saved still count; only the removal step needs a full crawl
+                    print(f"❌ Catalog crawl failed: {e!r}. Removed products are not marked stale this run.")
+            finally:
+                if crawl_task and not crawl_task.done():
+                    crawl_task.cancel()
+                if collector.archive:
+                    collector.archive.evict()
+                await _close_collector(collector)
+
+            processor.print_summary()
+            if processor.sink.first_saved_at is not None:
+                print(f"⏱️ First price in the DB after {processor.sink.first_saved_at - started:.1f}s")
+            print(f"⏱️ Stream run took {time.monotonic() - started:.1f}s for {len(queued)} unique products.")
+    finally:
+        # Runs even when the run failed half-way: the API caches must drop the prices it did change
+        try:
+            async with db_pool.acquire() as conn:
+                changed_ids = set(processor.sink.changed_medicine_ids) if processor else set()
+                if crawl_ok:
+                    _, removed = load_url_diffs()
+                    if removed:
+                        stale_ids = await mark_removed_stale(conn, removed)
+                        print(f"🕸️ Marked {len(stale_ids)} prices of removed products as stale.")
+                        changed_ids |= stale_ids
+                await publish_price_changes(conn, changed_ids)
+        finally:
+            await db_pool.close()
@@ -3,18 +3,50 @@ import asyncio
 import json
 import os
 import random
-from urllib.parse import urljoin
+import re
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
 import httpx
 from bs4 import BeautifulSoup, Tag
 from ..base_parser import BaseParser
-from config import CONCURRENCY_LIMIT, DELAY_BETWEEN_PAGES, DELAY_BETWEEN_CATEGORIES, URLS_DIR
+from ..fetch_errors import FetchError, TRANSIENT, backoff_delay
+from ..html_archive import HtmlArchive
+from ..rate_control import RateController
+from .html_parsing import extract_product_links, find_next_page, parse_category_page, build_page_url
+from .url_index import UrlIndex
+from config import FETCH_MAX_RETRIES, CONCURRENCY_LIMIT, DELAY_BETWEEN_PAGES, DELAY_BETWEEN_CATEGORIES, HTML_ARCHIVE_ENABLED, ADAPTIVE_RATE_LIMIT, SITEMAP_CHANGES_FILE, SITEMAP_STATE_FILE, URL_DIFFS_DIR
+
+GZIP_MAGIC = b'\x1f\x8b'
+# Product pages look like /catalog/<slug>.html; listings end with a slash
+PRODUCT_URL_RE = re.compile(r'^/catalog/[^/]+\.html$')
+# Products that disappeared from the whole catalog in the last Stage 1 run
+REMOVED_FILE = '_removed.json'
+# Pseudo-category for new sitemap products; Stage 2 moves them to the category
+# their breadcrumbs link to, if it is a known one
+UNCATEGORIZED_URL = 'bez_kategorii'
+UNCATEGORIZED_PATH = ['Без категории']
 
 class UrlCollector(BaseParser):
     # ... (all class methods like _recursive_parse_menu, _get_category_structure, etc.)
     """Parses the category structure and collects all product URLs."""
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.parsed_links = set()
+        # Bounds concurrent page downloads when there is no rate controller
+        self.page_semaphore = None
+        # Product URL index shared by all categories, attached by the orchestrator
+        self.index = None
+        # Previous Stage 1 manifests (category URL -> URLs) and what this run saved
+        self.previous_manifests = {}
+        self.current_urls = set()
+        self.saved_categories = set()
+        # Categories where some listing page failed (treated like failed categories)
+        self.incomplete_categories = set()
+        # Optional async callback(links, breadcrumbs), called as soon as each page is parsed
+        self.on_links = None
+        # Sitemaps that could not be read in this run (their changes are unknown)
+        self.sitemap_failures = 0
 
     def _recursive_parse_menu(self, element: Tag, breadcrumbs: list):
         """Recursively parses the menu to build a category tree."""
@@ -55,67 +87,370 @@ class UrlCollector(BaseParser):
 
     def _extract_links_from_page(self, html: str) -> list[str]:
         """Extracts product links from a category page."""
-        soup = BeautifulSoup(html, 'html.parser')
-        links = soup.select('a.product-mini__title-link, a.product-mini__picture')
-        return list(set(urljoin(self.base_url, link.get('href')) for link in links if link.get('href')))
+        return extract_product_links(html, self.base_url)
 
     def _find_next_page(self, html: str) -> str | None:
         """Finds the link to the next page in the pagination."""
-        soup = BeautifulSoup(html, 'html.parser')
-        next_btn = soup.find('a', class_='modern-page-next')
-        return urljoin(self.base_url, next_btn['href']) if next_btn and next_btn.get('href') else None
+        return find_next_page(html, self.base_url)
+
+    async def _fetch_category_page(self, url: str) -> dict | None:
+        """Downloads and parses one category page (links + pagination in a single parse)."""
+        if self.page_semaphore:
+            async with self.page_semaphore:
+                html = await self.fetch_html(url)
+        else:
+            html = await self.fetch_html(url)
+        if not html:
+            return None
+        return await self.parse_stage.run(parse_category_page, html, self.base_url)
+
+    async def _iter_category_pages(self, start_url: str, status: dict):
+        """
+        Yields parsed pages of a category in page order. When the first page
+        shows the total page count, the rest are fetched concurrently (paced by
+        the rate controller); otherwise the 'next' links are followed one by one.
+        status['complete'] is set only once the last page has been yielded: a page
+        that failed ends the iteration early and leaves it False.
+        """
+        status['complete'] = False
+        print(f"📖 Page #1: {start_url}")
+        first = await self._fetch_category_page(start_url)
+        if not first:
+            return
+        yield first
+
+        current_url, page_num = first['next_url'], 2
+        if first['last_page'] and first['last_page'] > 1:
+            page_urls = [build_page_url(start_url, first['page_param'], n) for n in range(2, first['last_page'] + 1)]
+            print(f"📚 Fetching {len(page_urls)} more pages concurrently for {start_url}")
+            for page in await asyncio.gather(*[self._fetch_category_page(url) for url in page_urls]):
+                if not page:
+                    return
+                yield page
+            # A windowed paginator may not link the real last page yet: keep following 'next'
+            current_url, page_num = page['next_url'], first['last_page'] + 1
+
+        while current_url:
+            if not self.rate_controller:
+                await asyncio.sleep(random.uniform(*DELAY_BETWEEN_PAGES))
+            print(f"📖 Page #{page_num}: {current_url}")
+            page = await self._fetch_category_page(current_url)
+            if not page:
+                return
+            yield page
+            current_url, page_num = page['next_url'], page_num + 1
+        status['complete'] = True
 
     async def _parse_single_category(self, category_info: dict):
-        """Parses all pages of a single category and saves the links to a file."""
+        """
+        Parses all pages of a single category and saves the links to the index.
+        Products already seen in other categories are kept, so the index knows
+        every category a product belongs to; it is still fetched only once in Stage 2.
+        A category whose pages could not all be fetched keeps its previous manifest
+        (the products found are only added), so its missing pages remove nothing.
+        """
         start_url = category_info['url']
         breadcrumbs = category_info['breadcrumbs']
         print(f"\n🚀 Parsing category: {' -> '.join(breadcrumbs)}")
         
-        current_url, page_num = start_url, 1
         category_links = []
-        while current_url:
-            print(f"📖 Page #{page_num}: {current_url}")
-            html = await self.fetch_html(current_url)
-            if not html: break
-
-            page_links = self._extract_links_from_page(html)
-            new_links = [link for link in page_links if link not in self.parsed_links]
+        seen = set()
+        status = {}
+        async for page in self._iter_category_pages(start_url, status):
+            new_links = [link for link in page['links'] if link not in seen]
             
             if not new_links:
+                # The site repeats the last page past the end: that is a complete category
                 print("⛔ No new products found, finishing category.")
+                status['complete'] = True
                 break
             
             category_links.extend(new_links)
-            self.parsed_links.update(new_links)
-            
-            current_url = self._find_next_page(html)
-            page_num += 1
-            await asyncio.sleep(random.uniform(*DELAY_BETWEEN_PAGES))
+            seen.update(new_links)
+            if self.on_links:
+                await self.on_links(new_links, breadcrumbs)
         
-        if category_links:
+        if not status['complete']:
+            self.incomplete_categories.add(start_url)
+            print(f"⚠️ '{breadcrumbs[-1]}' was not crawled to the end; its previous manifest is kept.")
+            if category_links:
+                self.index.add_products(start_url, breadcrumbs, category_links)
+        elif category_links:
             self._save_results(category_links, start_url, breadcrumbs)
 
+    async def _iter_sitemap_entries(self, url: str):
+        """
+        Streams one sitemap (plain or gzip) and yields (kind, loc, lastmod),
+        where kind is 'sitemap' for sitemap index entries and 'url' otherwise.
+        The XML is parsed incrementally, so big sitemaps never sit in memory.
+        """
+        parser = ElementTree.XMLPullParser(events=('end',))
+        decompressor = None
+        first_chunk = True
+        async with self.stream_response(url, timeout=60) as response:
+            async for chunk in response.aiter_bytes():
+                if first_chunk:
+                    first_chunk = False
+                    if chunk[:2] == GZIP_MAGIC:
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+                for entry in _read_sitemap_events(parser):
+                    yield entry
+        parser.close()
+        for entry in _read_sitemap_events(parser):
+            yield entry
+
+    async def _iter_sitemap_entries_retrying(self, url: str):
+        """
+        _iter_sitemap_entries with the same in-line retries as fetch_page. A retry
+        re-reads the sitemap from the start and skips the entries already yielded.
+        """
+        attempt, yielded = 0, 0
+        while True:
+            skip = yielded
+            try:
+                async for entry in self._iter_sitemap_entries(url):
+                    if skip:
+                        skip -= 1
+                        continue
+                    yielded += 1
+                    yield entry
+                return
+            except FetchError as e:
+                if e.kind != TRANSIENT or attempt >= FETCH_MAX_RETRIES or not self.retry_budget.try_spend(url):
+                    raise
+                delay = backoff_delay(attempt, e.retry_after)
+                attempt += 1
+                print(f"🔁 Retry {attempt}/{FETCH_MAX_RETRIES} for sitemap {url} in {delay:.1f}s ({e})")
+                await asyncio.sleep(delay)
+
+    async def _iter_sitemap_urls(self, sitemap_url: str, since: datetime | None):
+        """
+        Walks a sitemap (index) tree and yields (url, lastmod) for pages changed since `since`.
+        Sitemaps that still fail after the retries are counted in `sitemap_failures`.
+        """
+        pending, seen = [sitemap_url], set()
+        while pending:
+            url = pending.pop(0)
+            if url in seen:
+                continue
+            seen.add(url)
+            print(f"🗺️ Reading sitemap: {url}")
+            try:
+                async for kind, loc, lastmod in self._iter_sitemap_entries_retrying(url):
+                    if since and lastmod and lastmod < since:
+                        continue
+                    if kind == 'sitemap':
+                        pending.append(loc)
+                    else:
+                        yield loc, lastmod
+            except (FetchError, ElementTree.ParseError, zlib.error) as e:
+                self.sitemap_failures += 1
+                print(f"🚫 Sitemap error {url}: {e}")
+
     def _save_results(self, links: list, url: str, breadcrumbs: list[str]):
-        """Saves the found links and their category path to a JSON file."""
-        slug = url.strip('/').split('/')[-1] or "home"
-        filepath = os.path.join(URLS_DIR, f"{slug}.json")
-        output = {'category_url': url, 'breadcrumbs': breadcrumbs, 'product_urls': sorted(links)}
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
-        print(f"💾 Saved {len(links)} URLs for '{breadcrumbs[-1]}' to {filepath}")
+        """Replaces the category's product list in the URL index and writes its diff."""
+        self.index.set_category(url, breadcrumbs, links)
+        print(f"💾 Saved {len(links)} URLs for '{breadcrumbs[-1]}' to the URL index")
+        self._save_diff(url, links)
+
+    def _save_diff(self, url: str, links: list):
+        """Writes the added/removed/unchanged diff of a category against the previous manifest."""
+        slug = _category_slug(url)
+        current = set(links)
+        previous = self.previous_manifests.get(url, set())
+        diff = {
+            'added': sorted(current - previous),
+            'removed': sorted(previous - current),
+            'unchanged': sorted(current & previous),
+        }
+        with open(os.path.join(URL_DIFFS_DIR, f"{slug}.json"), 'w', encoding='utf-8') as f:
+            json.dump(diff, f, ensure_ascii=False)
+        self.current_urls.update(current)
+        self.saved_categories.add(url)
+        print(f"   Δ {slug}: +{len(diff['added'])} -{len(diff['removed'])} ={len(diff['unchanged'])}")
+
+    def _save_removed(self, categories: list):
+        """
+        Writes the URLs that vanished from the whole catalog to diffs/_removed.json.
+        Categories that failed to crawl this run, fully or on any page, keep their old
+        manifest, and their products still count as present, so a flaky run never removes anything.
+        Categories that are gone from the menu are dropped from the index, and
+        so are the products left without any category.
+        """
+        menu_urls = {cat['url'] for cat in categories}
+        candidates, still_present = set(), set()
+        for url, urls in self.previous_manifests.items():
+            if url in self.saved_categories:
+                candidates |= urls
+            elif url not in menu_urls:
+                candidates |= urls
+                self.index.remove_category(url)
+                print(f"🗑️ Category '{_category_slug(url)}' is gone from the menu.")
+            else:
+                still_present |= urls
+
+        removed = sorted(candidates - self.current_urls - still_present)
+        self.index.prune_orphans()
+        with open(os.path.join(URL_DIFFS_DIR, REMOVED_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'collected_at': datetime.now(timezone.utc).isoformat(), 'removed': removed}, f, ensure_ascii=False)
+        print(f"🗑️ {len(removed)} products disappeared from the catalog.")
+
+
+def _make_collector(session: httpx.AsyncClient) -> UrlCollector:
+    collector = UrlCollector(session)
+    collector.index = UrlIndex()
+    if ADAPTIVE_RATE_LIMIT:
+        collector.rate_controller = RateController()
+    else:
+        collector.page_semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    if HTML_ARCHIVE_ENABLED:
+        collector.archive = HtmlArchive()
+    return collector
+
+
+async def _close_collector(collector: UrlCollector):
+    collector.parse_stage.close()
+    await collector.error_log.close()
+    if collector.rate_controller:
+        print(f"🚦 Rate control: {collector.rate_controller.describe()}")
+    if collector.archive:
+        collector.archive.close()
+    if collector.index:
+        collector.index.close()
+
+
+async def crawl_catalog(collector: UrlCollector) -> bool:
+    """
+    Paginates every menu category into the URL index, writes the per-category
+    diffs and the list of removed products. Returns False if the menu is missing.
+    """
+    os.makedirs(URL_DIFFS_DIR, exist_ok=True)
+    collector.previous_manifests = collector.index.category_manifests()
+    categories = await collector._get_category_structure()
+    if not categories:
+        print("❌ Category menu not found; previous manifests are left untouched.")
+        return False
+    # Diffs describe only the latest run
+    for filename in os.listdir(URL_DIFFS_DIR):
+        os.remove(os.path.join(URL_DIFFS_DIR, filename))
+
+    # With adaptive rate control the controller paces requests, so the
+    # category pool is sized by the host's hard cap and fixed delays are skipped.
+    limit = collector.rate_controller.max_concurrency(collector.base_url) if collector.rate_controller else CONCURRENCY_LIMIT
+    semaphore = asyncio.Semaphore(limit)
+    async def worker(cat_info):
+        async with semaphore:
+            await collector._parse_single_category(cat_info)
+            if not collector.rate_controller:
+                await asyncio.sleep(random.uniform(*DELAY_BETWEEN_CATEGORIES))
+
+    await asyncio.gather(*[worker(cat) for cat in categories])
+    collector._save_removed(categories)
+    return True
 
 
 async def collect_urls_to_files():
-    """Main orchestrator function for collecting URLs."""
+    """
+    Main orchestrator function for collecting URLs into the URL index.
+    The previous manifests are kept: every category gets an added/removed/unchanged
+    diff, and products gone from the whole catalog are listed for Stage 2.
+    """
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
     async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
-        collector = UrlCollector(session)
-        categories = await collector._get_category_structure()
+        collector = _make_collector(session)
+        try:
+            await crawl_catalog(collector)
+        finally:
+            await _close_collector(collector)
+
+
+async def collect_urls_from_sitemap(base_url: str | None = None, since: datetime | None = None):
+    """
+    Alternative to Stage 1: discovers changed product URLs from sitemap.xml
+    instead of paginating every category, and writes them to SITEMAP_CHANGES_FILE.
+    Only products with a lastmod after `since` (by default the previous sitemap
+    run) are selected. Category membership comes from the URL index. New products are
+    filed under UNCATEGORIZED_URL without downloading them here: Stage 2 fetches them
+    anyway and moves them to the menu category their breadcrumbs link to.
+    `base_url` lets the collector run against a local stand-in serving fixture sitemaps.
+    """
+    run_started = datetime.now(timezone.utc)
+    if since is None:
+        since = _load_sitemap_state()
+    print(f"🗺️ Sitemap discovery, changes since: {since.isoformat() if since else 'the beginning'}")
+
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+    async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
+        collector = _make_collector(session)
+        if base_url:
+            collector.base_url = base_url.rstrip('/')
+        try:
+            # The menu categories are registered so Stage 2 can match breadcrumbs against them
+            for cat in await collector._get_category_structure():
+                collector.index.add_products(cat['url'], cat['breadcrumbs'], [])
+            changed, new_urls = [], []
+            async for url, _ in collector._iter_sitemap_urls(collector.base_url + '/sitemap.xml', since):
+                if not PRODUCT_URL_RE.search(urlsplit(url).path):
+                    continue
+                changed.append(url)
+                if not collector.index.lookup(url):
+                    new_urls.append(url)
+            if new_urls:
+                collector.index.add_products(UNCATEGORIZED_URL, UNCATEGORIZED_PATH, new_urls)
+        finally:
+            await _close_collector(collector)
+
+    with open(SITEMAP_CHANGES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(sorted(set(changed)), f)
+
+    print(f"✅ Sitemap discovery found {len(set(changed))} changed products ({len(new_urls)} new).")
+    if collector.sitemap_failures:
+        # Moving the watermark would lose the changes listed in the unread sitemaps for good
+        print(f"⚠️ {collector.sitemap_failures} sitemaps failed; the 'since' watermark is kept, the next run re-reads this window.")
+    else:
+        _save_sitemap_state(run_started)
+
+
+def _read_sitemap_events(parser: ElementTree.XMLPullParser):
+    """Turns finished <url>/<sitemap> elements into (kind, loc, lastmod) tuples."""
+    for _, element in parser.read_events():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag not in ('url', 'sitemap'):
+            continue
+        loc, lastmod = None, None
+        for child in element:
+            child_tag = child.tag.rsplit('}', 1)[-1]
+            if child_tag == 'loc' and child.text:
+                loc = child.text.strip()
+            elif child_tag == 'lastmod' and child.text:
+                lastmod = _parse_lastmod(child.text)
+        # Finished elements are cleared so memory stays flat on huge sitemaps
+        element.clear()
+        if loc:
+            yield ('sitemap' if tag == 'sitemap' else 'url'), loc, lastmod
+
+
+def _parse_lastmod(value: str) -> datetime | None:
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _category_slug(url: str) -> str:
+    return url.strip('/').split('/')[-1] or "home"
+
+
+def _load_sitemap_state() -> datetime | None:
+    try:
+        with open(SITEMAP_STATE_FILE, 'r', encoding='utf-8') as f:
+            return datetime.fromisoformat(json.load(f)['last_run'])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
 
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-        async def worker(cat_info):
-            async with semaphore:
-                await collector._parse_single_category(cat_info)
-                await asyncio.sleep(random.uniform(*DELAY_BETWEEN_CATEGORIES))
 
-        await asyncio.gather(*[worker(cat) for cat in categories])
\ No newline at end of file
+def _save_sitemap_state(run_started: datetime):
+    with open(SITEMAP_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'last_run': run_started.isoformat()}, f)
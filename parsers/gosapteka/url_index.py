@@ -0,0 +1,218 @@
+# parsers/gosapteka/url_index.py
+import json
+import os
+import sqlite3
+from config import URL_INDEX_DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefixes (
+    id INTEGER PRIMARY KEY,
+    prefix TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    prefix_id INTEGER NOT NULL REFERENCES prefixes(id),
+    slug TEXT NOT NULL,
+    UNIQUE (prefix_id, slug)
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL -- JSON list of breadcrumb names
+);
+CREATE TABLE IF NOT EXISTS memberships (
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (product_id, category_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_memberships_category ON memberships (category_id);
+"""
+
+
+class UrlIndex:
+    """
+    Compact, deduplicated index of gosapteka product URLs (SQLite).
+    Every product is stored once, as an interned URL prefix plus a slug,
+    and is linked to all category paths it was found under.
+    """
+    def __init__(self, path: str = URL_INDEX_DB):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self._prefix_ids = {prefix: prefix_id for prefix_id, prefix in self.db.execute("SELECT id, prefix FROM prefixes")}
+
+    @staticmethod
+    def _split(url: str) -> tuple[str, str]:
+        prefix, _, slug = url.rpartition('/')
+        return prefix + '/', slug
+
+    def _prefix_id(self, prefix: str) -> int:
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = self.db.execute("INSERT INTO prefixes (prefix) VALUES (?)", (prefix,)).lastrowid
+            self._prefix_ids[prefix] = prefix_id
+        return prefix_id
+
+    def _product_ids(self, urls) -> list[int]:
+        keys = []
+        for url in urls:
+            prefix, slug = self._split(url)
+            keys.append((self._prefix_id(prefix), slug))
+        self.db.executemany("INSERT OR IGNORE INTO products (prefix_id, slug) VALUES (?, ?)", keys)
+        return [self.db.execute("SELECT id FROM products WHERE prefix_id = ? AND slug = ?", key).fetchone()[0] for key in keys]
+
+    def _category_id(self, category_url: str, breadcrumbs: list[str]) -> int:
+        self.db.execute(
+            "INSERT INTO categories (url, path) VALUES (?, ?) ON CONFLICT (url) DO UPDATE SET path = excluded.path",
+            (category_url, json.dumps(breadcrumbs, ensure_ascii=False))
+        )
+        return self.db.execute("SELECT id FROM categories WHERE url = ?", (category_url,)).fetchone()[0]
+
+    def _add_memberships(self, category_id: int, product_urls):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO memberships (product_id, category_id) VALUES (?, ?)",
+            [(product_id, category_id) for product_id in self._product_ids(product_urls)]
+        )
+
+    def set_category(self, category_url: str, breadcrumbs: list[str], product_urls):
+        """Replaces the product list of one category (its current manifest)."""
+        with self.db:
+            category_id = self._category_id(category_url, breadcrumbs)
+            self.db.execute("DELETE FROM memberships WHERE category_id = ?", (category_id,))
+            self._add_memberships(category_id, product_urls)
+
+    def add_products(self, category_url: str, breadcrumbs: list[str], product_urls):
+        """Adds products to a category without touching its other members."""
+        with self.db:
+            self._add_memberships(self._category_id(category_url, breadcrumbs), product_urls)
+
+    def move_product(self, product_url: str, from_url: str, to_url: str, breadcrumbs: list[str]):
+        """Moves a product from one category to another (e.g. out of the uncategorized one)."""
+        with self.db:
+            self._add_memberships(self._category_id(to_url, breadcrumbs), [product_url])
+            self.db.execute("""
+                DELETE FROM memberships
+                WHERE product_id = ? AND category_id = (SELECT id FROM categories WHERE url = ?)
+            """, (self._product_ids([product_url])[0], from_url))
+
+    def remove_category(self, category_url: str):
+        with self.db:
+            row = self.db.execute("SELECT id FROM categories WHERE url = ?", (category_url,)).fetchone()
+            if row:
+                self.db.execute("DELETE FROM memberships WHERE category_id = ?", row)
+                self.db.execute("DELETE FROM categories WHERE id = ?", row)
+
+    def prune_orphans(self) -> int:
+        """Drops products that no longer belong to any category."""
+        with self.db:
+            return self.db.execute(
+                "DELETE FROM products WHERE id NOT IN (SELECT product_id FROM memberships)"
+            ).rowcount
+
+    def category_manifests(self) -> dict[str, set[str]]:
+        """Returns category URL -> set of product URLs."""
+        manifests = {url: set() for (url,) in self.db.execute("SELECT url FROM categories")}
+        rows = self.db.execute("""
+            SELECT c.url, pr.prefix || p.slug FROM memberships m
+            JOIN categories c ON c.id = m.category_id
+            JOIN products p ON p.id = m.product_id
+            JOIN prefixes pr ON pr.id = p.prefix_id
+        """)
+        for category_url, product_url in rows:
+            manifests[category_url].add(product_url)
+        return manifests
+
+    def category_paths(self) -> dict[str, list[str]]:
+        """Returns category URL -> breadcrumb path."""
+        return {url: json.loads(path) for url, path in self.db.execute("SELECT url, path FROM categories")}
+
+    def lookup(self, url: str) -> list[list[str]]:
+        """Returns every category path of a product (empty if unknown)."""
+        prefix, slug = self._split(url)
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            return []
+        rows = self.db.execute("""
+            SELECT c.path FROM products p
+            JOIN memberships m ON m.product_id = p.id
+            JOIN categories c ON c.id = m.category_id
+            WHERE p.prefix_id = ? AND p.slug = ?
+            ORDER BY c.id
+        """, (prefix_id, slug))
+        return [json.loads(path) for (path,) in rows]
+
+    def iter_products(self):
+        """
+        Streams every product exactly once as {'url', 'breadcrumbs', 'category_paths'}.
+        The deepest category path is used as the product's breadcrumbs.
+        """
+        rows = self.db.execute("""
+            SELECT p.id, pr.prefix || p.slug, c.path FROM products p
+            JOIN prefixes pr ON pr.id = p.prefix_id
+            JOIN memberships m ON m.product_id = p.id
+            JOIN categories c ON c.id = m.category_id
+            ORDER BY p.id, c.id
+        """)
+        current_id, url, paths = None, None, []
+        for product_id, product_url, path in rows:
+            if product_id != current_id:
+                if paths:
+                    yield _product_item(url, paths)
+                current_id, url, paths = product_id, product_url, []
+            paths.append(json.loads(path))
+        if paths:
+            yield _product_item(url, paths)
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def import_json_dir(self, urls_dir: str, structure_file: str = 'categories_structure.json') -> int:
+        """
+        Imports the old per-category JSON files. Files that only carry a
+        `category_name` get their full breadcrumb path from categories_structure.json.
+        """
+        paths = _load_structure_paths(structure_file)
+        imported = 0
+        for filename in sorted(os.listdir(urls_dir)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(urls_dir, filename), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            category_url = data['category_url']
+            breadcrumbs = data.get('breadcrumbs') or paths.get(category_url) or [data.get('category_name', 'Без категории')]
+            self.set_category(category_url, breadcrumbs, data['product_urls'])
+            imported += 1
+        return imported
+
+    def close(self):
+        self.db.close()
+
+
+def deepest_path(paths: list[list[str]]) -> list[str]:
+    """
+    The category path used as a product's breadcrumbs: the deepest one, ties broken
+    by the path itself, so the choice never depends on crawl or row order.
+    """
+    return max(paths, key=lambda path: (len(path), path))
+
+
+def _product_item(url: str, paths: list[list[str]]) -> dict:
+    return {'url': url, 'breadcrumbs': deepest_path(paths), 'category_paths': paths}
+
+
+def _load_structure_paths(structure_file: str) -> dict[str, list[str]]:
+    """Maps category URL -> breadcrumb path from categories_structure.json."""
+    if not os.path.exists(structure_file):
+        return {}
+    with open(structure_file, 'r', encoding='utf-8') as f:
+        structure = json.load(f)
+
+    paths = {}
+    def walk(node: dict, path: list[str]):
+        paths[node['url']] = path
+        for sub in node.get('subcategories', []):
+            walk(sub, path + [sub['name']])
+
+    for name, node in structure.items():
+        walk(node, [name])
+    return paths
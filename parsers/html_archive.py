@@ -0,0 +1,126 @@
+# parsers/html_archive.py
+import asyncio
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from config import HTML_ARCHIVE_DIR, HTML_ARCHIVE_MAX_AGE_DAYS, HTML_ARCHIVE_MAX_BYTES
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional: gzip is always available
+    zstandard = None
+
+
+class HtmlArchive:
+    """
+    Content-addressed, compressed archive of raw HTML responses.
+    Bodies are stored once per SHA-256 digest under `objects/`; a SQLite index
+    maps (url, fetched_at) to the digest, so every fetch of a URL is kept
+    until it is evicted by age or by total size.
+    """
+    def __init__(self, root: str = HTML_ARCHIVE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                digest TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (url, fetched_at)
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries (digest);
+            CREATE INDEX IF NOT EXISTS idx_entries_fetched_at ON entries (fetched_at);
+        """)
+
+    def _object_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.{codec}")
+
+    @staticmethod
+    def _compress(data: bytes) -> tuple[bytes, str]:
+        if zstandard:
+            return zstandard.ZstdCompressor(level=6).compress(data), 'zst'
+        return gzip.compress(data, compresslevel=6), 'gz'
+
+    @staticmethod
+    def _decompress(blob: bytes, codec: str) -> bytes:
+        if codec == 'zst':
+            return zstandard.ZstdDecompressor().decompress(blob)
+        return gzip.decompress(blob)
+
+    def put(self, url: str, html: str):
+        """Stores one response body (blocking; use `store` from async code)."""
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            row = self.db.execute("SELECT codec, size FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if row:
+            codec, size = row
+        else:
+            blob, codec = self._compress(data)
+            size = len(blob)
+            path = self._object_path(digest, codec)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so readers never see a half-written object
+            tmp_path = f"{path}.tmp{threading.get_ident()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (url, time.time(), digest, codec, size))
+
+    def get_latest(self, url: str) -> str | None:
+        """Returns the most recently archived body for a URL (blocking)."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT digest, codec FROM entries WHERE url = ? ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+        if not row:
+            return None
+        digest, codec = row
+        try:
+            with open(self._object_path(digest, codec), 'rb') as f:
+                return self._decompress(f.read(), codec).decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    async def store(self, url: str, html: str):
+        await asyncio.to_thread(self.put, url, html)
+
+    async def load_latest(self, url: str) -> str | None:
+        return await asyncio.to_thread(self.get_latest, url)
+
+    def evict(self, max_age_days: float = HTML_ARCHIVE_MAX_AGE_DAYS, max_bytes: int = HTML_ARCHIVE_MAX_BYTES):
+        """Drops entries older than max_age_days, then the oldest ones until the archive fits max_bytes."""
+        with self._lock, self.db:
+            cutoff = time.time() - max_age_days * 86400
+            removed = self.db.execute("DELETE FROM entries WHERE fetched_at < ?", (cutoff,)).rowcount
+            while True:
+                total = self.db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+                ).fetchone()[0]
+                if total <= max_bytes:
+                    break
+                removed += self.db.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY fetched_at LIMIT 1000)"
+                ).rowcount
+            live = {row[0] for row in self.db.execute("SELECT DISTINCT digest FROM entries")}
+
+        deleted_files = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename.split('.', 1)[0] not in live:
+                    os.remove(os.path.join(dirpath, filename))
+                    deleted_files += 1
+        print(f"🧹 HTML archive: evicted {removed} entries and {deleted_files} objects.")
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,112 @@
+# parsers/json_stream.py
+import gzip
+import json
+from itertools import islice
+
+READ_SIZE = 1 << 16
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _open_text(path: str, mode: str):
+    """Opens a text file, transparently (de)compressing gzip."""
+    if 'r' in mode:
+        with open(path, 'rb') as f:
+            compressed = f.read(2) == GZIP_MAGIC
+    else:
+        compressed = path.endswith('.gz')
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def iter_records(path: str):
+    """
+    Streams the records of a dump without loading it whole: either a JSON array
+    (parsed incrementally, element by element) or JSON Lines. Gzip is detected
+    from the file itself.
+    """
+    with _open_text(path, 'r') as f:
+        head = f.read(READ_SIZE)
+        stripped = head.lstrip()
+        if stripped.startswith('['):
+            yield from _iter_array(f, head)
+            return
+        buffer = head
+        while True:
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+        if buffer.strip():
+            yield json.loads(buffer)
+
+
+def _iter_array(f, buffer: str):
+    decoder = json.JSONDecoder()
+    pos = buffer.index('[') + 1
+    eof = False
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if pos >= len(buffer):
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The element is cut by the read boundary: read more, unless there is nothing left
+                if eof:
+                    raise
+                break
+            # A scalar touching the end of the buffer (e.g. "12" of "12345") may continue in the next read
+            if end == len(buffer) and not eof:
+                break
+            yield record
+            pos = end
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            eof = True
+        buffer += chunk
+
+
+def iter_chunks(records, size: int):
+    """Groups an iterable into lists of at most `size` items."""
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class RecordWriter:
+    """
+    Writes records as compact JSON Lines, one record per line.
+    A path ending in .gz is gzip-compressed on the fly.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = _open_text(self.path, 'w')
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
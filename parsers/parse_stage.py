@@ -0,0 +1,43 @@
+# parsers/parse_stage.py
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup
+from config import HTML_PARSER, PARSE_WORKERS
+
+try:
+    import lxml  # noqa: F401
+    _PARSER = HTML_PARSER
+except ImportError:
+    # lxml is optional: fall back to the pure-Python parser
+    _PARSER = 'html.parser'
+
+
+def make_soup(html: str) -> BeautifulSoup:
+    """Builds a BeautifulSoup tree with the fastest available backend."""
+    return BeautifulSoup(html, _PARSER)
+
+
+class ParseStage:
+    """
+    Pluggable stage for CPU-bound HTML parsing.
+    Parse functions receive raw HTML and return a small picklable result, so they
+    can run in a process pool without stalling the event loop.
+    With workers=0 the functions run inline (handy for debugging).
+    """
+    def __init__(self, workers: int = PARSE_WORKERS):
+        self.workers = workers
+        self._executor = None
+
+    async def run(self, func, *args):
+        """Runs a module-level parse function and returns its result."""
+        if not self.workers:
+            return func(*args)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
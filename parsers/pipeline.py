@@ -0,0 +1,98 @@
+# parsers/pipeline.py
+import asyncio
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_REPORT_INTERVAL
+
+
+class Stage:
+    """One pipeline stage: a bounded input queue and a fixed pool of workers."""
+    def __init__(self, name: str, func, workers: int, queue_size: int):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def stats(self) -> str:
+        return (f"{self.name}: queue={self.queue.qsize()}/{self.queue.maxsize} "
+                f"ok={self.processed} dropped={self.dropped} failed={self.failed}")
+
+
+class Pipeline:
+    """
+    Streaming pipeline of async stages connected by bounded queues.
+    Each stage function takes an item and returns the item for the next stage,
+    or None to drop it. Because every queue is bounded, the source is consumed
+    only as fast as the slowest stage and memory stays flat.
+    """
+    def __init__(self, report_interval: float = PIPELINE_REPORT_INTERVAL):
+        self.stages: list[Stage] = []
+        self.report_interval = report_interval
+
+    def add_stage(self, name: str, func, workers: int, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.stages.append(Stage(name, func, workers, queue_size))
+        return self
+
+    async def run(self, source):
+        """Feeds items from a (sync or async) iterable through all stages."""
+        next_stages = self.stages[1:] + [None]
+        for stage, next_stage in zip(self.stages, next_stages):
+            stage.tasks = [asyncio.create_task(self._worker(stage, next_stage)) for _ in range(stage.workers)]
+        monitor = asyncio.create_task(self._monitor())
+
+        try:
+            await self._feed(source)
+            # Drain stage by stage: once a queue is joined, everything it held
+            # has been handed to the next queue, so its workers can be stopped.
+            for stage in self.stages:
+                await stage.queue.join()
+                await self._stop(stage)
+        finally:
+            monitor.cancel()
+            for stage in self.stages:
+                await self._stop(stage)
+
+        print(f"📊 Pipeline finished | {self.report()}")
+
+    def report(self) -> str:
+        return " | ".join(stage.stats() for stage in self.stages)
+
+    async def _feed(self, source):
+        first = self.stages[0].queue
+        if hasattr(source, '__aiter__'):
+            async for item in source:
+                await first.put(item)
+        else:
+            for item in source:
+                await first.put(item)
+
+    async def _worker(self, stage: Stage, next_stage: Stage | None):
+        while True:
+            item = await stage.queue.get()
+            try:
+                result = await stage.func(item)
+                if result is None:
+                    stage.dropped += 1
+                else:
+                    stage.processed += 1
+                    if next_stage:
+                        await next_stage.queue.put(result)
+            except Exception as e:
+                stage.failed += 1
+                print(f"❌ Stage '{stage.name}' failed on an item: {e}")
+            finally:
+                stage.queue.task_done()
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(f"📊 {self.report()}")
+
+    @staticmethod
+    async def _stop(stage: Stage):
+        for task in stage.tasks:
+            task.cancel()
+        await asyncio.gather(*stage.tasks, return_exceptions=True)
+        stage.tasks = []
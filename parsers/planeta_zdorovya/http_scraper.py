@@ -0,0 +1,180 @@
+# parsers/planeta_zdorovya/http_scraper.py
+import asyncio
+import time
+from collections import Counter
+import httpx
+from ..base_parser import BaseParser
+from ..json_stream import RecordWriter
+from ..rate_control import RateController
+from .listing_parsing import is_priceless, parse_category_links, parse_listing_page
+from config import ADAPTIVE_RATE_LIMIT, CONCURRENCY_LIMIT, PLANETA_DUMP_FILE
+
+PLANETA_URL = "https://planetazdorovo.ru"
+
+
+class BrowserFallback:
+    """
+    Playwright, started only when the first page needs it. Playwright is imported
+    lazily, so HTTP-only runs work on machines without a browser installed.
+    """
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._pool = None
+
+    async def fetch(self, url: str) -> str | None:
+        """Renders a listing page, scrolls until the cards stop loading and returns its HTML."""
+        try:
+            from . import test as browser_scraper
+        except ImportError as e:
+            print(f"❌ Browser fallback unavailable for {url}: {e}")
+            return None
+
+        async with self._lock:
+            if self._pool is None:
+                await self._start(browser_scraper)
+        async with self._pool.page() as page:
+            try:
+                if not await browser_scraper.goto_with_retries(page, url):
+                    return None
+                await page.wait_for_selector('div.pz-grid-list', timeout=30000)
+                await browser_scraper.scroll_until_cards_stable(page)
+                return await page.content()
+            except Exception as e:
+                print(f"❌ Browser fallback failed for {url}: {e}")
+                return None
+
+    async def _start(self, browser_scraper):
+        print("🌐 Starting Playwright for pages the HTTP path could not complete...")
+        self._playwright = await browser_scraper.async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        context = await self._browser.new_context()
+        await context.route("**/*", browser_scraper.block_heavy_resources)
+        self._pool = browser_scraper.PagePool(context)
+        await self._pool.start()
+
+    async def close(self):
+        if self._pool:
+            await self._pool.close()
+            await self._browser.close()
+            await self._playwright.stop()
+
+
+class PlanetaHttpScraper(BaseParser):
+    """
+    Scrapes Planeta Zdorovya listings with plain HTTP requests and the same card
+    selectors as the Playwright scraper. Pages whose server-rendered HTML comes
+    back incomplete (no grid, no cards, several cards without prices, or fewer
+    cards than the first page although more pages follow) are re-rendered in the browser.
+    """
+    def __init__(self, session: httpx.AsyncClient, base_url: str = PLANETA_URL):
+        super().__init__(session)
+        self.base_url = base_url.rstrip('/')
+        self.fallback = BrowserFallback()
+        self.stats = Counter()
+        # Cards without a price a page may hold and still count as complete
+        self.max_missing_prices = 1
+        # Links of priceless cards the browser showed without a price too (out of
+        # stock). They no longer count as missing prices; any other priceless card does.
+        self.out_of_stock = set()
+
+    async def get_category_urls(self) -> list[str]:
+        html = await self.fetch_html(f"{self.base_url}/catalog/")
+        if not html:
+            html = await self.fallback.fetch(f"{self.base_url}/catalog/")
+        return parse_category_links(html, self.base_url) if html else []
+
+    async def scrape_category(self, category_url: str) -> list[dict]:
+        """Scrapes every page of a category; pages 2..N are fetched concurrently."""
+        first = await self._fetch_listing(category_url, 1, None, None)
+        if not first:
+            return []
+        expected = len(first['products'])
+        rest = await asyncio.gather(*[
+            self._fetch_listing(category_url, page_num, first['last_page'], expected)
+            for page_num in range(2, first['last_page'] + 1)
+        ])
+        products = [product for page in [first, *rest] if page for product in page['products']]
+        print(f"--- ✅ {category_url}: {first['last_page']} pages, {len(products)} products ---")
+        return products
+
+    async def _fetch_listing(self, category_url: str, page_num: int, last_page: int | None, expected: int | None) -> dict | None:
+        page_url = category_url if page_num == 1 else f"{category_url}?PAGEN_1={page_num}"
+        html = await self.fetch_html(page_url)
+        listing = await self.parse_stage.run(parse_listing_page, html, self.base_url) if html else None
+        if listing and _is_complete(listing, page_num, last_page, expected, self.max_missing_prices, self.out_of_stock):
+            self.stats['http'] += 1
+            return listing
+
+        html = await self.fallback.fetch(page_url)
+        rendered = await self.parse_stage.run(parse_listing_page, html, self.base_url) if html else None
+        if rendered:
+            if listing and not _render_added_anything(listing, rendered):
+                # The HTTP page was already complete: its priceless cards are out of stock
+                self.stats['browser_unneeded'] += 1
+                self.out_of_stock.update(product['link'] for product in listing['products'] if is_priceless(product))
+            else:
+                self.stats['browser'] += 1
+            return rendered
+        # Without a rendered page, whatever the HTTP response held is better than nothing
+        self.stats['partial' if listing else 'failed'] += 1
+        return listing
+
+
+def _is_complete(listing: dict, page_num: int, last_page: int | None, expected: int | None,
+                 max_missing_prices: int = 1, out_of_stock: set = frozenset()) -> bool:
+    if not listing['has_grid'] or not listing['products']:
+        return False
+    missing = sum(1 for product in listing['products'] if is_priceless(product) and product['link'] not in out_of_stock)
+    if missing > max_missing_prices:
+        return False
+    # Only the last page of a category may hold fewer cards than the first one
+    if expected and last_page and page_num < last_page and len(listing['products']) < expected:
+        return False
+    return True
+
+
+def _render_added_anything(listing: dict, rendered: dict) -> bool:
+    """Whether the browser found more cards or more prices than the HTTP response had."""
+    return (len(rendered['products']) > len(listing['products'])
+            or rendered['missing_prices'] < listing['missing_prices'])
+
+
+async def scrape_catalog_http(base_url: str = PLANETA_URL, output_path: str = PLANETA_DUMP_FILE):
+    """
+    Scrapes the whole catalog over HTTP and writes the products as JSON Lines.
+    `base_url` lets the scraper run against a local server with recorded pages.
+    """
+    started = time.monotonic()
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'}
+    async with httpx.AsyncClient(headers=headers, follow_redirects=True) as session:
+        scraper = PlanetaHttpScraper(session, base_url)
+        if ADAPTIVE_RATE_LIMIT:
+            scraper.rate_controller = RateController()
+        try:
+            category_urls = await scraper.get_category_urls()
+            print(f"Найдено {len(category_urls)} категорий для скрейпинга.")
+
+            # The rate controller paces requests; the semaphore only caps categories in flight
+            limit = scraper.rate_controller.max_concurrency(base_url) if scraper.rate_controller else CONCURRENCY_LIMIT
+            semaphore = asyncio.Semaphore(limit)
+            async def worker(url):
+                async with semaphore:
+                    return await scraper.scrape_category(url)
+
+            with RecordWriter(output_path) as writer:
+                for products in asyncio.as_completed([worker(url) for url in category_urls]):
+                    writer.write_many(await products)
+        finally:
+            scraper.parse_stage.close()
+            await scraper.error_log.close()
+            await scraper.fallback.close()
+
+    elapsed = time.monotonic() - started
+    pages = sum(scraper.stats.values())
+    print(f"🎉 Всего собрано товаров: {writer.count} -> {output_path}")
+    print(f"📈 {pages} страниц за {elapsed:.0f} с ({pages / elapsed * 60 if elapsed else 0:.1f} стр/мин): "
+          f"HTTP {scraper.stats['http']}, браузер {scraper.stats['browser']} "
+          f"(+{scraper.stats['browser_unneeded']} без пользы), "
+          f"неполных {scraper.stats['partial']}, ошибок {scraper.stats['failed']}")
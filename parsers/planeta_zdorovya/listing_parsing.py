@@ -0,0 +1,74 @@
+# parsers/planeta_zdorovya/listing_parsing.py
+# Pure parse functions for Planeta Zdorovya listing pages, shared by the
+# Playwright scraper and the HTTP fast path. They are module-level so that
+# ParseStage can ship them to worker processes.
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+GRID_SELECTOR = 'div.pz-grid-list'
+CARD_SELECTOR = 'div.pz-grid-list .pz-grid-item .item-card'
+
+
+def scrape_products_from_page(page_content, base_url):
+    """Парсит HTML-контент для извлечения данных о продуктах."""
+    soup = BeautifulSoup(page_content, 'html.parser')
+    return _products(soup, base_url)
+
+
+def _products(soup: BeautifulSoup, base_url: str) -> list[dict]:
+    products = []
+    product_cards = soup.select(CARD_SELECTOR)
+
+    for card in product_cards:
+        link_tag = card.select_one('.item-card-title-text')
+        title_tag = card.select_one('.item-card-title-text .this-full')
+        price_tag = card.select_one('.item-card-price-number')
+        availability_tag = card.select_one('.item-card-availability-text .this-text-number')
+
+        if link_tag and title_tag:
+            relative_link = link_tag.get('href', '')
+            full_link = f"{base_url}{relative_link}" if relative_link else "N/A"
+
+            product_data = {
+                'title': title_tag.get_text(strip=True),
+                'price': price_tag.get_text(strip=True).replace('\n', '').replace(' ', '') if price_tag else "N/A",
+                'availability': availability_tag.get_text(strip=True) if availability_tag else "N/A",
+                'link': full_link
+            }
+            products.append(product_data)
+
+    return products
+
+
+def parse_last_page(soup: BeautifulSoup) -> int:
+    """Номер последней страницы по ссылкам пагинации (1, если пагинации нет)."""
+    numbers = [int(link.get_text(strip=True)) for link in soup.select("div.pagination a.pagination__item")
+               if link.get_text(strip=True).isdigit()]
+    return max(numbers, default=1)
+
+
+def parse_listing_page(html: str, base_url: str) -> dict:
+    """
+    Parses a listing page once: its products, the last page number, and
+    what is needed to tell whether the server-rendered HTML is complete.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    products = _products(soup, base_url)
+    return {
+        'products': products,
+        'last_page': parse_last_page(soup),
+        'has_grid': soup.select_one(GRID_SELECTOR) is not None,
+        'missing_prices': sum(1 for product in products if is_priceless(product)),
+    }
+
+
+def is_priceless(product: dict) -> bool:
+    """Whether a parsed card came without a price (out of stock, or not rendered yet)."""
+    return product['price'] in ('', 'N/A')
+
+
+def parse_category_links(html: str, base_url: str) -> list[str]:
+    """Ссылки на категории со страницы /catalog/."""
+    soup = BeautifulSoup(html, 'html.parser')
+    links = (urljoin(base_url + '/', a.get('href', '')) for a in soup.select('div.catalog a.catalog__card') if a.get('href'))
+    return list(dict.fromkeys(links))
@@ -1,141 +1,173 @@
 # parsers/planeta_zdorovya_parser.py
 
-import json
 import re
+from contextlib import ExitStack
 import asyncpg
-from typing import Dict, Any
-import asyncio
 from ..base_parser import BaseParser, light_normalize
+from ..bulk_db import copy_to_staging, publish_price_changes
+from ..json_stream import RecordWriter, iter_chunks, iter_records
+from ..entity_resolution import EntityResolver, extract_key
+from collections import Counter
+from config import PLANETA_PRICES_FILE, PLANETA_REVIEW_FILE, INGEST_CHUNK_SIZE, DUMP_GZIP
+
+# Inserts the new names and returns the id of every staged name: the outer
+# SELECT sees the table as it was before the insert, so the two halves never overlap.
+MEDICINES_MERGE_SQL = """
+WITH inserted AS (
+    INSERT INTO medicines (name)
+    SELECT name FROM staging_medicines
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id, name
+)
+SELECT id, name FROM inserted
+UNION ALL
+SELECT m.id, m.name FROM medicines m JOIN staging_medicines s ON s.name = m.name
+"""
+
+# DISTINCT ON keeps the last price per medicine: ON CONFLICT cannot update a row twice.
+# Returns the medicines whose price is new, different or no longer stale
+# (`previous` sees the table as it was before the insert).
+PRICES_MERGE_SQL = """
+WITH previous AS (
+    SELECT p.medicine_id, p.price, p.stale_since
+    FROM pharmacy_prices p
+    WHERE p.pharmacy_id = $1 AND p.medicine_id IN (SELECT medicine_id FROM staging_prices)
+), priced AS (
+    INSERT INTO pharmacy_prices (pharmacy_id, medicine_id, price)
+    SELECT DISTINCT ON (medicine_id) $1, medicine_id, price
+    FROM staging_prices
+    ORDER BY medicine_id, seq DESC
+    ON CONFLICT (pharmacy_id, medicine_id)
+    DO UPDATE SET price = EXCLUDED.price, last_updated = NOW(), stale_since = NULL
+    RETURNING medicine_id, price
+)
+SELECT pr.medicine_id FROM priced pr LEFT JOIN previous pv ON pv.medicine_id = pr.medicine_id
+WHERE pv.medicine_id IS NULL OR pv.price <> pr.price OR pv.stale_since IS NOT NULL
+"""
+
 
 class PlanetaZdorovyaParser(BaseParser):
     """
     Parser for the 'Planeta Zdorovya' pharmacy.
-    This parser works with a local JSON file to populate the database.
+    This parser works with a local JSON (or JSON Lines) dump to populate the database.
     """
 
     def __init__(self, db_pool: asyncpg.Pool):
         super().__init__(session=None, db_pool=db_pool)
         self.pharmacy_id = 2
 
-    async def _get_or_create_medicine(self, conn: asyncpg.Connection, product_name: str) -> int:
+    async def populate_medicines_from_json(self, file_path: str):
+        """Populates the 'medicines' table from the dump (stage 1 only)."""
+        await self.ingest_json(file_path, populate=True, prices=False)
+
+    async def parse_prices_from_json(self, file_path: str):
+        """Populates prices for 'Planeta Zdorovya' from the dump (stage 2 only)."""
+        await self.ingest_json(file_path, populate=False, prices=True)
+
+    async def ingest_json(self, file_path: str, populate: bool = True, prices: bool = True):
         """
-        Retrieves the ID of a medicine if it exists, or creates it if it doesn't.
-        Returns the medicine ID.
+        Streams the dump (JSON array or JSON Lines, optionally gzipped) once, in
+        chunks of INGEST_CHUNK_SIZE records, so memory stays bounded.
+        For every chunk, `populate` merges the normalized titles into 'medicines'
+        (COPY into a staging table + one INSERT ... SELECT) and hands the
+        name -> id map to the price step. `prices` resolves each product (exact
+        name first, then the structured drug key, then a fuzzy base match) and
+        loads the prices the same way. Unresolved products go to a review file.
         """
-        normalized_name = light_normalize(product_name)
-        
-        # Try to find an exact match first
-        medicine_id = await conn.fetchval(
-            "SELECT id FROM medicines WHERE name = $1", normalized_name
-        )
+        resolver = None
+        if prices:
+            async with self.db_pool.acquire() as conn:
+                resolver = EntityResolver.from_rows(await conn.fetch("SELECT id, name FROM medicines"))
+            print(f"🔤 Built entity resolver over {len(resolver)} medicine keys.")
+
+        methods = Counter()
+        names_count = 0
+        changed_ids = set()
+        with ExitStack() as outputs:
+            if prices:
+                prices_writer = outputs.enter_context(RecordWriter(_output_path(PLANETA_PRICES_FILE)))
+                review_writer = outputs.enter_context(RecordWriter(_output_path(PLANETA_REVIEW_FILE)))
+
+            async with self.db_pool.acquire() as conn:
+                for chunk in iter_chunks(iter_records(file_path), INGEST_CHUNK_SIZE):
+                    names = list(dict.fromkeys(name for name in (light_normalize(product.get("title") or "") for product in chunk) if name))
+                    async with conn.transaction():
+                        if populate:
+                            medicine_ids = await self._merge_medicines(conn, names)
+                            names_count += len(names)
+                        else:
+                            rows = await conn.fetch("SELECT id, name FROM medicines WHERE name = ANY($1::text[])", names)
+                            medicine_ids = {row['name']: row['id'] for row in rows}
+                        if prices:
+                            price_rows = self._resolve_prices(chunk, medicine_ids, resolver, methods, review_writer)
+                            changed_ids.update(await self._merge_prices(conn, price_rows))
+                            prices_writer.write_many(
+                                {"pharmacy_id": self.pharmacy_id, "medicine_id": medicine_id, "price": price}
+                                for medicine_id, price in price_rows
+                            )
+                if prices:
+                    await publish_price_changes(conn, changed_ids)
+
+        if populate:
+            print(f"✅ Medicine population from {file_path} is complete: {names_count} names merged.")
+        if prices:
+            print(f"✅ Price parsing is complete. Processed {prices_writer.count} products. Data saved to {prices_writer.path}.")
+            print(f"🧬 Resolved by name: {methods['name']}, by key: {methods['key']}, by fuzzy base: {methods['fuzzy']}, unresolved: {methods['miss']}.")
+            print(f"🔍 {review_writer.count} unresolved products were written to {review_writer.path} for review.")
+
+    async def _merge_medicines(self, conn: asyncpg.Connection, names: list[str]) -> dict[str, int]:
+        """COPYs normalized names into a staging table and returns name -> id for all of them."""
+        await copy_to_staging(conn, 'staging_medicines', {'name': 'text'}, [(name,) for name in names])
+        rows = await conn.fetch(MEDICINES_MERGE_SQL)
+        return {row['name']: row['id'] for row in rows}
 
-        if medicine_id:
-            return medicine_id
-        
-        # If no exact match, create it
-        medicine_id = await conn.fetchval(
-            """
-            INSERT INTO medicines (name)
-            VALUES ($1)
-            ON CONFLICT (name) DO UPDATE
-            SET name = EXCLUDED.name
-            RETURNING id
-            """,
-            normalized_name
+    async def _merge_prices(self, conn: asyncpg.Connection, price_rows: list[tuple[int, float]]) -> list[int]:
+        """Loads a chunk of prices and returns the ids of the medicines whose price changed."""
+        await copy_to_staging(
+            conn, 'staging_prices', {'seq': 'integer', 'medicine_id': 'integer', 'price': 'numeric(10, 2)'},
+            [(seq, medicine_id, price) for seq, (medicine_id, price) in enumerate(price_rows)]
         )
-        return medicine_id
+        rows = await conn.fetch(PRICES_MERGE_SQL, self.pharmacy_id)
+        return [row['medicine_id'] for row in rows]
 
-    async def populate_medicines_from_json(self, file_path: str):
-        """
-        Parses the JSON file and populates the 'medicines' table.
-        """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            products = json.load(f)
-
-        async with self.db_pool.acquire() as conn:
-            async with conn.transaction():
-                for i, product in enumerate(products):
-                    product_name = product.get("title")
-                    if product_name:
-                        await self._get_or_create_medicine(conn, product_name)
-                    
-                    # Add a small delay every 100 products to prevent overloading
-                    if i % 100 == 0:
-                        await asyncio.sleep(0.1)
-        
-        print(f"✅ Medicine population from {file_path} is complete.")
+    def _resolve_prices(self, products: list[dict], medicine_ids: dict[str, int], resolver: EntityResolver,
+                        methods: Counter, review_writer: RecordWriter) -> list[tuple[int, float]]:
+        """Returns (medicine_id, price) for every resolvable product of a chunk."""
+        price_rows = []
+        for product in products:
+            product_name = product.get("title")
+            price_str = product.get("price")
 
-    async def parse_prices_from_json(self, file_path: str):
-        """
-        Parses the JSON file to populate prices for 'Planeta Zdorovya'.
-        """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            products = json.load(f)
-        
-        price_data_for_json = []
-        processed_count = 0
-
-        async with self.db_pool.acquire() as conn:
-            for i, product in enumerate(products):
-                product_name = product.get("title")
-                price_str = product.get("price")
-
-                if not product_name or not price_str:
-                    continue
-
-                # Clean the price string to get a number
-                price_match = re.search(r'(\d+)', price_str)
-                if not price_match:
-                    continue
-                
-                price = float(price_match.group(1))
-                normalized_name = light_normalize(product_name)
-                
-                # First try exact match
-                medicine_id = await conn.fetchval(
-                    "SELECT id FROM medicines WHERE name = $1", normalized_name
-                )
-
-                # If no exact match, try similarity search
-                if not medicine_id:
-                    medicine_id = await conn.fetchval(
-                        """
-                        SELECT id FROM medicines 
-                        ORDER BY similarity(name, $1) DESC 
-                        LIMIT 1
-                        """,
-                        normalized_name
-                    )
-
-                if medicine_id:
-                    # Insert or update the price in the database
-                    await conn.execute(
-                        """
-                        INSERT INTO pharmacy_prices (pharmacy_id, medicine_id, price)
-                        VALUES ($1, $2, $3)
-                        ON CONFLICT (pharmacy_id, medicine_id)
-                        DO UPDATE SET price = EXCLUDED.price, last_updated = NOW()
-                        """,
-                        self.pharmacy_id, medicine_id, price
-                    )
-                    
-                    # Append data for JSON file output
-                    price_data_for_json.append({
-                        "pharmacy_id": self.pharmacy_id,
-                        "medicine_id": medicine_id,
-                        "price": price
-                    })
-                    
-                    processed_count += 1
-                    
-                    # Add a small delay every 50 products to prevent overloading
-                    if processed_count % 50 == 0:
-                        await asyncio.sleep(0.1)
-                        print(f"Processed {processed_count} products...")
-
-        # Save the collected price data to a JSON file
-        output_filename = "planeta_zdorovya_prices.json"
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(price_data_for_json, f, indent=4, ensure_ascii=False)
-
-        print(f"✅ Price parsing is complete. Processed {processed_count} products. Data saved to {output_filename}.")
\ No newline at end of file
+            if not product_name or not price_str:
+                continue
+
+            # Clean the price string to get a number
+            price_match = re.search(r'(\d+)', price_str)
+            if not price_match:
+                continue
+
+            price = float(price_match.group(1))
+            medicine_id = medicine_ids.get(light_normalize(product_name))
+            if medicine_id is not None:
+                method, score = 'name', 1.0
+                # 'medicines' keeps the light_normalize'd name, which has lost "%", "№" and
+                # decimal commas; index the raw title too so later lookups see its real key
+                resolver.add(medicine_id, product_name)
+            else:
+                medicine_id, method, score = resolver.resolve(product_name)
+            methods[method or 'miss'] += 1
+
+            if medicine_id is None:
+                review_writer.write({
+                    "title": product_name,
+                    "key": extract_key(product_name)._asdict(),
+                    "price": price,
+                    "score": round(score, 3)
+                })
+                continue
+            price_rows.append((medicine_id, price))
+        return price_rows
+
+
+def _output_path(path: str) -> str:
+    return path + '.gz' if DUMP_GZIP else path
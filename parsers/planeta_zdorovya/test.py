@@ -1,13 +1,22 @@
+import argparse
 import asyncio
 import json
+import os
 import random
+import sys
 import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
 
 from playwright.async_api import async_playwright, TimeoutError
-from bs4 import BeautifulSoup
+
+if not __package__:
+    # Run as a plain script: make the project root importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from parsers.planeta_zdorovya.listing_parsing import CARD_SELECTOR, scrape_products_from_page
 
 # --- НОВАЯ И УЛУЧШЕННАЯ КОНФИГУРАЦИЯ ---
-# Количество одновременно обрабатываемых категорий. Уменьшено для снижения нагрузки.
+# Общий бюджет одновременно загружаемых страниц (по всем категориям). Уменьшено для снижения нагрузки.
 CONCURRENCY_LIMIT = 3
 # Количество повторных попыток для загрузки страницы
 RETRY_COUNT = 3
@@ -16,33 +25,76 @@ RETRY_DELAY = 5
 # Базовый URL сайта
 BASE_URL = "https://planetazdorovo.ru"
 
+# --- Продакшн-режим (headless) ---
+# Количество вкладок, переиспользуемых между категориями
+PAGE_POOL_SIZE = CONCURRENCY_LIMIT
+# Пауза вкладки после каждой страницы (с)
+PAGE_DELAY = (2.0, 4.0)
+# Типы ресурсов, которые не загружаются (сторонние скрипты блокируются отдельно)
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+# Прокрутка заканчивается, когда число карточек товаров перестает расти
+CARDS_POLL_INTERVAL = 0.3    # Пауза между проверками числа карточек (с)
+CARDS_STABLE_CHECKS = 3      # Сколько проверок подряд число карточек не должно меняться
+CARDS_STABLE_TIMEOUT = 20    # Максимальное время прокрутки одной страницы (с)
+
+
+class PagePool:
+    """
+    Fixed set of tabs shared by all categories instead of a fresh page per category.
+    A tab that crashed or was closed is replaced when it is returned.
+    """
+    def __init__(self, context, size: int = PAGE_POOL_SIZE):
+        self.context = context
+        self.size = size
+        self.pages = asyncio.Queue()
+
+    async def start(self):
+        for _ in range(self.size):
+            self.pages.put_nowait(await self.context.new_page())
+
+    @asynccontextmanager
+    async def page(self):
+        page = await self.pages.get()
+        try:
+            yield page
+        finally:
+            if page.is_closed():
+                page = await self.context.new_page()
+            self.pages.put_nowait(page)
+
+    async def close(self):
+        while not self.pages.empty():
+            await self.pages.get_nowait().close()
+
 
-# --- Хелпер-функция для парсинга продуктов со страницы (без изменений) ---
-def scrape_products_from_page(page_content, base_url):
-    """Парсит HTML-контент для извлечения данных о продуктах."""
-    soup = BeautifulSoup(page_content, 'html.parser')
-    products = []
-    product_cards = soup.select('div.pz-grid-list .pz-grid-item .item-card')
+class ScrapeStats:
+    """Counts scraped listing pages so the throughput of a run is measurable."""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.pages = 0
+        self.products = 0
 
-    for card in product_cards:
-        link_tag = card.select_one('.item-card-title-text')
-        title_tag = card.select_one('.item-card-title-text .this-full')
-        price_tag = card.select_one('.item-card-price-number')
-        availability_tag = card.select_one('.item-card-availability-text .this-text-number')
+    def page_done(self, products: int):
+        self.pages += 1
+        self.products += products
 
-        if link_tag and title_tag:
-            relative_link = link_tag.get('href', '')
-            full_link = f"{base_url}{relative_link}" if relative_link else "N/A"
+    def pages_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.pages / elapsed * 60 if elapsed else 0.0
 
-            product_data = {
-                'title': title_tag.get_text(strip=True),
-                'price': price_tag.get_text(strip=True).replace('\n', '').replace(' ', '') if price_tag else "N/A",
-                'availability': availability_tag.get_text(strip=True) if availability_tag else "N/A",
-                'link': full_link
-            }
-            products.append(product_data)
+    def summary(self) -> str:
+        return (f"{self.pages} страниц, {self.products} товаров за {time.monotonic() - self.started:.0f} с "
+                f"({self.pages_per_minute():.1f} стр/мин)")
 
-    return products
+
+async def block_heavy_resources(route):
+    """Aborts images, media, fonts and third-party scripts; everything else goes through."""
+    request = route.request
+    third_party = not (urlsplit(request.url).hostname or '').endswith(urlsplit(BASE_URL).hostname)
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or (request.resource_type == 'script' and third_party):
+        await route.abort()
+    else:
+        await route.continue_()
 
 
 # --- Новые и обновлённые асинхронные функции ---
@@ -84,120 +136,150 @@ async def get_last_page_number(page) -> int:
         print(f"WARNING: Не удалось определить последнюю страницу: {e}. Будет обработана только первая.")
         return 1
 
-async def scroll_to_bottom(page):
-    """Прокручивает страницу до самого низа для загрузки всех 'ленивых' элементов."""
-    last_height = await page.evaluate("document.body.scrollHeight")
-    while True:
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
-        try:
-            await page.wait_for_load_state('networkidle', timeout=7000)
-        except TimeoutError:
-            print("...Тайм-аут ожидания 'networkidle', продолжаю прокрутку...")
-        await asyncio.sleep(random.uniform(1.5, 2.5))
-        new_height = await page.evaluate("document.body.scrollHeight")
-        if new_height == last_height:
+async def scroll_until_cards_stable(page) -> int:
+    """
+    Прокручивает страницу вниз, пока число карточек товаров не перестанет расти
+    (CARDS_STABLE_CHECKS проверок подряд), вместо фиксированных пауз. Возвращает число карточек.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CARDS_STABLE_TIMEOUT
+    last_count, stable_checks = -1, 0
+    while stable_checks < CARDS_STABLE_CHECKS:
+        if loop.time() > deadline:
+            print(f"...Тайм-аут прокрутки, карточек на странице: {last_count}")
             break
-        last_height = new_height
-
-async def scrape_single_category(context, category_url: str):
-    """Полностью скрейпит одну категорию, включая все ее страницы."""
-    print(f"\n--- 🚀 Начинаю обработку категории: {category_url} ---")
-    page = await context.new_page()
-    all_products_in_category = []
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
+        await asyncio.sleep(CARDS_POLL_INTERVAL)
+        count = await page.locator(CARD_SELECTOR).count()
+        stable_checks = stable_checks + 1 if count == last_count else 0
+        last_count = count
+    return last_count
 
+async def scrape_listing_page(page, page_url: str, first_page: bool):
+    """
+    Загружает одну страницу листинга на переданной вкладке и возвращает
+    (товары, номер последней страницы или None), либо None при ошибке.
+    """
     try:
-        # 1. Переходим на первую страницу с использованием новой надежной функции
-        if not await goto_with_retries(page, category_url):
-            raise Exception("Не удалось загрузить даже первую страницу категории.")
-
+        if not await goto_with_retries(page, page_url):
+            return None
         await page.wait_for_selector('div.pz-grid-list', timeout=30000)
-        last_page = await get_last_page_number(page)
-
-        # 2. Итерируемся по всем страницам
-        for page_num in range(1, last_page + 1):
-            page_url = f"{category_url}?PAGEN_1={page_num}"
-            print(f"📖 Обрабатываю страницу {page_num}/{last_page} для категории: {category_url}")
-
-            # Для первой страницы мы уже на месте, для остальных - переходим
-            if page_num > 1:
-                if not await goto_with_retries(page, page_url):
-                    print(f"   Пропускаю страницу {page_num} из-за ошибки загрузки.")
-                    continue # Пропускаем страницу, но не всю категорию
-
-            await page.wait_for_selector('div.pz-grid-list', timeout=30000)
-            
-            print("...Прокручиваю страницу для загрузки всех товаров...")
-            await scroll_to_bottom(page)
-            print("...Прокрутка завершена.")
-
-            content = await page.content()
-            products_on_page = scrape_products_from_page(content, BASE_URL)
-            all_products_in_category.extend(products_on_page)
-            print(f"✅ Найдено {len(products_on_page)} товаров на странице {page_num}.")
-            # Увеличена задержка между страницами
-            await asyncio.sleep(random.uniform(2.0, 4.0))
-
+        last_page = await get_last_page_number(page) if first_page else None
+        await scroll_until_cards_stable(page)
+        content = await page.content()
+        return scrape_products_from_page(content, BASE_URL), last_page
     except Exception as e:
-        print(f"❌ CRITICAL ERROR при обработке {category_url}: {e}")
+        print(f"❌ Ошибка при обработке {page_url}: {e}")
+        return None
+
+async def scrape_categories(pool: PagePool, category_links: list[str], stats: ScrapeStats) -> list[list[dict]]:
+    """
+    Скрейпит все категории на уровне отдельных страниц: каждая страница - отдельная
+    задача в общей очереди, которую обслуживают все вкладки пула. Страницы разных
+    категорий чередуются, и одна большая категория не занимает вкладку целиком.
+    Первая страница категории добавляет в очередь страницы 2..N. Результаты
+    собираются по категориям в порядке страниц.
+    """
+    queue = asyncio.Queue()
+    pages_by_category = [{} for _ in category_links]
+    pages_left = [1] * len(category_links)
+    for index, category_url in enumerate(category_links):
+        queue.put_nowait((index, category_url, 1))
+
+    async def worker():
+        while True:
+            index, category_url, page_num = await queue.get()
+            try:
+                page_url = category_url if page_num == 1 else f"{category_url}?PAGEN_1={page_num}"
+                async with pool.page() as page:
+                    result = await scrape_listing_page(page, page_url, page_num == 1)
+                    # Пауза между страницами на этой вкладке
+                    await asyncio.sleep(random.uniform(*PAGE_DELAY))
+
+                if result is None:
+                    print(f"   Пропускаю страницу {page_num} категории {category_url} из-за ошибки загрузки.")
+                else:
+                    products_on_page, last_page = result
+                    pages_by_category[index][page_num] = products_on_page
+                    stats.page_done(len(products_on_page))
+                    print(f"✅ {category_url} стр. {page_num}: {len(products_on_page)} товаров. "
+                          f"Скорость: {stats.pages_per_minute():.1f} стр/мин")
+                    if last_page:
+                        pages_left[index] += last_page - 1
+                        for next_page in range(2, last_page + 1):
+                            queue.put_nowait((index, category_url, next_page))
+
+                pages_left[index] -= 1
+                if not pages_left[index]:
+                    collected = sum(len(products) for products in pages_by_category[index].values())
+                    print(f"--- ✅ Завершено: {category_url} | Собрано товаров: {collected} ---")
+            except Exception as e:
+                print(f"❌ CRITICAL ERROR при обработке {category_url} (стр. {page_num}): {e}")
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(pool.size)]
+    try:
+        await queue.join()
     finally:
-        await page.close()
-    
-    print(f"--- ✅ Завершено: {category_url} | Собрано товаров: {len(all_products_in_category)} ---")
-    return all_products_in_category
+        for task in workers:
+            task.cancel()
+
+    return [[product for page_num in sorted(pages) for product in pages[page_num]] for pages in pages_by_category]
 
 # --- Главная асинхронная функция (без изменений, кроме вызова `main`) ---
-async def main():
+async def main(headful: bool = False):
+    """
+    По умолчанию работает в продакшн-режиме: headless, без картинок, медиа,
+    шрифтов и сторонних скриптов. headful=True показывает браузер и грузит всё (для отладки).
+    """
     async with async_playwright() as p:
         browser = await p.chromium.launch(
-            headless=False,
+            headless=not headful,
             args=["--disable-blink-features=AutomationControlled", "--start-maximized"]
         )
         context = await browser.new_context(
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
             viewport={"width": 1920, "height": 1080}
         )
+        if not headful:
+            await context.route("**/*", block_heavy_resources)
+
+        pool = PagePool(context)
+        await pool.start()
+        stats = ScrapeStats()
 
-        page = await context.new_page()
-        
         print("--- Шаг 1: Сбор ссылок на категории ---")
         catalog_url = f"{BASE_URL}/catalog/"
-        await page.goto(catalog_url, wait_until="domcontentloaded")
-        await page.wait_for_selector("div.catalog", timeout=30000)
+        async with pool.page() as page:
+            await page.goto(catalog_url, wait_until="domcontentloaded")
+            await page.wait_for_selector("div.catalog", timeout=30000)
 
-        category_links = await page.eval_on_selector_all(
-            'div.catalog a.catalog__card',
-            'nodes => nodes.map(n => n.href)'
-        )
-        await page.close()
-        
-        print(f"Найдено {len(category_links)} категорий для скрейпинга.")
+            category_links = await page.eval_on_selector_all(
+                'div.catalog a.catalog__card',
+                'nodes => nodes.map(n => n.href)'
+            )
 
-        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-        tasks = []
-
-        async def worker(link):
-            async with semaphore:
-                # Добавляем паузу перед началом обработки новой категории
-                await asyncio.sleep(random.uniform(3.0, 6.0))
-                return await scrape_single_category(context, link)
+        print(f"Найдено {len(category_links)} категорий для скрейпинга.")
 
-        for link in category_links:
-            tasks.append(worker(link))
-            
-        results_from_categories = await asyncio.gather(*tasks)
+        results_from_categories = await scrape_categories(pool, category_links, stats)
 
         all_products = [product for sublist in results_from_categories for product in sublist]
         
         print(f"\n--- ✨ Скрейпинг полностью завершен ---")
         print(f"🎉 Всего собрано товаров: {len(all_products)}")
+        print(f"📈 {stats.summary()}")
 
         if all_products:
             with open("all_products_async.json", "w", encoding="utf-8") as f:
                 json.dump(all_products, f, indent=4, ensure_ascii=False)
             print("💾 Все данные сохранены в файл 'all_products_async.json'")
         
+        await pool.close()
         await browser.close()
         print("Браузер закрыт.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Скрейпер каталога Планеты Здоровья (Playwright).")
+    arg_parser.add_argument('--headful', action='store_true', help="показать браузер и загружать все ресурсы (отладка)")
+    asyncio.run(main(headful=arg_parser.parse_args().headful))
\ No newline at end of file
@@ -0,0 +1,81 @@
+# parsers/progress_store.py
+import json
+import sqlite3
+import time
+from config import PROGRESS_DB, PROGRESS_BATCH_SIZE
+
+# URL states
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class ProgressStore:
+    """
+    Durable per-URL progress of a Stage 2 run, kept in SQLite.
+    State changes are buffered and written in batches, so marking a URL costs
+    a list append; a crash loses at most one unflushed batch, and those URLs
+    are simply processed again on resume.
+    """
+    def __init__(self, path: str = PROGRESS_DB, batch_size: int = PROGRESS_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS url_progress (
+                url TEXT PRIMARY KEY,
+                breadcrumbs TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_url_progress_state ON url_progress (state);
+        """)
+        self._updates = []
+
+    def reset(self, items):
+        """Starts a new run: every item from the iterable becomes pending."""
+        now = time.time()
+        with self.db:
+            self.db.execute("DELETE FROM url_progress")
+            batch = []
+            for item in items:
+                batch.append((item['url'], json.dumps(item['breadcrumbs'], ensure_ascii=False), PENDING, now))
+                if len(batch) >= self.batch_size:
+                    self.db.executemany("INSERT OR IGNORE INTO url_progress VALUES (?, ?, ?, ?)", batch)
+                    batch = []
+            self.db.executemany("INSERT OR IGNORE INTO url_progress VALUES (?, ?, ?, ?)", batch)
+
+    def iter_pending(self, chunk_size: int = 1000):
+        """Streams pending items in insertion order, one chunk at a time."""
+        last_rowid = 0
+        while True:
+            rows = self.db.execute(
+                "SELECT rowid, url, breadcrumbs FROM url_progress WHERE state = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (PENDING, last_rowid, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            for rowid, url, breadcrumbs in rows:
+                yield {'url': url, 'breadcrumbs': json.loads(breadcrumbs)}
+            last_rowid = rows[-1][0]
+
+    def mark(self, url: str, state: str):
+        self._updates.append((state, time.time(), url))
+        if len(self._updates) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._updates:
+            return
+        with self.db:
+            self.db.executemany("UPDATE url_progress SET state = ?, updated_at = ? WHERE url = ?", self._updates)
+        self._updates = []
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM url_progress GROUP BY state").fetchall())
+
+    def close(self):
+        self.flush()
+        self.db.close()
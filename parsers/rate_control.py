@@ -0,0 +1,119 @@
+# parsers/rate_control.py
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from config import RATE_LIMITS, DEFAULT_RATE_LIMIT
+
+# Multiplicative decrease factor applied on overload signals
+DECREASE_FACTOR = 0.5
+# Pause before new requests after a 429/503 without Retry-After (seconds)
+DEFAULT_COOLDOWN = 5.0
+
+
+class Slot:
+    """Outcome of one request, filled in by the caller inside `RateController.slot`."""
+    def __init__(self):
+        self.status = None
+        self.timed_out = False
+        self.retry_after = None
+
+
+class HostLimiter:
+    """
+    AIMD concurrency limit for one host.
+    Every fast successful response adds 1/limit (about +1 per round trip);
+    a 429/503, a timeout or a response slower than the target latency
+    halves the limit, at most once per target-latency window.
+    """
+    def __init__(self, host: str, min: int, max: int, initial: int, target_latency: float):
+        self.host = host
+        self.min_limit = min
+        self.max_limit = max
+        self.target_latency = target_latency
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        delay = self.cooldown_until - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, latency: float, slot: Slot):
+        now = asyncio.get_running_loop().time()
+        async with self._cond:
+            self.in_flight -= 1
+            overloaded = slot.timed_out or slot.status in (429, 503)
+            if overloaded or latency > self.target_latency:
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+                    self._last_decrease = now
+                if slot.status in (429, 503):
+                    self.cooldown_until = max(self.cooldown_until, now + (slot.retry_after or DEFAULT_COOLDOWN))
+            elif slot.status is not None and slot.status < 400:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def describe(self) -> str:
+        return f"{self.host}: limit={self.limit:.1f} in_flight={self.in_flight}"
+
+
+class RateController:
+    """Per-host adaptive rate control shared by every parser of a run."""
+    def __init__(self, limits: dict = RATE_LIMITS, default: dict = DEFAULT_RATE_LIMIT):
+        self.limits = limits
+        self.default = default
+        self.hosts: dict[str, HostLimiter] = {}
+
+    def for_url(self, url: str) -> HostLimiter:
+        host = urlparse(url).hostname or ''
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(host, **self.limits.get(host, self.default))
+        return self.hosts[host]
+
+    def max_concurrency(self, url: str) -> int:
+        """Hard cap for a host; callers size their worker pools with it."""
+        return self.for_url(url).max_limit
+
+    def slot(self, url: str):
+        return _SlotContext(self.for_url(url))
+
+    def describe(self) -> str:
+        return " | ".join(limiter.describe() for limiter in self.hosts.values())
+
+
+class _SlotContext:
+    def __init__(self, limiter: HostLimiter):
+        self.limiter = limiter
+        self.slot = Slot()
+        self._started = 0.0
+
+    async def __aenter__(self) -> Slot:
+        await self.limiter.acquire()
+        self._started = asyncio.get_running_loop().time()
+        return self.slot
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.limiter.release(asyncio.get_running_loop().time() - self._started, self.slot)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,100 @@
+# parsers/trigram_index.py
+import math
+import re
+from collections import Counter, defaultdict
+from config import TRIGRAM_MATCH_THRESHOLD
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def trigrams(text: str) -> frozenset[str]:
+    """
+    Trigrams of a string the way pg_trgm builds them: lower-cased words,
+    each padded with two spaces in front and one behind.
+    """
+    grams = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """pg_trgm similarity(): shared trigrams over all distinct trigrams."""
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class TrigramIndex:
+    """
+    In-memory trigram inverted index over a name catalog (e.g. `medicines`).
+    Built once, then every lookup is a dictionary walk instead of a DB round trip.
+    Scores match pg_trgm's similarity(), so thresholds carry over from SQL.
+    """
+    def __init__(self, threshold: float = TRIGRAM_MATCH_THRESHOLD):
+        self.threshold = threshold
+        self.ids: list[int] = []
+        self.names: list[str] = []
+        self.grams: list[frozenset] = []
+        self.exact: dict[str, int] = {}
+        self.postings: dict[str, list[int]] = defaultdict(list)
+
+    @classmethod
+    def from_rows(cls, rows, threshold: float = TRIGRAM_MATCH_THRESHOLD) -> 'TrigramIndex':
+        """Builds the index from (id, name) rows, e.g. `SELECT id, name FROM medicines`."""
+        index = cls(threshold)
+        for key_id, name in rows:
+            index.add(key_id, name)
+        return index
+
+    def add(self, key_id: int, name: str):
+        position = len(self.ids)
+        grams = trigrams(name)
+        self.ids.append(key_id)
+        self.names.append(name)
+        self.grams.append(grams)
+        self.exact.setdefault(name, key_id)
+        for gram in grams:
+            self.postings[gram].append(position)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def match(self, name: str) -> tuple[int | None, str | None, float]:
+        """
+        Returns (id, name, score) of the best catalog entry for `name`.
+        A match needs at least ceil(threshold * |query|) shared trigrams, so it
+        must contain one of the |query| - that + 1 rarest query trigrams (prefix
+        filtering). Candidates are then scored in order of how many of those they
+        share, and the scan stops once no remaining one can beat the best score.
+        Below-threshold results are the best of those candidates, or (None, None, 0.0).
+        """
+        key_id = self.exact.get(name)
+        if key_id is not None:
+            return key_id, name, 1.0
+
+        query = trigrams(name)
+        if not query:
+            return None, None, 0.0
+        needed = max(1, math.ceil(self.threshold * len(query)))
+        rare_first = sorted(query, key=lambda gram: len(self.postings.get(gram, ())))
+        prefix = rare_first[:len(query) - needed + 1]
+        hits = Counter()
+        for gram in prefix:
+            hits.update(self.postings.get(gram, ()))
+
+        # Trigrams outside the prefix can add at most this many shared ones
+        rest = len(query) - len(prefix)
+        best, best_score = None, 0.0
+        for position, prefix_hits in hits.most_common():
+            # Beating best_score needs more than best_score * |query| shared trigrams
+            if prefix_hits + rest <= best_score * len(query):
+                break
+            score = similarity(query, self.grams[position])
+            if score > best_score:
+                best, best_score = position, score
+        if best is None:
+            return None, None, 0.0
+        return self.ids[best], self.names[best], best_score
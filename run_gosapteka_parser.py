@@ -1,17 +1,23 @@
 import asyncio
 import os
-import shutil
 import sys
 
 # ИЗМЕНЕНО: Правильные импорты из файлов с новыми именами
-from parsers.gosapteka.url_collector import collect_urls_to_files
-from parsers.gosapteka.details_processor import process_details_from_files
+from parsers.gosapteka.url_collector import collect_urls_to_files, collect_urls_from_sitemap
+from parsers.gosapteka.details_processor import process_details_from_files, process_sitemap_changes, reparse_from_archive, open_url_index
+from parsers.gosapteka.stream_crawl import stream_urls_and_details
 from config import URLS_DIR
 
 async def main():
     """
     Главный скрипт для последовательного или раздельного запуска парсеров.
-    Принимает аргументы: 'stage1', 'stage2', 'full'.
+    Принимает аргументы: 'stage1', 'stage2', 'full', 'incremental', 'sitemap', 'resume', 'reparse', 'import', 'stream'.
+    'incremental' обрабатывает только новые URL из дифа Stage 1 и часть неизменившихся.
+    'sitemap' находит изменившиеся товары по sitemap.xml и обрабатывает только их.
+    'resume' продолжает прерванный Stage 2 только по необработанным URL.
+    'reparse' пересобирает БД из архива HTML без обращения к сайту.
+    'import' переносит старые JSON-файлы Stage 1 в индекс URL.
+    'stream' совмещает Stage 1 и Stage 2: товары загружаются, пока категории ещё обходятся.
     """
     stage = sys.argv[1] if len(sys.argv) > 1 else 'full'
 
@@ -20,10 +26,10 @@ async def main():
         print("▶️ STAGE 1: COLLECTING URLS AND SAVING TO FILES")
         print("="*50)
 
-        if os.path.exists(URLS_DIR):
-            shutil.rmtree(URLS_DIR)
-            print(f"🧹 Directory '{URLS_DIR}' cleaned.")
-        os.makedirs(URLS_DIR)
+        # Previous manifests live in the URL index: Stage 1 diffs against them.
+        # Old JSON files are imported first so the first diff is meaningful.
+        os.makedirs(URLS_DIR, exist_ok=True)
+        open_url_index().close()
 
         await collect_urls_to_files()
 
@@ -42,8 +48,76 @@ async def main():
         print("\n" + "="*50)
         print("✅ STAGE 2 COMPLETE.")
 
-    if stage not in ['stage1', 'stage2', 'full']:
-        print(f"❌ Invalid argument '{stage}'. Use 'stage1', 'stage2', or 'full'.")
+    if stage == 'incremental':
+        print("\n▶️ INCREMENTAL STAGE 2: NEW URLS AND A SLICE OF UNCHANGED ONES")
+        print("="*50)
+
+        try:
+            await process_details_from_files(incremental=True)
+        except Exception as e:
+            print(f"❌ A critical error occurred during incremental Stage 2: {e}")
+
+        print("\n" + "="*50)
+        print("✅ INCREMENTAL STAGE 2 COMPLETE.")
+
+    if stage == 'sitemap':
+        print("="*50)
+        print("▶️ SITEMAP: DISCOVERING CHANGED PRODUCTS AND SAVING THEM TO THE DB")
+        print("="*50)
+
+        await collect_urls_from_sitemap()
+        try:
+            await process_sitemap_changes()
+        except Exception as e:
+            print(f"❌ A critical error occurred while processing sitemap products: {e}")
+
+        print("\n" + "="*50)
+        print("✅ SITEMAP RUN COMPLETE.")
+
+    if stage == 'resume':
+        print("\n▶️ RESUME: CONTINUING THE INTERRUPTED STAGE 2")
+        print("="*50)
+
+        try:
+            await process_details_from_files(resume=True)
+        except Exception as e:
+            print(f"❌ A critical error occurred while resuming Stage 2: {e}")
+
+        print("\n" + "="*50)
+        print("✅ RESUME COMPLETE.")
+
+    if stage == 'reparse':
+        print("\n▶️ REPARSE: REBUILDING DB FROM THE HTML ARCHIVE (NO NETWORK)")
+        print("="*50)
+
+        await reparse_from_archive()
+
+        print("\n" + "="*50)
+        print("✅ REPARSE COMPLETE.")
+
+    if stage == 'import':
+        print("\n▶️ IMPORT: MOVING OLD STAGE 1 JSON FILES INTO THE URL INDEX")
+        print("="*50)
+
+        open_url_index().close()
+
+        print("\n" + "="*50)
+        print("✅ IMPORT COMPLETE.")
+
+    if stage == 'stream':
+        print("="*50)
+        print("▶️ STREAM: COLLECTING URLS AND PROCESSING DETAILS AT THE SAME TIME")
+        print("="*50)
+
+        os.makedirs(URLS_DIR, exist_ok=True)
+        open_url_index().close()
+        await stream_urls_and_details()
+
+        print("\n" + "="*50)
+        print("✅ STREAM RUN COMPLETE.")
+
+    if stage not in ['stage1', 'stage2', 'full', 'incremental', 'sitemap', 'resume', 'reparse', 'import', 'stream']:
+        print(f"❌ Invalid argument '{stage}'. Use 'stage1', 'stage2', 'full', 'incremental', 'sitemap', 'resume', 'reparse', 'import', or 'stream'.")
         return
 
     print("\n🎉 ALL STAGES COMPLETE. WORK FINISHED.")
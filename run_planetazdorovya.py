@@ -2,32 +2,62 @@
 
 import asyncio
 import asyncpg
+import os
 import sys
 
 # --- Import configurations ---
-from config import DB_CONFIG
+from config import DB_CONFIG, PLANETA_DUMP_FILE
 from parsers.planeta_zdorovya.planeta_zdorovya_parser import PlanetaZdorovyaParser
+from parsers.planeta_zdorovya.http_scraper import scrape_catalog_http
 # Правильная строка
 from parsers.base_parser import BaseParser, light_normalize
 
 # --- Source File ---
 # Note: You could also move this path to your config.py if you prefer
-JSON_FILE_PATH = "parsers/planeta_zdorovya/all_products_async.json"
+# The HTTP scraper's JSON Lines dump is used when present, the Playwright dump otherwise
+JSON_FILE_PATH = PLANETA_DUMP_FILE if os.path.exists(PLANETA_DUMP_FILE) else "parsers/planeta_zdorovya/all_products_async.json"
 
 async def main():
     """
     Main script to run the 'Planeta Zdorovya' parser.
-    Accepts arguments: 'stage1' (populate medicines), 'stage2' (parse prices), or 'full'.
+    Accepts arguments: 'stage1' (populate medicines), 'stage2' (parse prices), 'full',
+    or 'scrape' (collect the catalog over HTTP, with a browser fallback, into PLANETA_DUMP_FILE).
     """
     stage = sys.argv[1] if len(sys.argv) > 1 else 'full'
 
+    # --- SCRAPE: HTTP fast path, no database needed ---
+    if stage == 'scrape':
+        print("="*50)
+        print("▶️ СБОР КАТАЛОГА ПО HTTP (Планета Здоровья)")
+        print("="*50)
+
+        await scrape_catalog_http()
+
+        print("\n" + "="*50)
+        print("✅ СБОР КАТАЛОГА ЗАВЕРШЕН.")
+        return
+
     # Establish database connection using the imported config
     db_pool = await asyncpg.create_pool(**DB_CONFIG)
     
     parser = PlanetaZdorovyaParser(db_pool)
 
+    # --- FULL: both stages in one streaming pass over the dump ---
+    if stage == 'full':
+        print("="*50)
+        print("▶️ ЭТАПЫ 1+2: КАТАЛОГ И ЦЕНЫ ЗА ОДИН ПРОХОД (Планета Здоровья)")
+        print("="*50)
+
+        try:
+            await parser.ingest_json(JSON_FILE_PATH)
+        except Exception as e:
+            print(f"❌ Произошла критическая ошибка: {e}")
+
+        print("\n" + "="*50)
+        print("✅ ЭТАПЫ 1+2 ЗАВЕРШЕНЫ.")
+
     # --- STAGE 1: Populate the master 'medicines' table ---
-    if stage in ['stage1', 'full']:
+    if stage == 'stage1':
         print("="*50)
         print("▶️ ЭТАП 1: ЗАПОЛНЕНИЕ ГЛАВНОГО КАТАЛОГА ЛЕКАРСТВЕННЫХ СРЕДСТВ (Планета Здоровья)")
         print("="*50)
@@ -38,7 +68,7 @@ async def main():
         print("✅ STAGE 1 COMPLETE.")
 
     # --- STAGE 2: Parse prices and link them to medicines ---
-    if stage in ['stage2', 'full']:
+    if stage == 'stage2':
         print("\n▶️ ЭТАП 2: РАЗБОР ЦЕН (Планета Здоровья)")
         print("="*50)
         
@@ -52,7 +82,7 @@ async def main():
 
     # --- Argument validation ---
     if stage not in ['stage1', 'stage2', 'full']:
-        print(f"❌ Invalid argument '{stage}'. Use 'stage1', 'stage2', or 'full'.")
+        print(f"❌ Invalid argument '{stage}'. Use 'stage1', 'stage2', 'full', or 'scrape'.")
         await db_pool.close()
         return
 
@@ -0,0 +1,99 @@
+# tests/conftest.py
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+# The repo runs from its root (`from config import ...`), not as an installed package
+sys.path.insert(0, ROOT)
+
+
+def fixture_path(*parts: str) -> str:
+    return os.path.join(FIXTURES, *parts)
+
+
+def read_fixture(*parts: str) -> str:
+    with open(fixture_path(*parts), encoding='utf-8') as f:
+        return f.read()
+
+
+class PlanetaFixtureHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the recorded Planeta pages the way the site addresses them:
+    /catalog/ -> catalog.html, /catalog/<slug>/?PAGEN_1=<n> -> <slug>_p<n>.html.
+    Every request is counted in `server.hits` by path and query.
+    """
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        slug = parts.path.strip('/').split('/')[-1]
+        if slug == 'catalog':
+            name = 'catalog.html'
+        else:
+            page = parse_qs(parts.query).get('PAGEN_1', ['1'])[0]
+            name = f"{slug}_p{page}.html"
+        path = fixture_path('planeta', name)
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def planeta_server():
+    """Base URL of a local server with the recorded Planeta pages."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PlanetaFixtureHandler)
+    server.hits = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class PagesHandler(SimpleHTTPRequestHandler):
+    """
+    Serves `server.pages`: path with query -> (status, body bytes, content type).
+    Unknown paths are 404. Every request is counted in `server.hits`.
+    """
+    def do_GET(self):
+        self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        status, body, content_type = self.server.pages.get(self.path, (404, b'', 'text/plain'))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pages_server():
+    """A local server for pages built by the test itself (fill `server.pages`)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PagesHandler)
+    server.hits = {}
+    server.pages = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
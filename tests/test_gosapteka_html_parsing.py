@@ -0,0 +1,33 @@
+# tests/test_gosapteka_html_parsing.py
+import pytest
+from bs4 import BeautifulSoup
+from conftest import read_fixture
+from parsers.gosapteka.html_parsing import extract_breadcrumb_urls, extract_product_data, parse_product_html
+
+BASE_URL = 'https://gosapteka18.ru'
+PRODUCT_PAGES = ['nurofen.html', 'aqua_maris.html', 'out_of_stock.html']
+
+
+@pytest.mark.parametrize('name', PRODUCT_PAGES)
+def test_parse_product_html_matches_the_html_parser_path(name):
+    """The fast backend and the raw-text price search give what html.parser + prettify() gave."""
+    html = read_fixture('gosapteka', name)
+    old = extract_product_data(BeautifulSoup(html, 'html.parser'), BASE_URL)
+    assert parse_product_html(html, BASE_URL) == old
+
+
+def test_parse_product_html_reads_meta_and_script_prices():
+    nurofen = parse_product_html(read_fixture('gosapteka', 'nurofen.html'), BASE_URL)
+    assert nurofen['name'] == 'Нурофен таблетки п/о 200мг №20'
+    assert nurofen['price'] == 189.5
+    assert nurofen['image_url'] == f"{BASE_URL}/upload/iblock/3f1/nurofen-200-20.jpg"
+    assert nurofen['description'].startswith('Состав:\nИбупрофен 200 мг.')
+    # No <meta itemprop="price">: the price comes from the dataLayer JSON
+    assert parse_product_html(read_fixture('gosapteka', 'aqua_maris.html'), BASE_URL)['price'] == 412.0
+    assert parse_product_html(read_fixture('gosapteka', 'out_of_stock.html'), BASE_URL)['price'] is None
+
+
+def test_extract_breadcrumb_urls():
+    assert extract_breadcrumb_urls(read_fixture('gosapteka', 'nurofen.html'), BASE_URL) == [
+        f"{BASE_URL}/", f"{BASE_URL}/catalog/", f"{BASE_URL}/catalog/lekarstva/", f"{BASE_URL}/catalog/obezbolivayushchie/",
+    ]
@@ -0,0 +1,126 @@
+# tests/test_gosapteka_sitemap.py
+import asyncio
+import gzip
+import json
+from datetime import datetime, timezone
+import httpx
+import pytest
+from conftest import read_fixture
+from parsers.parse_stage import ParseStage
+from parsers.gosapteka import url_collector
+from parsers.gosapteka.details_processor import GOSAPTEKA_URL, DetailsProcessor
+from parsers.gosapteka.url_collector import UNCATEGORIZED_PATH, UNCATEGORIZED_URL, collect_urls_from_sitemap
+from parsers.gosapteka.url_index import UrlIndex
+
+SINCE = datetime(2026, 3, 1, tzinfo=timezone.utc)
+MENU = """<html><body><div class="menu-catalog">
+<div class="menu-catalog__item"><a class="menu-catalog__link" href="/catalog/lekarstva/">Лекарства</a></div>
+</div></body></html>"""
+
+
+def urlset(base_url: str, *entries: tuple[str, str]) -> bytes:
+    urls = ''.join(f"<url><loc>{base_url}{path}</loc><lastmod>{lastmod}</lastmod></url>" for path, lastmod in entries)
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode('utf-8')
+
+
+def sitemap_index(base_url: str, *entries: tuple[str, str]) -> bytes:
+    maps = ''.join(f"<sitemap><loc>{base_url}{path}</loc><lastmod>{lastmod}</lastmod></sitemap>" for path, lastmod in entries)
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{maps}</sitemapindex>'.encode('utf-8')
+
+
+@pytest.fixture
+def sitemap_env(pages_server, tmp_path, monkeypatch):
+    """The local site, with the URL index, changes and state files under tmp_path."""
+    base_url = f"http://127.0.0.1:{pages_server.server_port}"
+    index_path = str(tmp_path / 'url_index.sqlite')
+    monkeypatch.setattr(url_collector, 'UrlIndex', lambda: UrlIndex(index_path))
+    monkeypatch.setattr(url_collector, 'HTML_ARCHIVE_ENABLED', False)
+    monkeypatch.setattr(url_collector, 'SITEMAP_CHANGES_FILE', str(tmp_path / 'changes.json'))
+    monkeypatch.setattr(url_collector, 'SITEMAP_STATE_FILE', str(tmp_path / 'state.json'))
+
+    index = UrlIndex(index_path)
+    index.set_category(f"{base_url}/catalog/lekarstva/", ['Лекарства'], [f"{base_url}/catalog/known.html"])
+    index.close()
+
+    pages_server.pages = {
+        '/': (200, MENU.encode('utf-8'), 'text/html; charset=utf-8'),
+        '/sitemap.xml': (200, sitemap_index(
+            base_url,
+            ('/sitemap-products.xml.gz', '2026-03-10T00:00:00+00:00'),
+            ('/sitemap-archive.xml', '2025-12-01T00:00:00+00:00'),
+        ), 'application/xml'),
+        '/sitemap-products.xml.gz': (200, gzip.compress(urlset(
+            base_url,
+            ('/catalog/known.html', '2026-03-05T10:00:00+00:00'),
+            ('/catalog/new.html', '2026-03-06T10:00:00+00:00'),
+            ('/catalog/old.html', '2026-02-01T10:00:00+00:00'),
+            ('/catalog/lekarstva/', '2026-03-07T10:00:00+00:00'),
+        )), 'application/x-gzip'),
+        '/sitemap-archive.xml': (200, urlset(base_url, ('/catalog/archived.html', '2025-11-01')), 'application/xml'),
+    }
+    return pages_server, base_url, index_path, tmp_path
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_sitemap_index_with_gzip_selects_changed_products(sitemap_env):
+    server, base_url, index_path, tmp_path = sitemap_env
+    asyncio.run(collect_urls_from_sitemap(base_url, since=SINCE))
+
+    assert read_json(tmp_path / 'changes.json') == [f"{base_url}/catalog/known.html", f"{base_url}/catalog/new.html"]
+    # The index entry older than `since` is skipped as a whole
+    assert '/sitemap-archive.xml' not in server.hits
+    # Nothing but the menu and the sitemaps is downloaded
+    assert not [path for path in server.hits if path.endswith('.html')]
+    assert 'last_run' in read_json(tmp_path / 'state.json')
+
+    index = UrlIndex(index_path)
+    assert index.lookup(f"{base_url}/catalog/known.html") == [['Лекарства']]
+    assert index.lookup(f"{base_url}/catalog/new.html") == [UNCATEGORIZED_PATH]
+    index.close()
+
+
+def test_failed_sitemap_keeps_the_watermark(sitemap_env):
+    server, base_url, index_path, tmp_path = sitemap_env
+    server.pages['/sitemap.xml'] = (200, sitemap_index(
+        base_url,
+        ('/sitemap-products.xml.gz', '2026-03-10T00:00:00+00:00'),
+        ('/sitemap-missing.xml', '2026-03-10T00:00:00+00:00'),
+    ), 'application/xml')
+    state = {'last_run': SINCE.isoformat()}
+    with open(tmp_path / 'state.json', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+    asyncio.run(collect_urls_from_sitemap(base_url))
+
+    assert server.hits['/sitemap-missing.xml'] == 1
+    assert read_json(tmp_path / 'state.json') == state
+    # What could be read is still handed to Stage 2
+    assert read_json(tmp_path / 'changes.json') == [f"{base_url}/catalog/known.html", f"{base_url}/catalog/new.html"]
+
+
+def test_stage2_files_new_products_under_their_breadcrumb_category(tmp_path):
+    product_url = f"{GOSAPTEKA_URL}/catalog/nurofen.html"
+    category_url = f"{GOSAPTEKA_URL}/catalog/obezbolivayushchie/"
+    index = UrlIndex(str(tmp_path / 'url_index.sqlite'))
+    index.add_products(f"{GOSAPTEKA_URL}/catalog/lekarstva/", ['Лекарства'], [])
+    index.add_products(category_url, ['Лекарства', 'Обезболивающие'], [])
+    index.add_products(UNCATEGORIZED_URL, UNCATEGORIZED_PATH, [product_url])
+
+    async def run():
+        async with httpx.AsyncClient() as session:
+            processor = DetailsProcessor(session)
+            processor.parse_stage = ParseStage(workers=0)
+            processor.index = index
+            processor.category_paths = index.category_paths()
+            item = {'url': product_url, 'breadcrumbs': UNCATEGORIZED_PATH, 'html': read_fixture('gosapteka', 'nurofen.html')}
+            return await processor.parse_item(item)
+
+    item = asyncio.run(run())
+    assert item['breadcrumbs'] == ['Лекарства', 'Обезболивающие']
+    assert item['data']['price'] == 189.5
+    assert index.lookup(product_url) == [['Лекарства', 'Обезболивающие']]
+    index.close()
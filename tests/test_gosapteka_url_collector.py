@@ -0,0 +1,105 @@
+# tests/test_gosapteka_url_collector.py
+import asyncio
+import json
+import os
+import httpx
+import pytest
+from parsers.parse_stage import ParseStage
+from parsers.rate_control import RateController
+from parsers.gosapteka import url_collector
+from parsers.gosapteka.url_collector import REMOVED_FILE, UrlCollector, crawl_catalog
+from parsers.gosapteka.url_index import UrlIndex
+
+MENU = """<html><body><div class="menu-catalog">
+<div class="menu-catalog__item"><a class="menu-catalog__link" href="/catalog/lekarstva/">Лекарства</a></div>
+<div class="menu-catalog__item"><a class="menu-catalog__link" href="/catalog/vitaminy/">Витамины</a></div>
+</div></body></html>"""
+
+
+def category_page(slug: str, page: int, last_page: int, products: list[str]) -> bytes:
+    """A listing page with product cards and numbered pagination links."""
+    cards = ''.join(f'<a class="product-mini__title-link" href="/catalog/{p}.html">{p}</a>' for p in products)
+    pager = ''.join(f'<a href="/catalog/{slug}/?PAGEN_1={n}">{n}</a>' for n in range(1, last_page + 1))
+    if page < last_page:
+        pager += f'<a class="modern-page-next" href="/catalog/{slug}/?PAGEN_1={page + 1}">next</a>'
+    return f"<html><body>{cards}<div class='pager'>{pager}</div></body></html>".encode('utf-8')
+
+
+def html(body: bytes) -> tuple:
+    return 200, body, 'text/html; charset=utf-8'
+
+
+@pytest.fixture
+def diffs_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / 'diffs')
+    monkeypatch.setattr(url_collector, 'URL_DIFFS_DIR', path)
+    return path
+
+
+def crawl(server, index: UrlIndex) -> UrlCollector:
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    async def run():
+        async with httpx.AsyncClient() as session:
+            collector = UrlCollector(session)
+            collector.base_url = base_url
+            collector.parse_stage = ParseStage(workers=0)
+            collector.rate_controller = RateController()
+            collector.index = index
+            assert await crawl_catalog(collector)
+            return collector
+
+    return asyncio.run(run())
+
+
+def test_category_with_a_failed_middle_page_removes_nothing(pages_server, diffs_dir, tmp_path):
+    base_url = f"http://127.0.0.1:{pages_server.server_port}"
+    lekarstva, vitaminy = f"{base_url}/catalog/lekarstva/", f"{base_url}/catalog/vitaminy/"
+    index = UrlIndex(str(tmp_path / 'url_index.sqlite'))
+    # Previous run: lekarstva had six products over three pages, vitaminy two
+    old_lekarstva = [f"{base_url}/catalog/lek-{n}.html" for n in range(1, 7)]
+    index.set_category(lekarstva, ['Лекарства'], old_lekarstva)
+    index.set_category(vitaminy, ['Витамины'], [f"{base_url}/catalog/vit-1.html", f"{base_url}/catalog/vit-2.html"])
+
+    pages_server.pages = {
+        '/': html(MENU.encode('utf-8')),
+        '/catalog/lekarstva/': html(category_page('lekarstva', 1, 3, ['lek-1', 'lek-2', 'lek-7'])),
+        # Page 2 (lek-3, lek-4) fails permanently; page 3 is fine
+        '/catalog/lekarstva/?PAGEN_1=3': html(category_page('lekarstva', 3, 3, ['lek-5', 'lek-6'])),
+        # vit-2 really is gone
+        '/catalog/vitaminy/': html(category_page('vitaminy', 1, 1, ['vit-1'])),
+    }
+    collector = crawl(pages_server, index)
+
+    assert pages_server.hits['/catalog/lekarstva/?PAGEN_1=2'] == 1
+    assert collector.incomplete_categories == {lekarstva}
+    with open(os.path.join(diffs_dir, REMOVED_FILE), encoding='utf-8') as f:
+        removed = json.load(f)['removed']
+    assert removed == [f"{base_url}/catalog/vit-2.html"]
+    # No diff for the incomplete category; its old manifest is kept and the new product added
+    assert sorted(os.listdir(diffs_dir)) == [REMOVED_FILE, 'vitaminy.json']
+    manifests = index.category_manifests()
+    assert manifests[lekarstva] == set(old_lekarstva) | {f"{base_url}/catalog/lek-7.html"}
+    assert manifests[vitaminy] == {f"{base_url}/catalog/vit-1.html"}
+    index.close()
+
+
+def test_complete_category_replaces_its_manifest(pages_server, diffs_dir, tmp_path):
+    base_url = f"http://127.0.0.1:{pages_server.server_port}"
+    lekarstva = f"{base_url}/catalog/lekarstva/"
+    index = UrlIndex(str(tmp_path / 'url_index.sqlite'))
+    index.set_category(lekarstva, ['Лекарства'], [f"{base_url}/catalog/lek-1.html", f"{base_url}/catalog/lek-9.html"])
+
+    pages_server.pages = {
+        '/': html(MENU.encode('utf-8')),
+        '/catalog/lekarstva/': html(category_page('lekarstva', 1, 2, ['lek-1'])),
+        '/catalog/lekarstva/?PAGEN_1=2': html(category_page('lekarstva', 2, 2, ['lek-2'])),
+        '/catalog/vitaminy/': html(category_page('vitaminy', 1, 1, ['vit-1'])),
+    }
+    collector = crawl(pages_server, index)
+
+    assert not collector.incomplete_categories
+    with open(os.path.join(diffs_dir, REMOVED_FILE), encoding='utf-8') as f:
+        assert json.load(f)['removed'] == [f"{base_url}/catalog/lek-9.html"]
+    assert index.category_manifests()[lekarstva] == {f"{base_url}/catalog/lek-1.html", f"{base_url}/catalog/lek-2.html"}
+    index.close()
@@ -0,0 +1,138 @@
+# tests/test_planeta_http_scraper.py
+import asyncio
+import httpx
+from conftest import read_fixture
+from parsers.parse_stage import ParseStage
+from parsers.planeta_zdorovya.http_scraper import PlanetaHttpScraper, _is_complete
+from parsers.planeta_zdorovya.listing_parsing import parse_category_links, parse_listing_page
+
+BASE_URL = 'https://planetazdorovo.ru'
+
+
+class RecordedBrowser:
+    """Stands in for BrowserFallback: returns the recorded rendered page of a URL, if any."""
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.calls = []
+
+    async def fetch(self, url: str) -> str | None:
+        self.calls.append(url)
+        slug = url[len(self.base_url):].split('?')[0].strip('/').split('/')[-1]
+        page = url.split('PAGEN_1=')[1] if 'PAGEN_1=' in url else '1'
+        try:
+            return read_fixture('planeta', f"{slug}_p{page}_rendered.html")
+        except FileNotFoundError:
+            return None
+
+    async def close(self):
+        pass
+
+
+def listing(name: str) -> dict:
+    return parse_listing_page(read_fixture('planeta', name), BASE_URL)
+
+
+def scrape(server, *category_slugs: str, max_missing_prices: int | None = None):
+    """Scrapes categories from the local server; returns (results, scraper)."""
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    async def run():
+        async with httpx.AsyncClient() as session:
+            scraper = PlanetaHttpScraper(session, base_url)
+            scraper.parse_stage = ParseStage(workers=0)
+            scraper.fallback = RecordedBrowser(base_url)
+            if max_missing_prices is not None:
+                scraper.max_missing_prices = max_missing_prices
+            results = [await scraper.scrape_category(f"{base_url}/catalog/{slug}/") for slug in category_slugs]
+            return results, scraper
+
+    return asyncio.run(run())
+
+
+def test_parse_listing_page_reads_cards_and_pagination():
+    page = listing('lekarstva_p1.html')
+    assert page['has_grid']
+    assert page['last_page'] == 3
+    assert [p['title'] for p in page['products']][:2] == ['Нурофен таблетки п/о 200мг №10', 'Нурофен Форте таблетки п/о 400мг №12']
+    assert page['products'][0]['price'] == '132₽'
+    assert page['products'][0]['link'] == f"{BASE_URL}/catalog/nurofen-200-10/"
+    # The out-of-stock card has no price block
+    assert page['missing_prices'] == 1
+    assert page['products'][3]['price'] == 'N/A'
+
+
+def test_parse_listing_page_without_grid():
+    page = listing('vitaminy_p1.html')
+    assert page == {'products': [], 'last_page': 1, 'has_grid': False, 'missing_prices': 0}
+
+
+def test_parse_category_links_dedupes_and_resolves():
+    links = parse_category_links(read_fixture('planeta', 'catalog.html'), BASE_URL)
+    assert links == [f"{BASE_URL}/catalog/lekarstva/", f"{BASE_URL}/catalog/vitaminy/", f"{BASE_URL}/catalog/kosmetika/"]
+
+
+def test_is_complete_accepts_one_out_of_stock_card():
+    assert _is_complete(listing('lekarstva_p1.html'), 1, None, None)
+
+
+def test_is_complete_rejects_missing_grid_and_many_missing_prices():
+    assert not _is_complete(listing('vitaminy_p1.html'), 1, None, None)
+    assert not _is_complete(listing('prostuda_p1.html'), 1, None, None)
+    assert _is_complete(listing('prostuda_p1.html'), 1, None, None, max_missing_prices=3)
+
+
+def test_is_complete_only_lets_the_last_page_be_short():
+    short = listing('kosmetika_p2.html')
+    assert not _is_complete(short, 2, 3, 4)
+    assert _is_complete(listing('kosmetika_p3.html'), 3, 3, 4)
+
+
+def test_complete_category_never_starts_the_browser(planeta_server):
+    [products], scraper = scrape(planeta_server, 'lekarstva')
+    assert len(products) == 10
+    assert scraper.fallback.calls == []
+    assert scraper.stats == {'http': 3}
+    assert planeta_server.hits['/catalog/lekarstva/?PAGEN_1=3'] == 1
+
+
+def test_page_without_grid_is_rendered(planeta_server):
+    [products], scraper = scrape(planeta_server, 'vitaminy')
+    assert [p['title'] for p in products] == ['Компливит таблетки №30', 'Аквадетрим капли 15000МЕ/мл 10мл', 'Витрум таблетки №30']
+    assert len(scraper.fallback.calls) == 1
+    assert scraper.stats['browser'] == 1
+
+
+def test_only_the_short_page_is_rendered(planeta_server):
+    [products], scraper = scrape(planeta_server, 'kosmetika')
+    assert scraper.fallback.calls == [f"http://127.0.0.1:{planeta_server.server_port}/catalog/kosmetika/?PAGEN_1=2"]
+    assert len(products) == 10
+    assert scraper.stats == {'http': 2, 'browser': 1}
+
+
+def test_render_that_adds_nothing_confirms_the_out_of_stock_cards(planeta_server):
+    [first, again], scraper = scrape(planeta_server, 'prostuda', 'prostuda')
+    # The browser shows the same three priceless (out-of-stock) cards, so the
+    # second visit trusts the HTTP page instead of rendering it again
+    assert len(scraper.fallback.calls) == 1
+    assert scraper.stats == {'browser_unneeded': 1, 'http': 1}
+    base_url = f"http://127.0.0.1:{planeta_server.server_port}"
+    assert scraper.out_of_stock == {f"{base_url}/catalog/{slug}/" for slug in ('teraflu-10', 'coldrex-12', 'fervex-8')}
+    assert scraper.max_missing_prices == 1
+    assert first == again
+
+
+def test_out_of_stock_page_does_not_excuse_other_priceless_cards(planeta_server):
+    # Page 1 is all out of stock (the render agrees); page 2 lacks two prices
+    # that only the browser shows, so it must still be rendered
+    [products], scraper = scrape(planeta_server, 'gripp')
+    assert len(scraper.fallback.calls) == 2
+    assert scraper.stats == {'browser_unneeded': 1, 'browser': 1}
+    assert [p['price'] for p in products[4:]] == ['298₽', '745₽', '1320₽', '389₽']
+
+
+def test_unrenderable_page_keeps_the_partial_http_result(planeta_server):
+    # No rendered recording: the browser fails, so the HTTP cards are kept as they are
+    [products], scraper = scrape(planeta_server, 'aptechka')
+    assert len(products) == 4
+    assert len(scraper.fallback.calls) == 1
+    assert scraper.stats == {'partial': 1}